@@ -1,13 +1,19 @@
 """
 FastAPI Backend para Chatbot Turístico Huaraz
 """
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, Response
+from starlette.requests import HTTPConnection
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional, AsyncIterator
+from contextlib import asynccontextmanager
+import asyncio
 import json
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 
@@ -19,13 +25,57 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from main import ChatbotTouristico
+from src.utils.config import ConfigLoader
 from src.utils.helpers import Logger
+from src.utils.history_store import HistoryStore, create_history_store
+from src.utils.admission import AdmissionPolicy, AdmissionRejected
+from src.utils.sse import ReleasingStreamingResponse, until_disconnected
+from src.utils.warmup import WarmupStage
+from src.utils.tracing import configure_tracing, get_trace_store, new_request_id, trace_request
+from src.utils.ws_multiplexer import MultiplexedConnection, SlowConsumer
+from src.handlers.rag_tools import get_rag_instance
+from src.handlers.async_tools import get_tool_pool_stats
+from src.handlers.tool_cache import get_tool_cache
+from src.rag.price_scraper import get_scraper
+from src.utils.metrics import (
+    metrics,
+    SESSIONS_TOTAL,
+    MESSAGES_TOTAL,
+    ACTIVE_WEBSOCKETS,
+    LLM_TOKENS,
+    REQUEST_LATENCY
+)
+
+# Configuración del servidor
+server_config = ConfigLoader(str(Path(__file__).parent / "config")).load_server_config()
+warmup_config = server_config.get("warmup", {})
+warmup = WarmupStage()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Precargar componentes al iniciar y vaciar el historial al apagar"""
+    warmup_task = None
+    if warmup_config.get("enabled", True):
+        # En segundo plano: /health responde mientras /ready sigue en 503
+        warmup_task = asyncio.create_task(warmup.run())
+    else:
+        warmup.finished = True
+
+    yield
+
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    # Vaciar escrituras pendientes del historial
+    await run_in_threadpool(manager.history_store.close)
+
 
 # Inicializar FastAPI
 app = FastAPI(
     title="Chatbot Turístico Huaraz",
     description="Asistente virtual para turismo en Huaraz, Perú",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS
@@ -44,59 +94,164 @@ app.mount("/static", StaticFiles(directory=str(static_path)), name="static")
 
 # Inicializar chatbot global
 chatbot_instance = None
+# Una sola construcción aunque la pidan a la vez la precarga y varias peticiones
+_chatbot_lock = threading.Lock()
 
 def get_chatbot():
-    """Obtener instancia del chatbot"""
+    """Obtener instancia del chatbot (síncrono: puede construirlo, no llamar desde el event loop)"""
     global chatbot_instance
-    if chatbot_instance is None:
-        try:
-            chatbot_instance = ChatbotTouristico(llm_provider="openai")
-            Logger.info("Chatbot inicializado correctamente")
-        except Exception as e:
-            Logger.error(f"Error al inicializar chatbot: {e}")
-            raise HTTPException(status_code=500, detail=f"Error al inicializar chatbot: {str(e)}")
+    with _chatbot_lock:
+        if chatbot_instance is None:
+            try:
+                chatbot_instance = ChatbotTouristico(llm_provider="openai")
+                Logger.info("Chatbot inicializado correctamente")
+            except Exception as e:
+                Logger.error(f"Error al inicializar chatbot: {e}")
+                raise HTTPException(status_code=500, detail=f"Error al inicializar chatbot: {str(e)}")
     return chatbot_instance
 
 
+async def aget_chatbot() -> ChatbotTouristico:
+    """Obtener instancia del chatbot sin bloquear el event loop mientras se construye"""
+    if chatbot_instance is not None:
+        return chatbot_instance
+    return await run_in_threadpool(get_chatbot)
+
+
+def warm_chatbot() -> str:
+    """Crear el chatbot, resolver los embeddings de su caché y, si se configura, validar el cliente LLM"""
+    chatbot = get_chatbot()
+    if chatbot.agent.answer_cache is not None:
+        chatbot.agent.answer_cache.warm()
+    if warmup_config.get("ping_llm", False):
+        # Llamada mínima: valida la API key y abre la conexión HTTP
+        chatbot.llm.bind(max_tokens=1).invoke("ping")
+    return f"modelo {getattr(chatbot.llm, 'model_name', 'desconocido')}"
+
+
+def warm_rag() -> str:
+    """Cargar el índice FAISS"""
+    rag = get_rag_instance()
+    if rag.vector_store is None:
+        raise RuntimeError("Índice FAISS no disponible")
+    return f"{rag.vector_store.index.ntotal} vectores"
+
+
+def warm_tours() -> str:
+    """Cargar la caché de tours"""
+    scraper = get_scraper()
+    if not scraper.tours:
+        raise RuntimeError("Caché de tours vacía")
+    return f"{len(scraper.tours)} tours"
+
+
+_required = set(warmup_config.get("required", ["chatbot"]))
+warmup.add("chatbot", warm_chatbot, required="chatbot" in _required)
+warmup.add("rag", warm_rag, required="rag" in _required)
+warmup.add("tours", warm_tours, required="tours" in _required)
+
+
 # Modelos Pydantic
 class ChatMessage(BaseModel):
     message: str
     session_id: Optional[str] = "default"
 
 
+# Marcas del resultado del agente que /chat informa en `flags`
+TURN_FLAGS = ("routed", "cached", "coalesced", "timed_out")
+
+
 class ChatResponse(BaseModel):
     response: str
     timestamp: str
     session_id: str
+    request_id: Optional[str] = None
+    # False si el agente falló (`response` trae entonces el mensaje de disculpa)
+    success: bool = True
+    usage: Optional[Dict] = None
+    tool_calls: List[str] = []
+    # Cómo se resolvió el turno: routed (herramienta), cached, coalesced, timed_out
+    flags: Dict[str, Any] = {}
 
 
 # Almacenar conexiones WebSocket activas
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, history_store: HistoryStore):
         self.active_connections: List[WebSocket] = []
-        self.conversation_history: Dict[str, List[Dict]] = {}
+        # Historial acotado en RAM con desbordamiento a disco
+        self.history_store = history_store
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         self.active_connections.append(websocket)
+        ACTIVE_WEBSOCKETS.inc()
 
     def disconnect(self, websocket: WebSocket):
         self.active_connections.remove(websocket)
+        ACTIVE_WEBSOCKETS.dec()
 
     async def send_message(self, message: str, websocket: WebSocket):
         await websocket.send_text(message)
 
     def add_to_history(self, session_id: str, role: str, content: str):
-        if session_id not in self.conversation_history:
-            self.conversation_history[session_id] = []
-        self.conversation_history[session_id].append({
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now().isoformat()
-        })
+        self.history_store.add(session_id, role, content)
+        MESSAGES_TOTAL.inc(role=role)
+    
+    def get_history(self, session_id: str) -> List[Dict]:
+        return self.history_store.get(session_id)
+    
+    def clear_history(self, session_id: str):
+        self.history_store.clear(session_id)
+
+
+manager = ConnectionManager(create_history_store(server_config.get("history")))
+
+# Límites por sesión, por IP y de ejecuciones simultáneas del agente
+admission_config = server_config.get("admission", {})
+admission = AdmissionPolicy(admission_config)
 
 
-manager = ConnectionManager()
+# Protocolo WebSocket multiplexado
+websocket_config = server_config.get("websocket", {})
+
+# Streaming SSE (/chat/stream)
+sse_config = server_config.get("sse", {})
+
+# Trazas por petición
+tracing_config = server_config.get("tracing", {})
+configure_tracing(
+    enabled=tracing_config.get("enabled", True),
+    max_traces=tracing_config.get("max_traces", 200)
+)
+
+
+def get_client_ip(connection: HTTPConnection) -> Optional[str]:
+    """Obtener la IP del cliente (opcionalmente desde X-Forwarded-For)"""
+    if admission_config.get("trust_forwarded_for", False):
+        forwarded = connection.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return connection.client.host if connection.client else None
+
+
+def busy_response(error: AdmissionRejected) -> HTTPException:
+    """Respuesta 429 para peticiones sin capacidad"""
+    return HTTPException(
+        status_code=429,
+        detail="El asistente está ocupado, por favor intenta de nuevo en unos segundos.",
+        headers={"Retry-After": error.retry_after_header}
+    )
+
+
+def busy_frame(error: AdmissionRejected) -> Dict:
+    """Mensaje WebSocket para peticiones sin capacidad"""
+    return {
+        "type": "busy",
+        "content": "El asistente está ocupado, por favor intenta de nuevo en unos segundos.",
+        "reason": error.reason,
+        "retry_after": float(error.retry_after_header),
+        "timestamp": datetime.now().isoformat()
+    }
 
 
 # Endpoints
@@ -123,18 +278,39 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "chatbot_initialized": chatbot_instance is not None
+        "chatbot_initialized": chatbot_instance is not None,
+        "active_sessions": len(chatbot_instance.sessions) if chatbot_instance else 0
+    }
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Verificar si la precarga terminó (503 mientras no esté listo)"""
+    body = {
+        "status": "ready" if warmup.ready else ("warming_up" if not warmup.finished else "degraded"),
+        "timestamp": datetime.now().isoformat(),
+        "components": warmup.report
     }
+    return JSONResponse(body, status_code=200 if warmup.ready else 503)
 
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat(message: ChatMessage):
+async def chat(message: ChatMessage, request: Request, http_response: Response):
     """
-    Endpoint para enviar mensajes al chatbot
+    Endpoint para enviar mensajes al chatbot.
+    
+    Acepta un `X-Request-ID` propio; la traza de la consulta se obtiene con
+    GET /traces/{request_id}.
     """
+    request_id = request.headers.get("x-request-id") or new_request_id()
+    http_response.headers["X-Request-ID"] = request_id
     try:
-        chatbot = get_chatbot()
-        response = chatbot.process_query(message.message)
+        chatbot = await aget_chatbot()
+        with REQUEST_LATENCY.time(endpoint="/chat"):
+            async with admission.admit(message.session_id, get_client_ip(request)):
+                with trace_request(request_id, endpoint="/chat", session_id=message.session_id):
+                    result = await chatbot.arun_query(message.message, session_id=message.session_id)
+        response = result["response"]
         
         # Guardar en historial
         manager.add_to_history(message.session_id, "user", message.message)
@@ -143,95 +319,286 @@ async def chat(message: ChatMessage):
         return ChatResponse(
             response=response,
             timestamp=datetime.now().isoformat(),
-            session_id=message.session_id
+            session_id=message.session_id,
+            request_id=request_id,
+            success=result.get("success", False),
+            usage=result.get("usage"),
+            tool_calls=result.get("tool_calls", []),
+            flags={flag: result[flag] for flag in TURN_FLAGS if result.get(flag)}
         )
+    except AdmissionRejected as e:
+        raise busy_response(e)
     except Exception as e:
         Logger.error(f"Error en /chat: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def format_sse(event: str, data: Dict) -> str:
+    """Formatear un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(message: ChatMessage, request: Request):
+    """
+    Endpoint SSE para recibir la respuesta en streaming por HTTP.
+    
+    Emite eventos `token`, `tool_start` y `tool_end` a medida que el agente
+    avanza, y un evento final `done` con la respuesta, el tiempo y el uso de
+    tokens. Si el cliente se desconecta, la ejecución del agente se cancela
+    (la desconexión se comprueba también mientras no hay eventos).
+    """
+    chatbot = await aget_chatbot()
+    
+    # El turno se ocupa antes de responder para poder devolver 429; desde
+    # aquí se libera al terminar la respuesta, aunque el stream nunca se itere
+    try:
+        await admission.acquire(message.session_id, get_client_ip(request))
+    except AdmissionRejected as e:
+        raise busy_response(e)
+    
+    try:
+        request_id = request.headers.get("x-request-id") or new_request_id()
+        return ReleasingStreamingResponse(
+            sse_event_stream(chatbot, message, request, request_id),
+            on_close=admission.controller.release,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Request-ID": request_id}
+        )
+    except BaseException:
+        admission.controller.release()
+        raise
+
+
+async def sse_event_stream(
+    chatbot: ChatbotTouristico,
+    message: ChatMessage,
+    request: Request,
+    request_id: str
+) -> AsyncIterator[str]:
+    """Eventos SSE de una consulta de /chat/stream"""
+    start = time.perf_counter()
+    first_token_ms = None
+    completed = False
+    
+    with trace_request(request_id, endpoint="/chat/stream", session_id=message.session_id):
+        # Cerrar el stream cancela el agente si el cliente se fue a mitad
+        events = until_disconnected(
+            chatbot.astream_query(message.message, session_id=message.session_id),
+            request.is_disconnected,
+            sse_config.get("disconnect_poll_interval", 0.5)
+        )
+        try:
+            async for event in events:
+                if event["type"] == "token" and first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - start) * 1000, 1)
+                
+                if event["type"] != "final":
+                    yield format_sse(event["type"], event)
+                    continue
+                
+                completed = True
+                response = event["response"]
+                # Como en /chat: el historial solo guarda intercambios completos
+                manager.add_to_history(message.session_id, "user", message.message)
+                manager.add_to_history(message.session_id, "assistant", response)
+                yield format_sse("done", {
+                    "type": "done",
+                    "success": event["success"],
+                    "response": response,
+                    "session_id": message.session_id,
+                    "timestamp": datetime.now().isoformat(),
+                    "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+                    "first_token_ms": first_token_ms,
+                    "usage": event.get("usage", {}),
+                    "request_id": request_id
+                })
+                REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint="/chat/stream")
+        finally:
+            await events.aclose()
+    
+    if not completed:
+        Logger.info(f"Cliente SSE desconectado: {message.session_id}")
+
+
 @app.get("/history/{session_id}")
 async def get_history(session_id: str):
     """Obtener historial de conversación"""
+    # La lectura puede tocar SQLite: se hace fuera del event loop
+    history = await run_in_threadpool(manager.get_history, session_id)
     return {
         "session_id": session_id,
-        "history": manager.conversation_history.get(session_id, [])
+        "history": history
     }
 
 
 @app.delete("/history/{session_id}")
 async def clear_history(session_id: str):
     """Limpiar historial de conversación"""
-    if session_id in manager.conversation_history:
-        manager.conversation_history[session_id] = []
+    manager.clear_history(session_id)
+    if chatbot_instance is not None:
+        chatbot_instance.clear_session(session_id)
     return {"message": "Historial limpiado", "session_id": session_id}
 
 
+async def run_ws_request(
+    conn: MultiplexedConnection,
+    chatbot: ChatbotTouristico,
+    session_id: str,
+    request_id: str,
+    user_message: str,
+    client_ip: Optional[str]
+):
+    """
+    Ejecutar una petición del WebSocket enviando sus frames con `id`.
+    
+    Se ejecuta como tarea independiente: si se cancela (frame `cancel` o
+    desconexión), la ejecución del agente se corta y el turno se descarta.
+    """
+    # Control de admisión: avisar "busy" en lugar de encolar sin límite
+    try:
+        await admission.acquire(session_id, client_ip)
+    except AdmissionRejected as e:
+        await conn.send({**busy_frame(e), "id": request_id})
+        return
+    
+    # Los id de petición solo son únicos por conexión: la traza usa uno global
+    trace_id = new_request_id()
+    try:
+        Logger.info(f"📩 Mensaje recibido de {session_id} [{request_id}]: {user_message[:50]}...")
+        
+        # Procesar con el chatbot, enviando tokens y progreso de herramientas
+        start = time.perf_counter()
+        response = ""
+        with trace_request(trace_id, endpoint="/ws", session_id=session_id, ws_id=request_id):
+            async for event in chatbot.astream_query(user_message, session_id=session_id):
+                if event["type"] == "final":
+                    response = event["response"]
+                else:
+                    await conn.send({**event, "id": request_id})
+        Logger.info(f"✅ Respuesta generada: {response[:100]}...")
+        
+        # Guardar el intercambio solo si la petición llegó al final
+        manager.add_to_history(session_id, "user", user_message)
+        manager.add_to_history(session_id, "assistant", response)
+        
+        # Enviar respuesta completa (cierra el mensaje en streaming)
+        await conn.send({
+            "type": "bot",
+            "id": request_id,
+            "content": response,
+            "trace_id": trace_id,
+            "timestamp": datetime.now().isoformat()
+        })
+        REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint="/ws")
+    
+    except asyncio.CancelledError:
+        Logger.info(f"🛑 Petición cancelada: {session_id} [{request_id}]")
+        if not conn.closed:
+            await conn.send({"type": "cancelled", "id": request_id})
+        raise
+    
+    except SlowConsumer as e:
+        Logger.warning(f"Cliente WebSocket lento ({e}), cerrando: {session_id}")
+        await conn.abort()
+    
+    except Exception as e:
+        Logger.error(f"❌ Error en WebSocket: {str(e)}")
+        await conn.send({
+            "type": "error",
+            "id": request_id,
+            "content": f"Error al procesar tu mensaje: {str(e)}",
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    finally:
+        admission.controller.release()
+
+
 @app.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
     """
-    WebSocket para chat en tiempo real
+    WebSocket para chat en tiempo real (protocolo multiplexado).
+    
+    Frames del cliente:
+        - {"type": "chat", "id": str, "message": str}: nueva petición
+          (`type` e `id` son opcionales; sin `id` el servidor asigna uno)
+        - {"type": "cancel", "id": str}: cancelar una petición en curso
+    
+    Todos los frames de respuesta (token, tool_start, tool_end, bot, error,
+    busy, cancelled) incluyen el `id` de la petición a la que pertenecen.
     """
     await manager.connect(websocket)
-    chatbot = get_chatbot()
+    chatbot = await aget_chatbot()
+    client_ip = get_client_ip(websocket)
+    conn = MultiplexedConnection(
+        websocket,
+        max_inflight=websocket_config.get("max_inflight_per_connection", 4),
+        send_queue_size=websocket_config.get("send_queue_size", 256),
+        send_timeout=websocket_config.get("send_timeout", 5.0)
+    )
+    conn.start()
     
     try:
         # Mensaje de bienvenida
-        welcome_message = {
+        await conn.send({
             "type": "system",
             "content": "¡Bienvenido al Chatbot Turístico de Huaraz! 🏔️ ¿En qué puedo ayudarte?",
             "timestamp": datetime.now().isoformat()
-        }
-        await manager.send_message(json.dumps(welcome_message), websocket)
+        })
         
         while True:
-            # Recibir mensaje del cliente
+            # Recibir frame del cliente
             data = await websocket.receive_text()
-            message_data = json.loads(data)
-            user_message = message_data.get("message", "")
+            try:
+                message_data = json.loads(data)
+            except json.JSONDecodeError:
+                await conn.send({"type": "error", "content": "Frame inválido: se esperaba JSON"})
+                continue
             
-            if not user_message:
+            frame_type = message_data.get("type", "chat")
+            request_id = str(message_data.get("id") or conn.next_id())
+            
+            if frame_type == "cancel":
+                if not conn.cancel(request_id):
+                    await conn.send({"type": "error", "id": request_id, "content": "No hay una petición en curso con ese id"})
                 continue
             
-            # Guardar mensaje del usuario
-            manager.add_to_history(session_id, "user", user_message)
-            Logger.info(f"📩 Mensaje recibido de {session_id}: {user_message[:50]}...")
+            user_message = message_data.get("message", "")
+            if not user_message:
+                continue
             
-            # Procesar con el chatbot
-            try:
-                Logger.info("🤖 Procesando con el chatbot...")
-                response = chatbot.process_query(user_message)
-                Logger.info(f"✅ Respuesta generada: {response[:100]}...")
-                
-                manager.add_to_history(session_id, "assistant", response)
-                
-                # Enviar respuesta
-                response_message = {
-                    "type": "bot",
-                    "content": response,
+            work = run_ws_request(conn, chatbot, session_id, request_id, user_message, client_ip)
+            if not conn.submit(request_id, work):
+                await conn.send({
+                    "type": "busy",
+                    "id": request_id,
+                    "content": f"Hay demasiadas consultas en curso en esta conexión (máximo {conn.max_inflight}).",
+                    "reason": "connection_inflight",
                     "timestamp": datetime.now().isoformat()
-                }
-                await manager.send_message(json.dumps(response_message), websocket)
-                Logger.info("📤 Respuesta enviada al cliente")
-                
-            except Exception as e:
-                Logger.error(f"❌ Error en WebSocket: {str(e)}")
-                import traceback
-                Logger.error(f"Traceback: {traceback.format_exc()}")
-                
-                error_message = {
-                    "type": "error",
-                    "content": f"Error al procesar tu mensaje: {str(e)}",
-                    "timestamp": datetime.now().isoformat()
-                }
-                await manager.send_message(json.dumps(error_message), websocket)
-                
+                })
+    
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
         Logger.info(f"WebSocket desconectado: {session_id}")
+    except SlowConsumer as e:
+        Logger.warning(f"Cliente WebSocket lento ({e}), cerrando: {session_id}")
+        await conn.abort()
     except Exception as e:
         Logger.error(f"Error en WebSocket: {str(e)}")
+    finally:
+        # Cancela las ejecuciones en curso: no se pagan tokens que nadie leerá
+        cancelled = conn.close()
         manager.disconnect(websocket)
+        if cancelled:
+            Logger.info(f"🛑 {cancelled} peticiones canceladas al desconectar: {session_id}")
+
+
+@app.get("/sessions")
+async def get_sessions(top: int = 20):
+    """Obtener estado del registro de sesiones y memoria por sesión"""
+    if chatbot_instance is None:
+        return {"active_sessions": 0, "sessions": []}
+    return chatbot_instance.sessions.get_stats(top=top)
 
 
 @app.get("/attractions")
@@ -257,20 +624,95 @@ async def get_attractions():
     }
 
 
+def prompt_cache_stats():
+    """Aciertos de la caché de prompts del proveedor (prefijo fijo del agente)"""
+    if not chatbot_instance:
+        return None
+    agent = chatbot_instance.agent
+    input_tokens = LLM_TOKENS.value(type="input")
+    cached_tokens = LLM_TOKENS.value(type="cached")
+    return {
+        **agent.prompt_layout.get_stats(),
+        "prefix_tokens": agent.prompt_layout.prefix_tokens(agent.token_counter),
+        "input_tokens": int(input_tokens),
+        "cached_tokens": int(cached_tokens),
+        "hit_rate": round(cached_tokens / input_tokens, 3) if input_tokens else 0.0
+    }
+
+
 @app.get("/stats")
 async def get_stats():
-    """Obtener estadísticas de uso"""
-    total_conversations = len(manager.conversation_history)
-    total_messages = sum(len(msgs) for msgs in manager.conversation_history.values())
-    
+    """Obtener estadísticas de uso (contadores incrementales, O(1))"""
     return {
-        "total_conversations": total_conversations,
-        "total_messages": total_messages,
-        "active_connections": len(manager.active_connections),
+        "total_conversations": int(SESSIONS_TOTAL.total()),
+        "total_messages": int(MESSAGES_TOTAL.total()),
+        "active_connections": int(ACTIVE_WEBSOCKETS.total()),
+        "single_flight": chatbot_instance.agent.single_flight.get_stats() if chatbot_instance else None,
+        "answer_cache": (
+            chatbot_instance.agent.answer_cache.get_stats()
+            if chatbot_instance and chatbot_instance.agent.answer_cache else None
+        ),
+        "token_counter": chatbot_instance.agent.token_counter.get_stats() if chatbot_instance else None,
+        "prompt_cache": prompt_cache_stats(),
+        "tool_cache": get_tool_cache().get_stats(),
+        "tool_pool": get_tool_pool_stats(),
+        "memory_summary": (
+            chatbot_instance.agent.summarizer.get_stats()
+            if chatbot_instance and chatbot_instance.agent.summarizer else None
+        ),
+        "checkpointer": (
+            chatbot_instance.agent.checkpointer.get_stats()
+            if chatbot_instance and chatbot_instance.agent.checkpointer else None
+        ),
+        "tool_selection": (
+            chatbot_instance.agent.tool_selector.get_stats()
+            if chatbot_instance and chatbot_instance.agent.tool_selector else None
+        ),
+        "router": (
+            chatbot_instance.agent.router.get_stats()
+            if chatbot_instance and chatbot_instance.agent.router else None
+        ),
+        "tool_prefetch": (
+            chatbot_instance.agent.prefetcher.get_stats()
+            if chatbot_instance and chatbot_instance.agent.prefetcher else None
+        ),
+        "tracing": get_trace_store().get_stats(),
         "timestamp": datetime.now().isoformat()
     }
 
 
+@app.get("/traces")
+async def list_traces(limit: int = 50):
+    """Resumen de las trazas más recientes (duración y tiempo por categoría)"""
+    return {"traces": get_trace_store().recent(limit)}
+
+
+@app.get("/traces/{request_id}")
+async def get_trace(request_id: str, format: str = "chrome"):
+    """
+    Traza de una petición.
+    
+    `format=chrome` (por defecto) devuelve el JSON de Chrome trace para
+    abrir en chrome://tracing o https://ui.perfetto.dev; `format=summary`
+    solo el resumen.
+    """
+    trace = get_trace_store().get(request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Traza no encontrada (expiró o no existe)")
+    if format == "summary":
+        return trace.summary()
+    return JSONResponse(
+        trace.to_chrome(),
+        headers={"Content-Disposition": f'attachment; filename="trace-{request_id}.json"'}
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
     
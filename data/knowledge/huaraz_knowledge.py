@@ -23,6 +23,9 @@ class Attraction:
 class HuarazKnowledgeBase:
     """Base de conocimiento sobre Huaraz"""
     
+    # Revisión de los datos: incrementar al editarlos (invalida la caché de herramientas)
+    REVISION = 1
+    
     ATTRACTIONS = {
         "laguna_paron": Attraction(
             name="Laguna Parón",
@@ -1,8 +1,12 @@
 """
 Aplicación Principal del Chatbot Turístico
 """
+import argparse
+import asyncio
+import json
 import sys
 from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional
 
 # Cargar variables de entorno
 from dotenv import load_dotenv
@@ -14,6 +18,18 @@ sys.path.insert(0, str(project_root))
 
 from src.llm.base import LLMFactory
 from src.agents.touristic_agent import TouristicAgent, AgentBuilder
+from src.agents.memory import SessionMemory
+from src.agents.session_registry import SessionRegistry
+from src.agents.summary_memory import ConversationSummarizer
+from src.agents.checkpointing import configure_checkpointer
+from src.agents.intent_router import IntentRouter, query_entities
+from src.agents.tool_prefetch import ToolPrefetcher
+from src.handlers.async_tools import configure_tool_timeouts, get_tool_executor
+from src.handlers.tool_cache import configure_tool_cache
+from src.handlers.tool_output import configure_tool_output
+from src.handlers.rag_tools import get_rag_instance
+from src.rag.semantic_cache import SemanticCache
+from src.utils.batch_runner import BatchRunner, ServerClient, read_batch
 from src.utils.helpers import Logger, UserPreferences, EnvironmentConfig
 from src.utils.config import ConfigLoader
 
@@ -41,13 +57,92 @@ class ChatbotTouristico:
         
         self.llm = LLMFactory.get_model(
             llm_provider,
+            timeout=self.model_config.get("api_timeout", 30),
+            max_retries=self.model_config.get("max_retries", 2),
             **{k: v for k, v in model_settings.items() if k != "provider"}
         )
         
+        # Pool acotado para herramientas síncronas en el camino asíncrono
+        get_tool_executor(self.agent_config.get("agent", {}).get("tool_workers", 8))
+        tool_cache_config = self.agent_config.get("tool_cache", {})
+        configure_tool_cache(
+            enabled=tool_cache_config.get("enabled", True),
+            max_entries=tool_cache_config.get("max_entries", 2048)
+        )
+        configure_tool_timeouts(
+            self.agent_config.get("agent", {}).get("tool_timeout", 20),
+            self.agent_config.get("agent", {}).get("tool_timeouts", {})
+        )
+        configure_tool_output(
+            self.agent_config.get("agent", {}).get("tool_output_tokens", 600),
+            self.agent_config.get("agent", {}).get("tool_output_budgets", {})
+        )
+        
+        # Estado por sesión del grafo compilado (compartido por el proceso)
+        checkpointer_config = self.agent_config.get("checkpointer", {})
+        configure_checkpointer(
+            backend=checkpointer_config.get("backend", "memory"),
+            path=str(project_root / checkpointer_config.get("path", "data/checkpoints.sqlite"))
+        )
+        
         # Crear agente
         self.agent = AgentBuilder.create_agent(
             self.llm,
-            max_iterations=self.agent_config.get("agent", {}).get("max_iterations", 10)
+            max_iterations=self.agent_config.get("agent", {}).get("max_iterations", 10),
+            max_execution_time=self.agent_config.get("agent", {}).get("max_execution_time", 60),
+            max_history_tokens=self.agent_config.get("memory", {}).get("max_history_tokens", 2000),
+            select_tools=self.agent_config.get("agent", {}).get("tool_selection", True),
+            max_history=self.agent_config.get("memory", {}).get("max_history", 20)
+        )
+        
+        # Caché semántica de respuestas con los embeddings del sistema RAG
+        cache_config = self.agent_config.get("answer_cache", {})
+        if cache_config.get("enabled", True):
+            self.agent.answer_cache = SemanticCache(
+                lambda: get_rag_instance().embeddings,
+                similarity_threshold=cache_config.get("similarity_threshold", 0.92),
+                ttl=cache_config.get("ttl_seconds", 900),
+                max_entries=cache_config.get("max_entries", 1000),
+                # Consultas similares sobre otro tour, lugar o cantidad no comparten respuesta
+                entity_extractor=query_entities
+            )
+        
+        # Memoria con resumen incremental de los turnos antiguos
+        memory_config = self.agent_config.get("memory", {})
+        if memory_config.get("type") == "summary":
+            self.agent.summarizer = ConversationSummarizer(
+                self.llm,
+                threshold=memory_config.get("summary_threshold", 15),
+                keep_recent_turns=memory_config.get("keep_recent_turns", 3)
+            )
+        
+        # Respuesta local de consultas simples (precio, clima, altitud...)
+        router_config = self.agent_config.get("router", {})
+        if router_config.get("enabled", True):
+            rewrite_llm = None
+            if router_config.get("rewrite_model"):
+                rewrite_llm = LLMFactory.get_model(
+                    llm_provider,
+                    timeout=self.model_config.get("api_timeout", 30),
+                    max_retries=self.model_config.get("max_retries", 2),
+                    **{
+                        **{k: v for k, v in model_settings.items() if k != "provider"},
+                        "model_name": router_config["rewrite_model"]
+                    }
+                )
+            self.agent.router = IntentRouter(self.agent.tools, rewrite_llm=rewrite_llm)
+        
+        # Herramientas adelantadas en paralelo con la primera llamada al modelo
+        if self.agent_config.get("agent", {}).get("tool_prefetch", True):
+            self.agent.prefetcher = ToolPrefetcher(self.agent.tools)
+        
+        # Memoria por sesión sobre el mismo agente (grafo y cliente LLM compartidos)
+        sessions_config = self.agent_config.get("sessions", {})
+        self.sessions = SessionRegistry(
+            max_sessions=sessions_config.get("max_sessions", 1000),
+            idle_ttl=sessions_config.get("idle_ttl_seconds", 1800),
+            memory_k=self.agent.memory_k,
+            on_release=self.agent.release_thread
         )
         
         # Preferencias del usuario
@@ -147,40 +242,228 @@ class ChatbotTouristico:
         
         print()
     
-    def process_query(self, user_input: str) -> str:
+    def process_query(self, user_input: str, session_id: Optional[str] = None) -> str:
         """
         Procesar una consulta sin interfaz interactiva.
         
         Args:
             user_input: Pregunta del usuario
+            session_id: Sesión a la que pertenece la consulta (None = memoria del agente)
         
         Returns:
             Respuesta del agente
         """
         try:
             Logger.info(f"🔍 Procesando query: {user_input[:100]}...")
-            response = self.agent.process_query(user_input)
-            
-            if response["success"]:
-                Logger.info("✅ Query procesada exitosamente")
-                return response["response"]
-            else:
-                Logger.warning(f"⚠️ Query procesada con advertencia: {response.get('response', 'Error')}")
-                return response.get("response", "Lo siento, no pude procesar tu consulta.")
+            response = self.agent.process_query(user_input, self._get_memory(session_id))
+            return self._handle_response(response)
+        except Exception as e:
+            return self._handle_error(e)
+    
+    async def aprocess_query(self, user_input: str, session_id: Optional[str] = None) -> str:
+        """
+        Procesar una consulta de forma asíncrona (para el servidor web).
+        
+        Args:
+            user_input: Pregunta del usuario
+            session_id: Sesión a la que pertenece la consulta (None = memoria del agente)
+        
+        Returns:
+            Respuesta del agente
+        """
+        return (await self.arun_query(user_input, session_id))["response"]
+    
+    async def arun_query(self, user_input: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Procesar una consulta de forma asíncrona conservando el resultado completo.
+        
+        Args:
+            user_input: Pregunta del usuario
+            session_id: Sesión a la que pertenece la consulta (None = memoria del agente)
+        
+        Returns:
+            Resultado del agente (`success`, `response` para el usuario, `usage`,
+            `tool_calls` y las marcas del turno); ante un error, `success` es
+            False y `response` trae el mensaje de disculpa
+        """
+        try:
+            Logger.info(f"🔍 Procesando query (async): {user_input[:100]}...")
+            result = await self.agent.aprocess_query(user_input, self._get_memory(session_id))
+            return {**result, "response": self._handle_response(result)}
         except Exception as e:
-            Logger.error(f"❌ Error en process_query: {str(e)}")
-            import traceback
-            Logger.error(traceback.format_exc())
-            return f"Lo siento, ocurrió un error al procesar tu consulta: {str(e)}"
+            return {"success": False, "error": str(e), "response": self._handle_error(e)}
+    
+    async def astream_query(self, user_input: str, session_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Procesar una consulta emitiendo tokens y eventos de herramientas.
+        
+        Args:
+            user_input: Pregunta del usuario
+            session_id: Sesión a la que pertenece la consulta (None = memoria del agente)
+        
+        Yields:
+            Eventos de `TouristicAgent.astream_query`; el último es de tipo "final"
+        """
+        Logger.info(f"🔍 Procesando query (stream): {user_input[:100]}...")
+        async for event in self.agent.astream_query(user_input, self._get_memory(session_id)):
+            if event["type"] == "final":
+                if event["success"]:
+                    Logger.info("✅ Query procesada exitosamente")
+                else:
+                    Logger.error(f"❌ Error en astream_query: {event.get('error', 'Error desconocido')}")
+            yield event
+    
+    async def arun_batch(
+        self,
+        input_path: str,
+        output_path: str,
+        concurrency: Optional[int] = None,
+        rate_limit: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Procesar un archivo JSONL de consultas sin interfaz interactiva.
+        
+        Args:
+            input_path: Consultas, una por línea ({"query", "session_id"?, "id"?})
+            output_path: Archivo JSONL de resultados por consulta
+            concurrency: Conversaciones simultáneas (por defecto batch.concurrency)
+            rate_limit: Consultas por segundo (por defecto batch.rate_limit)
+        
+        Returns:
+            Resumen de la corrida
+        """
+        batch_config = self.agent_config.get("batch", {})
+        queries = read_batch(input_path)
+        Logger.info(f"📦 Procesando lote de {len(queries)} consultas: {input_path}")
+        runner = BatchRunner(
+            self._abatch_query,
+            concurrency=concurrency or batch_config.get("concurrency", 4),
+            rate_limit=rate_limit if rate_limit is not None else batch_config.get("rate_limit"),
+            # El guion terminó: liberar su memoria y su hilo del checkpointer
+            end_session=self.clear_session
+        )
+        summary = await runner.run(queries, output_path)
+        # Los hilos de los guiones terminados se borran en segundo plano
+        await self.agent.wait_released()
+        return summary
+    
+    async def _abatch_query(self, user_input: str, session_id: Optional[str]) -> Dict[str, Any]:
+        """Ejecutar una consulta de lote (sin sesión: memoria propia y desechable)"""
+        if session_id is not None:
+            return await self.agent.aprocess_query(user_input, self._get_memory(session_id))
+        memory = SessionMemory(self.agent.memory_k)
+        try:
+            return await self.agent.aprocess_query(user_input, memory)
+        finally:
+            await self.agent.arelease_thread(memory)
+    
+    def _get_memory(self, session_id: Optional[str]) -> Optional[SessionMemory]:
+        """Obtener la memoria de una sesión del registro"""
+        if session_id is None:
+            return None
+        return self.sessions.get(session_id)
+    
+    def clear_session(self, session_id: str) -> bool:
+        """Eliminar la memoria de una sesión"""
+        return self.sessions.remove(session_id)
+    
+    @staticmethod
+    def _handle_response(response: dict) -> str:
+        """Convertir el resultado del agente en texto para el usuario"""
+        if response["success"]:
+            Logger.info("✅ Query procesada exitosamente")
+            return response["response"]
+        else:
+            Logger.warning(f"⚠️ Query procesada con advertencia: {response.get('response', 'Error')}")
+            return response.get("response", "Lo siento, no pude procesar tu consulta.")
+    
+    @staticmethod
+    def _handle_error(error: Exception) -> str:
+        """Registrar un error inesperado y devolver un mensaje amigable"""
+        Logger.error(f"❌ Error en process_query: {str(error)}")
+        import traceback
+        Logger.error(traceback.format_exc())
+        return f"Lo siento, ocurrió un error al procesar tu consulta: {str(error)}"
+
+
+async def arun_server_batch(
+    server_url: str,
+    input_path: str,
+    output_path: str,
+    concurrency: Optional[int] = None,
+    rate_limit: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Procesar un archivo JSONL de consultas en el servidor web en marcha.
+    
+    A diferencia de `ChatbotTouristico.arun_batch`, las respuestas quedan en
+    las cachés del servidor (respuestas de primer turno y resultados de
+    herramientas), que así se precalienta.
+    
+    Args:
+        server_url: URL del servidor (p. ej. http://localhost:8000)
+        input_path: Consultas, una por línea ({"query", "session_id"?, "id"?})
+        output_path: Archivo JSONL de resultados por consulta
+        concurrency: Conversaciones simultáneas (por defecto batch.concurrency)
+        rate_limit: Consultas por segundo (por defecto batch.rate_limit)
+    
+    Returns:
+        Resumen de la corrida
+    """
+    batch_config = ConfigLoader(str(project_root / "config")).load_agent_config().get("batch", {})
+    queries = read_batch(input_path)
+    Logger.info(f"📦 Enviando lote de {len(queries)} consultas a {server_url}: {input_path}")
+    client = ServerClient(server_url, timeout=batch_config.get("http_timeout", 120.0))
+    try:
+        runner = BatchRunner(
+            client,
+            concurrency=concurrency or batch_config.get("concurrency", 4),
+            rate_limit=rate_limit if rate_limit is not None else batch_config.get("rate_limit"),
+            # El guion terminó: liberar su sesión en el servidor
+            end_session=client.end_session
+        )
+        return await runner.run(queries, output_path)
+    finally:
+        await client.aclose()
 
 
 def main():
     """Función principal"""
+    parser = argparse.ArgumentParser(description="Chatbot Turístico Huaraz")
+    parser.add_argument("--provider", default="openai", help="Proveedor de LLM (openai, fake)")
+    parser.add_argument(
+        "--batch", metavar="CONSULTAS.jsonl",
+        help="Procesar un archivo de consultas en lugar del modo interactivo"
+    )
+    parser.add_argument(
+        "--output", metavar="RESULTADOS.jsonl",
+        help="Resultados del lote (por defecto <entrada>.results.jsonl)"
+    )
+    parser.add_argument("--concurrency", type=int, help="Conversaciones simultáneas del lote")
+    parser.add_argument("--rate", type=float, help="Máximo de consultas por segundo del lote")
+    parser.add_argument(
+        "--server", metavar="URL",
+        help="Enviar el lote al servidor web en marcha (precalienta sus cachés) en lugar de procesarlo aquí"
+    )
+    args = parser.parse_args()
+    
     try:
-        # Crear instancia del chatbot
-        chatbot = ChatbotTouristico(llm_provider="openai")
+        if args.batch:
+            output = args.output or str(Path(args.batch).with_suffix(".results.jsonl"))
+            if args.server:
+                summary = asyncio.run(
+                    arun_server_batch(args.server, args.batch, output, args.concurrency, args.rate)
+                )
+            else:
+                chatbot = ChatbotTouristico(llm_provider=args.provider)
+                summary = asyncio.run(chatbot.arun_batch(args.batch, output, args.concurrency, args.rate))
+            print(json.dumps(summary, ensure_ascii=False, indent=2))
+            print(f"Resultados: {output}")
+            # Código de salida distinto de cero si alguna consulta falló (corridas nocturnas)
+            sys.exit(1 if summary["failed"] else 0)
         
         # Iniciar conversación interactiva
+        chatbot = ChatbotTouristico(llm_provider=args.provider)
         chatbot.start_conversation()
     
     except ValueError as e:
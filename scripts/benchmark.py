@@ -0,0 +1,385 @@
+"""
+Prueba de carga del servidor web sin red ni costo
+
+Levanta app.py en este mismo proceso con el modelo simulado del
+LLMFactory (proveedor "fake"), que emite llamadas a herramientas
+guionizadas, y lo ejercita con muchos clientes simultáneos por /chat y
+por /ws. Reporta throughput, latencias p50/p95/p99, retraso del event
+loop del servidor y memoria residente (RSS).
+
+Uso:
+    python scripts/benchmark.py --clients 200 --turns 3 --mode both
+    python scripts/benchmark.py --clients 50 --json resultados.json
+    python scripts/benchmark.py --baseline resultados.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+os.chdir(project_root)
+
+# Todo sin red: sin clima en vivo, sin trazas remotas y con una key ficticia
+# (los embeddings se construyen pero nunca se llaman)
+os.environ["OPENWEATHER_API_KEY"] = ""
+os.environ["LANGCHAIN_TRACING_V2"] = "false"
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-offline")
+os.environ.setdefault("USER_AGENT", "huaraz-benchmark")
+
+import httpx
+import uvicorn
+import websockets
+
+import app as server
+from main import ChatbotTouristico
+from src.rag.price_scraper import get_scraper
+from src.utils.admission import AdmissionPolicy
+from src.utils.helpers import Logger
+
+# Consultas que recorren las herramientas del guion del modelo simulado
+QUERIES = [
+    "¿Cuánto cuesta el tour a laguna 69?",
+    "¿Qué tours hay disponibles?",
+    "¿Cómo está el clima hoy?",
+    "¿Cómo evito el mal de altura?",
+    "¿Cuál es la mejor época para hacer trekking?",
+    "Recomiéndame atracciones con lagunas",
+    "¿Cuánto cuesta ir al Pastoruri?",
+    "Hola, ¿qué me recomiendas en Huaraz?",
+]
+
+# Datos de tours versionados en el repositorio (evita hacer scraping)
+TOURS_FIXTURE = project_root / "scripts" / "data" / "rag_cache" / "tours_data.json"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil por rango más cercano (0 si no hay datos)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def current_rss_mb() -> float:
+    """Memoria residente actual del proceso en MB"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Fuera de Linux: pico de memoria (ru_maxrss está en bytes en macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def raise_file_limit() -> None:
+    """Subir el límite de descriptores para miles de sockets"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+class ServerThread:
+    """Servidor uvicorn en un hilo con su propio event loop y monitor de lag"""
+
+    def __init__(self, port: int, lag_interval: float = 0.05):
+        self.port = port
+        self.lag_interval = lag_interval
+        self.loop = asyncio.new_event_loop()
+        self.server = uvicorn.Server(uvicorn.Config(
+            server.app, host="127.0.0.1", port=port, log_level="warning", ws_max_size=1 << 20
+        ))
+        self.lag_samples: List[float] = []
+        self.rss_samples: List[float] = []
+        self._thread = threading.Thread(target=self._run, name="benchmark-server", daemon=True)
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.server.serve())
+
+    async def _monitor(self) -> None:
+        """Medir cuánto se retrasa un sleep corto en el loop del servidor"""
+        last_rss = 0.0
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.lag_interval)
+            self.lag_samples.append(max(0.0, time.perf_counter() - start - self.lag_interval))
+            if start - last_rss >= 0.5:
+                self.rss_samples.append(current_rss_mb())
+                last_rss = start
+
+    def start(self) -> None:
+        self._thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        asyncio.run_coroutine_threadsafe(self._monitor(), self.loop)
+
+    def reset_samples(self) -> None:
+        self.lag_samples = []
+        self.rss_samples = []
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self._thread.join(timeout=10)
+
+
+class Results:
+    """Latencias y conteos de un escenario"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.first_token: List[float] = []
+        self.ok = 0
+        self.rejected = 0
+        self.errors = 0
+        self.duration = 0.0
+
+    def summary(self, lag: List[float], rss: List[float]) -> Dict[str, Any]:
+        ms = lambda values, pct: round(percentile(values, pct) * 1000, 1)
+        return {
+            "scenario": self.name,
+            "requests_ok": self.ok,
+            "rejected_429": self.rejected,
+            "errors": self.errors,
+            "duration_s": round(self.duration, 2),
+            "throughput_rps": round(self.ok / self.duration, 2) if self.duration else 0.0,
+            "latency_ms": {"p50": ms(self.latencies, 50), "p95": ms(self.latencies, 95), "p99": ms(self.latencies, 99)},
+            "first_token_ms": (
+                {"p50": ms(self.first_token, 50), "p95": ms(self.first_token, 95)} if self.first_token else None
+            ),
+            "event_loop_lag_ms": {"p99": ms(lag, 99), "max": round(max(lag, default=0.0) * 1000, 1)},
+            "rss_mb": {"peak": round(max(rss, default=current_rss_mb()), 1), "end": round(current_rss_mb(), 1)},
+        }
+
+
+def build_query(client: int, turn: int, distinct: bool) -> str:
+    query = QUERIES[(client + turn) % len(QUERIES)]
+    # Un sufijo por cliente evita que la coalescencia oculte la carga real
+    return f"{query} (viajero {client})" if distinct else query
+
+
+async def chat_client(base_url: str, client: int, args: argparse.Namespace,
+                      results: Results, http: httpx.AsyncClient) -> None:
+    session_id = f"bench-chat-{client}"
+    for turn in range(args.turns):
+        start = time.perf_counter()
+        try:
+            response = await http.post(f"{base_url}/chat", json={
+                "message": build_query(client, turn, args.distinct),
+                "session_id": session_id
+            })
+        except httpx.HTTPError:
+            results.errors += 1
+            continue
+        if response.status_code == 200:
+            results.ok += 1
+            results.latencies.append(time.perf_counter() - start)
+        elif response.status_code == 429:
+            results.rejected += 1
+        else:
+            results.errors += 1
+
+
+async def ws_client(ws_url: str, client: int, args: argparse.Namespace, results: Results) -> None:
+    session_id = f"bench-ws-{client}"
+    try:
+        async with websockets.connect(f"{ws_url}/ws/{session_id}", max_size=None, open_timeout=30) as ws:
+            await ws.recv()  # bienvenida
+            for turn in range(args.turns):
+                request_id = f"{client}-{turn}"
+                start = time.perf_counter()
+                first_token: Optional[float] = None
+                await ws.send(json.dumps({
+                    "type": "chat",
+                    "id": request_id,
+                    "message": build_query(client, turn, args.distinct)
+                }))
+                while True:
+                    frame = json.loads(await ws.recv())
+                    if frame.get("id") != request_id:
+                        continue
+                    if frame["type"] == "token" and first_token is None:
+                        first_token = time.perf_counter() - start
+                    elif frame["type"] == "bot":
+                        results.ok += 1
+                        results.latencies.append(time.perf_counter() - start)
+                        if first_token is not None:
+                            results.first_token.append(first_token)
+                        break
+                    elif frame["type"] == "busy":
+                        results.rejected += 1
+                        break
+                    elif frame["type"] in ("error", "cancelled"):
+                        results.errors += 1
+                        break
+    except (OSError, websockets.WebSocketException, asyncio.TimeoutError):
+        results.errors += 1
+
+
+async def run_scenario(name: str, port: int, args: argparse.Namespace) -> Results:
+    results = Results(name)
+    base_url = f"http://127.0.0.1:{port}"
+    ws_url = f"ws://127.0.0.1:{port}"
+    delay = args.ramp / args.clients if args.clients else 0
+
+    async def delayed(client: int, coro_factory):
+        await asyncio.sleep(client * delay)
+        await coro_factory()
+
+    start = time.perf_counter()
+    if name == "chat":
+        limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as http:
+            await asyncio.gather(*[
+                delayed(i, lambda i=i: chat_client(base_url, i, args, results, http))
+                for i in range(args.clients)
+            ])
+    else:
+        await asyncio.gather(*[
+            delayed(i, lambda i=i: ws_client(ws_url, i, args, results))
+            for i in range(args.clients)
+        ])
+    results.duration = time.perf_counter() - start
+    return results
+
+
+def prepare_app(args: argparse.Namespace) -> None:
+    """Configurar app.py para correr sin red con el modelo simulado"""
+    if not args.verbose:
+        # Imprimir cada consulta en consola distorsiona las latencias medidas
+        Logger.log = staticmethod(lambda level, message: None)
+        logging.getLogger().setLevel(logging.WARNING)
+
+    chatbot = ChatbotTouristico(llm_provider="fake")
+    chatbot.llm.think_time = args.think_time
+    # La caché semántica calcula embeddings con la API: fuera de la prueba
+    chatbot.agent.answer_cache = None
+    server.chatbot_instance = chatbot
+
+    # La precarga del índice FAISS podría descargar contenido web
+    server.warmup_config["enabled"] = False
+
+    # Todos los clientes salen de 127.0.0.1: el límite por IP no aplica aquí
+    admission_config = dict(server.admission_config)
+    admission_config["per_ip"] = {"capacity": 1e9, "refill_per_second": 1e9}
+    server.admission = AdmissionPolicy(admission_config)
+
+    scraper = get_scraper()
+    if not scraper.tours and TOURS_FIXTURE.exists():
+        cache_file, scraper.cache_file = scraper.cache_file, TOURS_FIXTURE
+        scraper.load_from_cache()
+        scraper.cache_file = cache_file
+    if not scraper.tours:
+        print("⚠️  Sin datos de tours: get_tour_price intentará hacer scraping (requiere red)")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def print_summary(summary: Dict[str, Any]) -> None:
+    latency = summary["latency_ms"]
+    print(f"\n📊 Escenario: {summary['scenario']}")
+    print(f"   OK: {summary['requests_ok']}  429: {summary['rejected_429']}  errores: {summary['errors']}")
+    print(f"   Duración: {summary['duration_s']} s   Throughput: {summary['throughput_rps']} req/s")
+    print(f"   Latencia p50/p95/p99: {latency['p50']} / {latency['p95']} / {latency['p99']} ms")
+    if summary["first_token_ms"]:
+        print(f"   Primer token p50/p95: {summary['first_token_ms']['p50']} / {summary['first_token_ms']['p95']} ms")
+    print(f"   Lag del event loop p99/max: {summary['event_loop_lag_ms']['p99']} / {summary['event_loop_lag_ms']['max']} ms")
+    print(f"   RSS pico/final: {summary['rss_mb']['peak']} / {summary['rss_mb']['end']} MB")
+
+
+def check_regressions(summaries: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    """Comparar p95 y throughput contra una ejecución anterior"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {s["scenario"]: s for s in json.load(f)["scenarios"]}
+
+    problems = []
+    for summary in summaries:
+        before = baseline.get(summary["scenario"])
+        if not before:
+            continue
+        p95, p95_before = summary["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        if p95_before and p95 > p95_before * (1 + tolerance):
+            problems.append(f"{summary['scenario']}: p95 {p95_before} → {p95} ms")
+        rps, rps_before = summary["throughput_rps"], before["throughput_rps"]
+        if rps_before and rps < rps_before * (1 - tolerance):
+            problems.append(f"{summary['scenario']}: throughput {rps_before} → {rps} req/s")
+    return problems
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Prueba de carga sin red con un LLM simulado")
+    parser.add_argument("--clients", type=int, default=50, help="Clientes simultáneos")
+    parser.add_argument("--turns", type=int, default=3, help="Mensajes por cliente")
+    parser.add_argument("--mode", choices=["chat", "ws", "both"], default="both", help="Endpoints a probar")
+    parser.add_argument("--think-time", type=float, default=0.05, help="Latencia simulada de cada llamada al LLM (s)")
+    parser.add_argument("--ramp", type=float, default=1.0, help="Segundos para conectar a todos los clientes")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout por petición HTTP (s)")
+    parser.add_argument("--allow-coalescing", dest="distinct", action="store_false",
+                        help="Enviar consultas idénticas entre clientes (permite la coalescencia)")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar los logs del servidor")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    parser.add_argument("--baseline", help="Resultados anteriores (--json) para detectar regresiones")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Empeoramiento tolerado de p95/throughput frente al baseline (fracción)")
+    args = parser.parse_args()
+
+    raise_file_limit()
+    prepare_app(args)
+
+    port = free_port()
+    server_thread = ServerThread(port)
+    server_thread.start()
+
+    print("=" * 60)
+    print("🏋️  PRUEBA DE CARGA - CHATBOT TURÍSTICO HUARAZ".center(60))
+    print("=" * 60)
+    print(f"Clientes: {args.clients}  Turnos: {args.turns}  Think-time: {args.think_time}s  Puerto: {port}")
+
+    scenarios = ["chat", "ws"] if args.mode == "both" else [args.mode]
+    summaries = []
+    try:
+        for name in scenarios:
+            server_thread.reset_samples()
+            results = asyncio.run(run_scenario(name, port, args))
+            summary = results.summary(list(server_thread.lag_samples), list(server_thread.rss_samples))
+            summaries.append(summary)
+            print_summary(summary)
+    finally:
+        server_thread.stop()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "scenarios": summaries}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Resultados guardados en: {args.json}")
+
+    if args.baseline:
+        problems = check_regressions(summaries, args.baseline, args.max_regression)
+        if problems:
+            print("\n❌ Regresiones respecto al baseline:")
+            for problem in problems:
+                print(f"   - {problem}")
+            sys.exit(1)
+        print("\n✅ Sin regresiones respecto al baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""
+Checkpointers del grafo del agente.
+
+El grafo compilado es uno solo por proceso; el estado de cada conversación
+se guarda aparte, por `thread_id` (el id de la sesión), en un checkpointer
+de langgraph. Se incluyen dos backends:
+
+    memory   InMemorySaver indexado por hilo (por defecto)
+    sqlite   Base SQLite local (sobrevive a reinicios del proceso)
+
+El hilo es la única copia de la conversación: cada turno envía solo el
+mensaje nuevo del usuario y el grafo retoma el resto del hilo; el resumen
+de los turnos antiguos también se guarda en él. El agente ejecuta el grafo
+con `durability="exit"` (un checkpoint por turno, no uno por paso) y los
+backends conservan solo el último checkpoint de cada hilo, que es el único
+que se vuelve a leer.
+"""
+import asyncio
+import functools
+import logging
+import random
+import sqlite3
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryCheckpointer(InMemorySaver):
+    """
+    InMemorySaver que indexa sus claves por hilo.
+
+    Cada checkpoint nuevo reemplaza a los anteriores del hilo, y
+    `delete_thread` (al desalojar una sesión) borra solo las claves del
+    hilo en lugar de recorrer todas las del proceso.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._blob_keys: Dict[str, Set[Tuple[str, ...]]] = defaultdict(set)
+        self._write_keys: Dict[str, Set[Tuple[str, ...]]] = defaultdict(set)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        self._blob_keys[thread_id].update(
+            (thread_id, checkpoint_ns, channel, version) for channel, version in new_versions.items()
+        )
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        self._prune(thread_id, checkpoint_ns, checkpoint)
+        return next_config
+
+    def _prune(self, thread_id: str, checkpoint_ns: str, latest: Checkpoint) -> None:
+        """Quitar los checkpoints anteriores del hilo y los blobs que ya nadie referencia"""
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        for checkpoint_id in [i for i in checkpoints if i != latest["id"]]:
+            del checkpoints[checkpoint_id]
+        live = {(thread_id, checkpoint_ns, channel, version) for channel, version in latest["channel_versions"].items()}
+        stale = {key for key in self._blob_keys[thread_id] if key[1] == checkpoint_ns and key not in live}
+        for key in stale:
+            self.blobs.pop(key, None)
+        self._blob_keys[thread_id] -= stale
+        stale = {key for key in self._write_keys[thread_id] if key[1] == checkpoint_ns and key[2] != latest["id"]}
+        for key in stale:
+            self.writes.pop(key, None)
+        self._write_keys[thread_id] -= stale
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        self._write_keys[thread_id].add(
+            (thread_id, config["configurable"].get("checkpoint_ns", ""), config["configurable"]["checkpoint_id"])
+        )
+        super().put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.storage.pop(thread_id, None)
+        for key in self._write_keys.pop(thread_id, ()):
+            self.writes.pop(key, None)
+        for key in self._blob_keys.pop(thread_id, ()):
+            self.blobs.pop(key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "threads": len(self.storage)}
+
+
+class SQLiteCheckpointer(BaseCheckpointSaver):
+    """
+    Checkpointer sobre una base SQLite local (módulo sqlite3 de la biblioteca estándar).
+
+    Las operaciones asíncronas se ejecutan en un hilo; una sola conexión
+    protegida por un lock atiende a ambos caminos. Guardar un checkpoint
+    borra en la misma transacción los anteriores del hilo.
+    """
+
+    def __init__(self, path: str = "data/checkpoints.sqlite", serde: Optional[Any] = None):
+        """
+        Abrir (o crear) la base de checkpoints.
+
+        Args:
+            path: Ruta del archivo SQLite
+            serde: Serializador de langgraph (por defecto JsonPlusSerializer)
+        """
+        super().__init__(serde=serde)
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    parent_checkpoint_id TEXT,
+                    type TEXT,
+                    checkpoint BLOB,
+                    metadata_type TEXT,
+                    metadata BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                );
+                CREATE TABLE IF NOT EXISTS writes (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    type TEXT,
+                    value BLOB,
+                    task_path TEXT NOT NULL DEFAULT '',
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                );
+                """
+            )
+
+    def _query(self, sql: str, params: Sequence[Any] = ()) -> List[Tuple[Any, ...]]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _tuple(self, row: Tuple[Any, ...]) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata = row
+        writes = self._query(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        )
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((w_type, value)))
+                for task_id, channel, w_type, value in writes
+            ],
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+            "type, checkpoint, metadata_type, metadata FROM checkpoints "
+        )
+        if checkpoint_id := get_checkpoint_id(config):
+            rows = self._query(
+                columns + "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            )
+        else:
+            rows = self._query(
+                columns + "WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                (thread_id, checkpoint_ns),
+            )
+        return self._tuple(rows[0]) if rows else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        rows = self._query(
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+            f"type, checkpoint, metadata_type, metadata FROM checkpoints {where}"
+            "ORDER BY checkpoint_id DESC",
+            params,
+        )
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            checkpoint_tuple = self._tuple(row)
+            if filter and not all(checkpoint_tuple.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield checkpoint_tuple
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        type_, serialized = self.serde.dumps_typed(checkpoint)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        scope = (thread_id, checkpoint_ns, checkpoint["id"])
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        thread_id,
+                        checkpoint_ns,
+                        checkpoint["id"],
+                        config["configurable"].get("checkpoint_id"),
+                        type_,
+                        serialized,
+                        metadata_type,
+                        serialized_metadata,
+                    ),
+                )
+                self._conn.execute(
+                    "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id <> ?", scope
+                )
+                self._conn.execute(
+                    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id <> ?", scope
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        # Las escrituras especiales (errores, interrupciones) reemplazan a las anteriores
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, serialized = self.serde.dumps_typed(value)
+            rows.append((
+                config["configurable"]["thread_id"],
+                config["configurable"].get("checkpoint_ns", ""),
+                config["configurable"]["checkpoint_id"],
+                task_id,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                type_,
+                serialized,
+                task_path,
+            ))
+        with self._lock:
+            self._conn.executemany(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            self._conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+
+    async def _in_thread(self, func: Any, *args: Any, **kwargs: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await self._in_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await self._in_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await self._in_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await self._in_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await self._in_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        # Mismo formato que InMemorySaver: "<contador>.<aleatorio>"
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    def get_stats(self) -> Dict[str, Any]:
+        threads = self._query("SELECT COUNT(DISTINCT thread_id) FROM checkpoints")[0][0]
+        return {"backend": "sqlite", "path": self.path, "threads": threads}
+
+
+# Checkpointer compartido del proceso
+_checkpointer: BaseCheckpointSaver = InMemoryCheckpointer()
+
+
+def configure_checkpointer(backend: str = "memory", path: str = "data/checkpoints.sqlite") -> None:
+    """
+    Elegir el backend de estado por hilo del grafo.
+
+    Debe llamarse antes de crear el agente: el grafo se compila con el
+    checkpointer vigente.
+
+    Args:
+        backend: "memory" o "sqlite"
+        path: Archivo de la base para el backend sqlite
+    """
+    global _checkpointer
+
+    if backend == "sqlite":
+        _checkpointer = SQLiteCheckpointer(path)
+    else:
+        if backend != "memory":
+            logger.warning(f"Backend de checkpoints desconocido '{backend}', se usa memoria")
+        _checkpointer = InMemoryCheckpointer()
+
+
+def get_checkpointer() -> BaseCheckpointSaver:
+    """Obtener el checkpointer compartido"""
+    return _checkpointer
@@ -0,0 +1,346 @@
+"""
+Enrutador local de intenciones.
+
+Resuelve sin el ciclo ReAct (y sin llamar al LLM) las consultas simples más
+comunes: precio de un tour, clima, pronóstico, mal de altura, lista de
+tours, detalles de una atracción y alojamiento por presupuesto. Usa
+palabras clave y entidades conocidas (nombres de tours, claves de
+`HuarazKnowledgeBase.ATTRACTIONS`, términos del clima) y solo responde
+cuando la consulta es inequívoca: una única intención, con su entidad
+explícita y sin referencias a la conversación. Todo lo demás sigue al
+agente.
+
+Las categorías son las de `PromptManager.get_routing_prompt()`.
+"""
+import functools
+import json
+import logging
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.tools import BaseTool
+
+from data.knowledge.huaraz_knowledge import HuarazKnowledgeBase
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ROUTER_DECISIONS = metrics.counter(
+    "chatbot_router_decisions_total", "Consultas resueltas por el enrutador local o derivadas al agente", ["route"]
+)
+
+# Nombres con los que los viajeros se refieren a los tours de huarazturismo.com
+TOUR_ALIASES = (
+    "laguna 69", "pastoruri", "llanganuco", "chavin", "paron", "churup", "santa cruz",
+    "rocotuyoc", "laguna congelada", "cañon del pato", "chacas", "punta olimpica",
+    "honcopampa", "chancos", "monterrey", "wilcacocha", "willkawain", "wilcahuain",
+    "alpamayo", "quillcayhuanca", "cojup", "honda ulta", "olleros", "city tour",
+)
+
+WEATHER_TERMS = ("clima", "temperatura", "lluvia", "llueve", "llover", "pronostico", "hace frio", "hace calor")
+FORECAST_TERMS = ("pronostico", "manana", "proximos dias", "fin de semana", "esta semana", "la semana")
+PRICE_TERMS = ("precio", "cuesta", "cuanto sale", "cuanto vale", "costo", "tarifa", "cuanto cobran")
+LIST_TERMS = (
+    "que tours", "tours disponibles", "lista de tours", "todos los tours", "opciones de tours",
+    "que paquetes", "paquetes disponibles", "que excursiones"
+)
+ALTITUDE_TERMS = ("mal de altura", "soroche", "aclimat", "altitud")
+DETAILS_TERMS = ("informacion", "info ", "detalles", "cuentame", "hablame", "que es ", "como es ")
+LODGING_TERMS = ("hotel", "hostal", "hospedaje", "alojamiento", "albergue", "donde dormir", "donde quedarme")
+BUDGET_TERMS = {
+    "budget": ("barato", "economico", "mochilero", "bajo presupuesto"),
+    "mid_range": ("precio medio", "intermedio", "rango medio"),
+    "luxury": ("lujo", "lujoso", "exclusivo", "5 estrellas"),
+}
+
+# Señales de que la consulta necesita razonamiento o contexto de la conversación
+AGENT_TERMS = (
+    "itinerario", "planific", "recomiend", "compar", "vs ", "mejor ", "conviene", "deberia",
+    "eso ", "esos ", "ese ", "esa ", "anterior", "dijiste", "mencionaste", "tambien", "ademas", "y si ",
+)
+MAX_WORDS = 14
+
+# Cantidades (días, personas, precios) que cambian la respuesta
+NUMBER_PATTERN = re.compile(r"\d+")
+
+FOLLOW_UPS = {
+    "get_tour_price": "¿Te gustaría saber la mejor época para ir o qué llevar?",
+    "list_all_tours_with_prices": "¿Qué te interesa más: aventura, cultura o paisajes? Así te recomiendo 2 o 3 opciones.",
+    "get_current_weather": "¿Planeas alguna excursión? Te digo qué llevar según el destino.",
+    "get_weather_forecast": "¿Quieres que te sugiera tours según el pronóstico?",
+    "get_altitude_advice": "¿Ya tienes fechas? Te ayudo a planificar los días de aclimatación.",
+    "get_attraction_details": "¿Quieres conocer el precio del tour o cómo llegar?",
+    "search_accommodations": "¿En qué fechas viajas? Te ayudo a organizar el resto del viaje.",
+}
+
+REWRITE_INSTRUCTIONS = (
+    "Eres un guía turístico de Huaraz. Reescribe la información de forma cálida y breve, en español, "
+    "sin inventar ni omitir datos (precios, horarios, enlaces). Termina con una pregunta de seguimiento."
+)
+
+
+@dataclass
+class Route:
+    """Decisión del enrutador para una consulta"""
+    category: str
+    tool: str
+    args: Dict[str, Any] = field(default_factory=dict)
+    entity: Optional[str] = None
+
+
+def normalize(text: str) -> str:
+    """Minúsculas, sin tildes ni signos de puntuación"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+class IntentRouter:
+    """Enrutador de consultas simples a una sola herramienta"""
+
+    def __init__(self, tools: Sequence[BaseTool], rewrite_llm: Optional[Any] = None):
+        """
+        Inicializar el enrutador.
+
+        Args:
+            tools: Herramientas del agente (se llaman por nombre)
+            rewrite_llm: Modelo pequeño opcional para redactar la respuesta;
+                         sin él se usan plantillas
+        """
+        self.tools = {tool.name: tool for tool in tools}
+        self.rewrite_llm = rewrite_llm
+        self.attractions = self._attraction_aliases()
+        self.tour_aliases = sorted((normalize(a) for a in TOUR_ALIASES), key=len, reverse=True)
+        self.routed: Dict[str, int] = {}
+        self.fallbacks = 0
+
+    @staticmethod
+    def _attraction_aliases() -> List[Tuple[str, str]]:
+        """(alias normalizado, nombre de la atracción), los más largos primero"""
+        generic = {"laguna", "nevado", "de", "del", "la"}
+        aliases = []
+        for key, attraction in HuarazKnowledgeBase.ATTRACTIONS.items():
+            name = normalize(attraction.name)
+            aliases.append((name, attraction.name))
+            aliases.append((key.replace("_", " "), attraction.name))
+            for word in name.split():
+                if word not in generic and len(word) >= 4 and not word.isdigit():
+                    aliases.append((word, attraction.name))
+        return sorted(set(aliases), key=lambda alias: len(alias[0]), reverse=True)
+
+    @staticmethod
+    def _has(text: str, terms: Sequence[str]) -> bool:
+        """Algún término al inicio de una palabra (un espacio final exige la palabra completa)"""
+        padded = f" {text} "
+        return any(f" {term.lstrip()}" in padded for term in terms)
+
+    @staticmethod
+    def _attraction_for(entity: Optional[str]) -> Optional[Any]:
+        """Atracción de la base de conocimiento que corresponde a un tour"""
+        if not entity:
+            return None
+        entity = normalize(entity)
+        return next(
+            (a for a in HuarazKnowledgeBase.ATTRACTIONS.values() if entity in normalize(a.name)),
+            None
+        )
+
+    def _find_tour(self, text: str) -> Optional[str]:
+        padded = f" {text} "
+        found = [alias for alias in self.tour_aliases if f" {alias} " in padded]
+        # Una sola entidad (los alias contenidos en otro más largo no cuentan)
+        distinct = [a for a in found if not any(a != b and a in b for b in found)]
+        return distinct[0] if len(distinct) == 1 else None
+
+    def _find_attraction(self, text: str) -> Optional[str]:
+        padded = f" {text} "
+        names = {name for alias, name in self.attractions if f" {alias} " in padded}
+        return names.pop() if len(names) == 1 else None
+
+    def route(self, query: str) -> Optional[Route]:
+        """
+        Clasificar una consulta.
+
+        Returns:
+            La ruta si la consulta es inequívoca, o None para derivarla al agente
+        """
+        text = normalize(query)
+        if not text or len(text.split()) > MAX_WORDS or self._has(text, AGENT_TERMS):
+            return None
+
+        candidates: List[Route] = []
+        tour = self._find_tour(text)
+        attraction = self._find_attraction(text)
+
+        if self._has(text, PRICE_TERMS) and tour:
+            candidates.append(Route("ATTRACTIONS", "get_tour_price", {"tour_name": tour}, tour))
+        if self._has(text, WEATHER_TERMS):
+            if self._has(text, FORECAST_TERMS):
+                candidates.append(Route("PRACTICAL_INFO", "get_weather_forecast", {"days": 3}))
+            else:
+                candidates.append(Route("PRACTICAL_INFO", "get_current_weather", {"location": "Huaraz"}))
+        if self._has(text, ALTITUDE_TERMS):
+            if attraction:
+                # "¿A qué altura está la laguna 69?": la altitud está en los detalles
+                candidates.append(
+                    Route("ATTRACTIONS", "get_attraction_details", {"attraction_name": attraction}, attraction)
+                )
+            else:
+                candidates.append(Route("PRACTICAL_INFO", "get_altitude_advice"))
+        if self._has(text, LIST_TERMS) and not tour:
+            candidates.append(Route("ACTIVITIES", "list_all_tours_with_prices"))
+        if (self._has(text, DETAILS_TERMS) and attraction and not self._has(text, PRICE_TERMS)
+                and not self._has(text, ALTITUDE_TERMS)):
+            candidates.append(Route("ATTRACTIONS", "get_attraction_details", {"attraction_name": attraction}, attraction))
+        if self._has(text, LODGING_TERMS):
+            budgets = [b for b, terms in BUDGET_TERMS.items() if self._has(text, terms)]
+            if len(budgets) == 1:
+                candidates.append(Route("ACCOMMODATIONS", "search_accommodations", {"budget": budgets[0]}))
+            else:
+                # Alojamiento sin presupuesto claro: lo resuelve el agente preguntando
+                return None
+
+        if len(candidates) != 1 or candidates[0].tool not in self.tools:
+            return None
+        return candidates[0]
+
+    async def answer(self, query: str, route: Route) -> Optional[str]:
+        """
+        Ejecutar la herramienta de la ruta y redactar la respuesta.
+
+        Returns:
+            Respuesta para el usuario, o None si la herramienta no encontró
+            nada útil (la consulta sigue entonces al agente)
+        """
+        tool = self.tools[route.tool]
+        if tool.response_format == "content_and_artifact":
+            # La ficha para mostrar viaja como artefacto; el contenido es la versión compacta
+            message = await tool.ainvoke(
+                {"type": "tool_call", "id": f"router-{route.tool}", "name": route.tool, "args": route.args}
+            )
+            output = message.artifact if message.artifact is not None else message.content
+            compact = str(message.content)
+        else:
+            output = await tool.ainvoke(route.args)
+            compact = None
+        text = self._render(route, output)
+        if text is None:
+            return None
+
+        if self.rewrite_llm is not None:
+            try:
+                rewritten = await self.rewrite_llm.ainvoke([
+                    SystemMessage(content=REWRITE_INSTRUCTIONS),
+                    HumanMessage(content=f"Consulta: {query}\n\nInformación:\n{compact or text}")
+                ])
+                if rewritten.content:
+                    return str(rewritten.content)
+            except Exception as e:
+                logger.warning(f"No se pudo redactar la respuesta enrutada: {e}")
+
+        return f"{text}\n\n{FOLLOW_UPS.get(route.tool, '')}".rstrip()
+
+    def _render(self, route: Route, output: Any) -> Optional[str]:
+        """Plantilla de respuesta para el resultado de una herramienta"""
+        if isinstance(output, str):
+            if output.startswith(("No encontré", "Error", "La herramienta")):
+                return None
+            text = output
+            attraction = self._attraction_for(route.entity) if route.tool == "get_tour_price" else None
+            if attraction and attraction.altitude > 4000:
+                text += (
+                    f"\n\n⚠️ **Altura**: {attraction.name} está a {attraction.altitude:,} msnm. "
+                    "Aclimátate al menos 1-2 días en Huaraz antes de ir."
+                )
+            return text
+
+        if route.tool == "get_altitude_advice" and isinstance(output, dict):
+            sections = [
+                ("🤕 **Síntomas**", output.get("symptoms", [])),
+                ("🛡️ **Prevención**", output.get("prevention", [])),
+                ("💊 **Si te afecta**", output.get("treatment", [])),
+                ("🚨 **Busca ayuda si**", output.get("when_to_seek_help", [])),
+            ]
+            body = "\n\n".join(f"{title}:\n" + "\n".join(f"- {item}" for item in items) for title, items in sections)
+            return f"🏔️ **Mal de altura (soroche) en Huaraz**\n\n{body}"
+
+        if route.tool == "get_attraction_details" and isinstance(output, dict):
+            if "error" in output:
+                return None
+            essentials = ", ".join(output.get("essentials", []))
+            return (
+                f"📍 **{output['name']}**\n\n{output['description']}\n\n"
+                f"- **Ubicación**: {output['location']}\n"
+                f"- **Altitud**: {output['altitude']}\n"
+                f"- **Dificultad**: {output['difficulty']}\n"
+                f"- **Duración**: {output['duration']}\n"
+                f"- **Mejor época**: {output['best_season']}\n"
+                f"- **Costo estimado**: {output['cost']}\n"
+                f"- **Qué llevar**: {essentials}"
+            )
+
+        if route.tool == "search_accommodations" and isinstance(output, list):
+            if not output or "message" in output[0]:
+                return None
+            lines = [f"- **{h['name']}** ({h['location']}): {h['price']}" for h in output]
+            return "🏨 **Alojamientos en Huaraz**\n\n" + "\n".join(lines)
+
+        # Formato desconocido: mejor que lo redacte el agente
+        logger.debug(f"Resultado sin plantilla para {route.tool}: {json.dumps(output, default=str)[:200]}")
+        return None
+
+    def record(self, route: Optional[Route]) -> None:
+        """Registrar la decisión (ruta resuelta o derivación al agente)"""
+        if route is None:
+            self.fallbacks += 1
+            ROUTER_DECISIONS.inc(route="agent")
+        else:
+            self.routed[route.tool] = self.routed.get(route.tool, 0) + 1
+            ROUTER_DECISIONS.inc(route=route.tool)
+
+    def get_stats(self) -> Dict[str, Any]:
+        routed = sum(self.routed.values())
+        total = routed + self.fallbacks
+        return {
+            "routed": routed,
+            "to_agent": self.fallbacks,
+            "routed_rate": round(routed / total, 3) if total else 0.0,
+            "by_tool": dict(self.routed),
+            "rewrite": self.rewrite_llm is not None
+        }
+
+
+@functools.lru_cache(maxsize=1)
+def _entity_aliases() -> Tuple[Tuple[str, ...], Tuple[Tuple[str, str], ...]]:
+    """Alias normalizados de tours y de atracciones, los más largos primero"""
+    tours = tuple(sorted((normalize(a) for a in TOUR_ALIASES), key=len, reverse=True))
+    return tours, tuple(IntentRouter._attraction_aliases())
+
+
+def query_entities(query: str) -> FrozenSet[str]:
+    """
+    Entidades de las que depende la respuesta a una consulta.
+
+    Tours, atracciones y números mencionados, con los mismos alias que usa
+    el enrutador. Dos consultas casi idénticas con entidades distintas
+    ("¿cuánto cuesta Pastoruri?" / "¿cuánto cuesta Laguna 69?") necesitan
+    respuestas distintas.
+
+    Args:
+        query: Consulta del usuario
+
+    Returns:
+        Entidades con prefijo de tipo ("tour:", "atraccion:", "numero:")
+    """
+    text = normalize(query)
+    padded = f" {text} "
+    tours, attractions = _entity_aliases()
+    found = [alias for alias in tours if f" {alias} " in padded]
+    # Los alias contenidos en otro más largo no cuentan ("laguna 69" / "69")
+    entities = {f"tour:{a}" for a in found if not any(a != b and a in b for b in found)}
+    entities.update(f"atraccion:{name}" for alias, name in attractions if f" {alias} " in padded)
+    entities.update(f"numero:{number}" for number in NUMBER_PATTERN.findall(text))
+    return frozenset(entities)
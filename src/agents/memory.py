@@ -0,0 +1,86 @@
+"""
+Memoria conversacional por sesión
+"""
+import asyncio
+import sys
+import threading
+import uuid
+import weakref
+from typing import Any, Dict, List, Optional
+
+# Un lock por hilo del checkpointer, compartido por todas las memorias que lo
+# usan (p. ej. la que se crea de nuevo tras desalojar una sesión con un turno
+# en curso); la entrada desaparece cuando ninguna memoria lo referencia
+_thread_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+_thread_locks_guard = threading.Lock()
+
+
+def thread_lock(thread_id: str) -> asyncio.Lock:
+    """
+    Obtener el lock de turnos de un hilo del checkpointer.
+
+    Args:
+        thread_id: Hilo de la sesión
+
+    Returns:
+        El mismo lock para todas las memorias vivas del hilo
+    """
+    with _thread_locks_guard:
+        lock = _thread_locks.get(thread_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            _thread_locks[thread_id] = lock
+        return lock
+
+
+class SessionMemory:
+    """
+    Estado ligero de una sesión.
+
+    Los mensajes de la conversación (y su resumen) viven en el hilo
+    `thread_id` del checkpointer del grafo; aquí quedan el contexto del
+    usuario, los últimos intercambios para mostrar y la coordinación de
+    los turnos.
+    """
+
+    def __init__(self, memory_k: int = 10, thread_id: Optional[str] = None):
+        """
+        Inicializar la memoria de una sesión.
+
+        Args:
+            memory_k: Número de intercambios a mantener en el historial resumido
+            thread_id: Hilo de la sesión en el checkpointer del grafo (por defecto uno nuevo)
+        """
+        self.memory_k = memory_k
+        self.thread_id = thread_id or uuid.uuid4().hex
+        self.conversation_history: List[Dict[str, str]] = []
+        self.user_context: Dict[str, Any] = {}
+        # Turnos completados en este proceso (el hilo puede traer turnos anteriores)
+        self.turns = 0
+        # Compactación pendiente del hilo: `Compaction` o tarea que la produce;
+        # se aplica al inicio del próximo turno
+        self.compaction: Optional[Any] = None
+        # Serializa los turnos del hilo en el camino asíncrono (compartido por hilo)
+        self.lock = thread_lock(self.thread_id)
+
+    def clear(self) -> None:
+        """Limpiar la memoria local (el hilo se borra aparte)"""
+        self.conversation_history = []
+        self.user_context = {}
+        self.turns = 0
+        self.compaction = None
+
+    def estimate_size(self) -> int:
+        """
+        Estimar la memoria residente de la sesión en bytes.
+
+        Returns:
+            Tamaño aproximado de intercambios y contexto (sin el hilo del checkpointer)
+        """
+        size = sys.getsizeof(self)
+        for exchange in self.conversation_history:
+            size += sys.getsizeof(exchange)
+            size += sum(sys.getsizeof(v) for v in exchange.values())
+        size += sys.getsizeof(self.user_context)
+        size += sum(sys.getsizeof(v) for v in self.user_context.values())
+        return size
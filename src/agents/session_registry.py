@@ -0,0 +1,169 @@
+"""
+Registro de sesiones con desalojo LRU y TTL de inactividad
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from src.agents.memory import SessionMemory
+from src.utils.metrics import ACTIVE_SESSIONS, SESSIONS_TOTAL
+
+
+class SessionRegistry:
+    """
+    Registro de memorias por `session_id`.
+
+    Todas las sesiones comparten el mismo agente (grafo y cliente LLM);
+    aquí solo vive el estado conversacional de cada una. El registro
+    mantiene un máximo de sesiones y desaloja primero las expiradas por
+    inactividad y luego las menos usadas recientemente.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        idle_ttl: float = 1800,
+        memory_k: int = 10,
+        on_release: Optional[Callable[[SessionMemory], None]] = None
+    ):
+        """
+        Inicializar el registro.
+
+        Args:
+            max_sessions: Número máximo de sesiones residentes
+            idle_ttl: Segundos de inactividad tras los que se desaloja una sesión
+            memory_k: Tamaño de memoria de cada sesión nueva
+            on_release: Se llama (fuera del lock) con cada sesión desalojada o
+                        eliminada, p. ej. para borrar su hilo del checkpointer
+        """
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.memory_k = memory_k
+        self.on_release = on_release
+        self._released: List[SessionMemory] = []
+        # session_id -> (memoria, último acceso); el orden es el de uso reciente
+        self._sessions: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+
+    def get(self, session_id: str) -> SessionMemory:
+        """
+        Obtener (o crear) la memoria de una sesión y marcarla como usada.
+
+        Args:
+            session_id: Identificador de la sesión
+
+        Returns:
+            Memoria de la sesión
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry[1] = now
+                self._sessions.move_to_end(session_id)
+                memory = entry[0]
+            else:
+                memory = SessionMemory(self.memory_k, thread_id=session_id)
+                self._sessions[session_id] = [memory, now]
+                SESSIONS_TOTAL.inc()
+
+                while len(self._sessions) > self.max_sessions:
+                    self._released.append(self._sessions.popitem(last=False)[1][0])
+                    self.evicted_lru += 1
+
+                ACTIVE_SESSIONS.set(len(self._sessions))
+        self._release()
+        return memory
+
+    def peek(self, session_id: str) -> Optional[SessionMemory]:
+        """Obtener la memoria de una sesión sin crearla ni tocar su uso"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return entry[0] if entry else None
+
+    def remove(self, session_id: str) -> bool:
+        """Eliminar una sesión del registro"""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is not None:
+                self._released.append(entry[0])
+            ACTIVE_SESSIONS.set(len(self._sessions))
+        self._release()
+        return entry is not None
+
+    def evict_expired(self) -> int:
+        """Desalojar las sesiones inactivas más allá del TTL"""
+        with self._lock:
+            evicted = self._evict_expired(time.monotonic())
+        self._release()
+        return evicted
+
+    def _release(self) -> None:
+        """Notificar las sesiones que salieron del registro (sin el lock tomado)"""
+        if not self._released:
+            return
+        with self._lock:
+            released, self._released = self._released, []
+        if self.on_release is not None:
+            for memory in released:
+                self.on_release(memory)
+
+    def _evict_expired(self, now: float) -> int:
+        """Desalojar sesiones expiradas (requiere el lock tomado)"""
+        evicted = 0
+        # Las más antiguas están al inicio: basta con recorrer hasta la primera vigente
+        while self._sessions:
+            session_id, (memory, last_access) = next(iter(self._sessions.items()))
+            if now - last_access <= self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+            self._released.append(memory)
+            evicted += 1
+        self.evicted_ttl += evicted
+        if evicted:
+            ACTIVE_SESSIONS.set(len(self._sessions))
+        return evicted
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get_stats(self, top: int = 20) -> Dict[str, Any]:
+        """
+        Obtener estadísticas del registro.
+
+        Args:
+            top: Número de sesiones más pesadas a detallar
+
+        Returns:
+            Conteos, desalojos y memoria residente por sesión
+        """
+        now = time.monotonic()
+        with self._lock:
+            sessions = [
+                {
+                    "session_id": session_id,
+                    "turns": memory.turns,
+                    "bytes": memory.estimate_size(),
+                    "idle_seconds": round(now - last_access, 1)
+                }
+                for session_id, (memory, last_access) in self._sessions.items()
+            ]
+
+        sessions.sort(key=lambda s: s["bytes"], reverse=True)
+        return {
+            "active_sessions": len(sessions),
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl,
+            "evicted_lru": self.evicted_lru,
+            "evicted_ttl": self.evicted_ttl,
+            "total_bytes": sum(s["bytes"] for s in sessions),
+            "sessions": sessions[:top]
+        }
@@ -0,0 +1,128 @@
+"""
+Coalescencia de consultas idénticas en curso (single-flight).
+
+Cuando varias sesiones envían a la vez la misma consulta de apertura
+(primer turno, sin contexto), solo la primera ejecuta el agente; las demás
+esperan su resultado y lo comparten. Solo se comparten respuestas
+completas: si la ejecución líder se abandona, falla o vence su plazo, el
+siguiente en espera toma el relevo y ejecuta la consulta por su cuenta.
+"""
+import asyncio
+import re
+import unicodedata
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from src.utils.metrics import metrics
+
+SINGLE_FLIGHT_SHARED = metrics.counter(
+    "chatbot_singleflight_shared_total", "Consultas resueltas con el resultado de otra en curso"
+)
+SINGLE_FLIGHT_LLM_CALLS_SAVED = metrics.counter(
+    "chatbot_singleflight_llm_calls_saved_total", "Llamadas al LLM evitadas por coalescencia"
+)
+
+
+class SingleFlight:
+    """Registro de ejecuciones en curso por clave normalizada"""
+
+    def __init__(self):
+        # clave -> futuro con el resultado del líder (None si se abandonó)
+        self._flights: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.shared = 0
+        self.llm_calls_saved = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Normalizar una consulta para usarla como clave.
+
+        Ignora mayúsculas, tildes, signos de puntuación y espacios repetidos:
+        "¿Qué tours hay?" y "que tours hay" comparten clave.
+        """
+        text = unicodedata.normalize("NFKD", text.lower())
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        text = re.sub(r"[^\w\s]", " ", text)
+        return " ".join(text.split())
+
+    async def wait(self, key: str) -> Optional[Any]:
+        """
+        Esperar el resultado de una ejecución en curso con la misma clave.
+
+        Returns:
+            Resultado compartido, o None si no hay ejecución en curso
+            (o la que había se abandonó sin resultado)
+        """
+        while True:
+            future = self._flights.get(key)
+            if future is None:
+                return None
+            # shield: cancelar a quien espera no cancela al líder
+            result = await asyncio.shield(future)
+            if result is not None:
+                return result
+
+    @contextmanager
+    def lead(self, key: str) -> Iterator[asyncio.Future]:
+        """
+        Registrar una ejecución líder para `key`.
+
+        El llamador publica el resultado con `future.set_result(...)`. Si el
+        bloque termina sin publicarlo, quienes esperan reciben None y uno de
+        ellos ejecuta la consulta por su cuenta.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._flights[key] = future
+        self.leaders += 1
+        try:
+            yield future
+        finally:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+            if not future.done():
+                future.set_result(None)
+
+    async def do(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        shareable: Optional[Callable[[Any], bool]] = None
+    ) -> Tuple[Any, bool]:
+        """
+        Ejecutar `func` una sola vez por clave entre llamadas concurrentes.
+
+        Args:
+            key: Clave normalizada de la consulta
+            func: Ejecución de la consulta
+            shareable: Indica si un resultado puede compartirse; si no, quienes
+                esperan ejecutan `func` por su cuenta (por defecto, todos)
+
+        Returns:
+            (resultado, compartido) donde `compartido` indica si el resultado
+            provino de otra ejecución
+        """
+        result = await self.wait(key)
+        if result is not None:
+            return result, True
+
+        with self.lead(key) as future:
+            result = await func()
+            if shareable is None or shareable(result):
+                future.set_result(result)
+        return result, False
+
+    def record_shared(self, llm_calls: int) -> None:
+        """Registrar una consulta servida por otra ejecución"""
+        self.shared += 1
+        self.llm_calls_saved += llm_calls
+        SINGLE_FLIGHT_SHARED.inc()
+        SINGLE_FLIGHT_LLM_CALLS_SAVED.inc(llm_calls)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "shared": self.shared,
+            "llm_calls_saved": self.llm_calls_saved
+        }
@@ -0,0 +1,230 @@
+"""
+Memoria con resumen incremental.
+
+Cuando el hilo de una sesión supera `summary_threshold` preguntas y
+respuestas, los turnos más antiguos se condensan en segundo plano en un
+resumen acumulado (presupuesto, condición física, tours elegidos,
+fechas...). El resumen se guarda en el propio hilo del checkpointer, como
+primer mensaje, y los mensajes resumidos se quitan del hilo: el prompt
+lleva el resumen más los últimos turnos completos, así que su tamaño deja
+de crecer con la conversación.
+
+La redacción del resumen (una llamada al LLM) nunca demora una respuesta:
+corre en segundo plano y la compactación del hilo se aplica al inicio del
+turno siguiente de la sesión, cuando el hilo no está en uso.
+"""
+import asyncio
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, RemoveMessage, SystemMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FOLDS = metrics.counter(
+    "chatbot_memory_summary_folds_total", "Resúmenes incrementales del historial", ["result"]
+)
+
+SUMMARY_INSTRUCTIONS = """Mantienes el resumen de una conversación entre un viajero y un guía turístico de Huaraz.
+Actualiza el resumen actual incorporando los mensajes nuevos. Conserva siempre, si aparecen:
+- Presupuesto del viajero
+- Nivel físico, aclimatación y restricciones de salud
+- Tours y atracciones elegidos o descartados (con precios mencionados)
+- Fechas, duración del viaje y tamaño del grupo
+- Preferencias, intereses y preguntas pendientes
+Responde solo con el resumen en viñetas breves, en español, en menos de {max_words} palabras."""
+
+# Id fijo del mensaje de resumen dentro del hilo
+SUMMARY_MESSAGE_ID = "conversation_summary"
+SUMMARY_PREFIX = "Resumen de la conversación anterior:\n"
+
+
+@dataclass
+class Compaction:
+    """Mensajes a quitar del inicio del hilo y resumen que los reemplaza"""
+    folded_ids: List[str]
+    # None = los mensajes se descartan sin resumir (memoria conversation_buffer)
+    summary: Optional[str] = None
+
+
+def summary_message(summary: str) -> SystemMessage:
+    """Mensaje con el resumen de los turnos anteriores (primer mensaje del hilo)"""
+    return SystemMessage(content=SUMMARY_PREFIX + summary, id=SUMMARY_MESSAGE_ID)
+
+
+def split_summary(messages: List[BaseMessage]) -> Tuple[List[BaseMessage], List[BaseMessage]]:
+    """Separar el mensaje de resumen (si existe) del resto del hilo"""
+    if messages and messages[0].id == SUMMARY_MESSAGE_ID:
+        return list(messages[:1]), list(messages[1:])
+    return [], list(messages)
+
+
+def summary_text(messages: List[BaseMessage]) -> str:
+    """Texto del resumen guardado en el hilo ("" si aún no hay)"""
+    summary, _ = split_summary(messages)
+    return str(summary[0].content)[len(SUMMARY_PREFIX):] if summary else ""
+
+
+def is_dialogue(message: BaseMessage) -> bool:
+    """Pregunta del usuario o respuesta final (no pasos intermedios de herramientas)"""
+    return isinstance(message, HumanMessage) or (isinstance(message, AIMessage) and not message.tool_calls)
+
+
+def fold_point(messages: List[BaseMessage], threshold: int, keep: int) -> int:
+    """
+    Cantidad de mensajes iniciales a compactar.
+
+    Solo cuentan las preguntas y respuestas finales; los pasos de
+    herramientas de un turno se compactan junto con él.
+
+    Args:
+        messages: Mensajes de la conversación (sin el resumen)
+        threshold: Mensajes a partir de los cuales se compacta
+        keep: Mensajes recientes que se conservan como mínimo
+
+    Returns:
+        Mensajes a quitar (0 si aún no corresponde); lo que queda empieza
+        siempre con una pregunta del usuario
+    """
+    dialogue = [i for i, m in enumerate(messages) if is_dialogue(m)]
+    if len(dialogue) <= threshold:
+        return 0
+    cut = dialogue[-max(keep, 1)]
+    while cut > 0 and not isinstance(messages[cut], HumanMessage):
+        cut -= 1
+    return cut
+
+
+def compaction_update(messages: List[BaseMessage], compaction: Compaction) -> Optional[List[BaseMessage]]:
+    """
+    Actualización del hilo que aplica una compactación.
+
+    Mientras se redactaba el resumen el hilo pudo cambiar (turnos
+    descartados, sesión vaciada); solo se aplica si los mensajes compactados
+    siguen al inicio de la conversación.
+
+    Returns:
+        Mensajes para `update_state` (reescriben el hilo), o None si se descarta
+    """
+    summary, conversation = split_summary(messages)
+    count = len(compaction.folded_ids)
+    if count == 0 or [m.id for m in conversation[:count]] != compaction.folded_ids:
+        if compaction.summary is not None:
+            SUMMARY_FOLDS.inc(result="discarded")
+        return None
+    if compaction.summary is not None:
+        summary = [summary_message(compaction.summary)]
+        SUMMARY_FOLDS.inc(result="ok")
+    # El resumen debe quedar primero: se reescribe la lista completa
+    return [RemoveMessage(id=REMOVE_ALL_MESSAGES)] + summary + conversation[count:]
+
+
+class ConversationSummarizer:
+    """Condensa los turnos antiguos de una sesión en un resumen acumulado"""
+
+    def __init__(self, llm: Any, threshold: int = 15, keep_recent_turns: int = 3, max_words: int = 150):
+        """
+        Inicializar el resumidor.
+
+        Args:
+            llm: Modelo de lenguaje (sin herramientas) para redactar el resumen
+            threshold: Mensajes del historial a partir de los cuales se resume
+            keep_recent_turns: Turnos recientes que se conservan sin resumir
+            max_words: Extensión máxima del resumen
+        """
+        self.llm = llm
+        self.threshold = threshold
+        self.keep_recent_turns = keep_recent_turns
+        self.max_words = max_words
+        self.folds = 0
+        self.failures = 0
+        # Modo consola (sin event loop): un hilo para redactar resúmenes
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _fold(self, messages: List[BaseMessage]) -> Tuple[str, List[BaseMessage]]:
+        """(resumen actual, mensajes a resumir); sin mensajes si aún no corresponde"""
+        _, conversation = split_summary(messages)
+        cut = fold_point(conversation, self.threshold, self.keep_recent_turns * 2)
+        return summary_text(messages), conversation[:cut]
+
+    def _request(self, summary: str, folded: List[BaseMessage]) -> List[BaseMessage]:
+        transcript = "\n".join(
+            f"{'Viajero' if isinstance(m, HumanMessage) else 'Guía'}: {m.content}"
+            for m in folded
+            if isinstance(m, (HumanMessage, AIMessage)) and m.content
+        )
+        return [
+            SystemMessage(content=SUMMARY_INSTRUCTIONS.format(max_words=self.max_words)),
+            HumanMessage(content=f"Resumen actual:\n{summary or '(vacío)'}\n\nMensajes nuevos:\n{transcript}")
+        ]
+
+    @staticmethod
+    def _text(response: Any) -> str:
+        content = getattr(response, "content", response)
+        if isinstance(content, list):
+            content = "".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in content)
+        return str(content).strip()
+
+    def _compaction(self, folded: List[BaseMessage], response: Any) -> Optional[Compaction]:
+        summary = self._text(response)
+        if not summary:
+            SUMMARY_FOLDS.inc(result="discarded")
+            return None
+        self.folds += 1
+        return Compaction([m.id for m in folded], summary)
+
+    def _failed(self, error: Exception) -> None:
+        self.failures += 1
+        SUMMARY_FOLDS.inc(result="error")
+        logger.warning(f"No se pudo resumir el historial: {error}")
+
+    def schedule(self, messages: List[BaseMessage]) -> Optional[asyncio.Future]:
+        """
+        Redactar en segundo plano el resumen de un hilo que superó el umbral.
+
+        Args:
+            messages: Mensajes del hilo al terminar un turno
+
+        Returns:
+            Tarea que produce la `Compaction` (o None si falla), o None si no hacía falta
+        """
+        summary, folded = self._fold(messages)
+        if not folded:
+            return None
+        return asyncio.ensure_future(self._asummarize(summary, folded))
+
+    async def _asummarize(self, summary: str, folded: List[BaseMessage]) -> Optional[Compaction]:
+        try:
+            return self._compaction(folded, await self.llm.ainvoke(self._request(summary, folded)))
+        except Exception as e:
+            self._failed(e)
+            return None
+
+    def submit(self, messages: List[BaseMessage]) -> Optional[Future]:
+        """Igual que `schedule`, en un hilo propio (camino síncrono, modo consola)"""
+        summary, folded = self._fold(messages)
+        if not folded:
+            return None
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+        return self._executor.submit(self._summarize, summary, folded)
+
+    def _summarize(self, summary: str, folded: List[BaseMessage]) -> Optional[Compaction]:
+        try:
+            return self._compaction(folded, self.llm.invoke(self._request(summary, folded)))
+        except Exception as e:
+            self._failed(e)
+            return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "threshold": self.threshold,
+            "keep_recent_turns": self.keep_recent_turns,
+            "folds": self.folds,
+            "failures": self.failures
+        }
@@ -0,0 +1,147 @@
+"""
+Conteo de tokens y recorte del historial por presupuesto.
+
+Los tokens se miden con el tokenizer del modelo (tiktoken). El conteo de
+cada mensaje se guarda en una caché indexada por su contenido, de modo que
+en cada turno solo se tokenizan los mensajes nuevos.
+"""
+import json
+import logging
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+import tiktoken
+from langchain_core.messages import AIMessage, BaseMessage, trim_messages
+
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TOKENS = metrics.histogram(
+    "chatbot_prompt_tokens",
+    "Tokens del prompt enviado al modelo en cada turno",
+    buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+)
+
+# Encoding de los modelos recientes de OpenAI (gpt-4o, gpt-4o-mini)
+DEFAULT_ENCODING = "o200k_base"
+
+
+class TokenCounter:
+    """Contador de tokens de mensajes con caché por mensaje"""
+
+    # Tokens de formato que el chat agrega por cada mensaje (rol y separadores)
+    MESSAGE_OVERHEAD = 4
+
+    def __init__(self, model_name: Optional[str] = None, cache_size: int = 8192):
+        """
+        Inicializar el contador.
+
+        Args:
+            model_name: Modelo cuyo tokenizer se usará (por defecto o200k_base)
+            cache_size: Textos distintos cuyo conteo se conserva
+        """
+        self.model_name = model_name
+        self._encoding: Optional[Any] = None
+        self._encoding_loaded = False
+        self._lock = threading.Lock()
+        self._count_text = lru_cache(maxsize=cache_size)(self._encode_length)
+
+    def _get_encoding(self) -> Optional[Any]:
+        """Cargar el tokenizer una sola vez (None si no está disponible)"""
+        if not self._encoding_loaded:
+            with self._lock:
+                if not self._encoding_loaded:
+                    try:
+                        try:
+                            self._encoding = tiktoken.encoding_for_model(self.model_name or "")
+                        except KeyError:
+                            self._encoding = tiktoken.get_encoding(DEFAULT_ENCODING)
+                    except Exception as e:
+                        # Sin el archivo del encoding (p. ej. sin red) se estima por caracteres
+                        logger.warning(f"Tokenizer no disponible, se estimarán los tokens: {e}")
+                    self._encoding_loaded = True
+        return self._encoding
+
+    def _encode_length(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is None:
+            # Aproximación de ~4 caracteres por token
+            return len(text) // 4 + 1
+        return len(encoding.encode(text, disallowed_special=()))
+
+    @staticmethod
+    def _message_text(message: BaseMessage) -> str:
+        content = message.content
+        if isinstance(content, list):
+            content = "".join(
+                part.get("text", "") if isinstance(part, dict) else str(part)
+                for part in content
+            )
+        text = str(content)
+        if isinstance(message, AIMessage) and message.tool_calls:
+            text += json.dumps(
+                [{"name": c["name"], "args": c["args"]} for c in message.tool_calls],
+                ensure_ascii=False
+            )
+        return text
+
+    def count_text(self, text: str) -> int:
+        """Tokens de un texto (cacheado)"""
+        return self._count_text(text)
+
+    def count_message(self, message: BaseMessage) -> int:
+        """Tokens de un mensaje (cacheado por contenido)"""
+        return self._count_text(self._message_text(message)) + self.MESSAGE_OVERHEAD
+
+    def __call__(self, messages: Sequence[BaseMessage]) -> int:
+        """Tokens de una lista de mensajes (firma de `token_counter`)"""
+        return sum(self.count_message(message) for message in messages)
+
+    def get_stats(self) -> Dict[str, Any]:
+        info = self._count_text.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "tokenizer": getattr(self._encoding, "name", None) or "estimado",
+            "cached_texts": info.currsize,
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_rate": round(info.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+def trim_history(
+    history: Sequence[BaseMessage],
+    current: BaseMessage,
+    counter: TokenCounter,
+    max_tokens: int
+) -> List[BaseMessage]:
+    """
+    Recortar el historial para que quepa en el presupuesto junto al mensaje actual.
+
+    Se conservan los mensajes más recientes y el recorte empieza siempre en
+    un mensaje del usuario, para no enviar respuestas sin su pregunta. El
+    mensaje actual se incluye aunque exceda el presupuesto por sí solo.
+
+    Args:
+        history: Mensajes anteriores al turno actual
+        current: Mensaje del usuario del turno actual
+        counter: Contador de tokens
+        max_tokens: Presupuesto total de tokens
+
+    Returns:
+        Mensajes a enviar, terminando en el mensaje actual
+    """
+    budget = max_tokens - counter.count_message(current)
+    if budget <= 0 or not history:
+        return [current]
+
+    trimmed = trim_messages(
+        list(history),
+        max_tokens=budget,
+        strategy="last",
+        token_counter=counter,
+        start_on="human"
+    )
+    return list(trimmed) + [current]
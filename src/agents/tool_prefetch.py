@@ -0,0 +1,237 @@
+"""
+Prefetch especulativo de herramientas.
+
+En una pregunta compuesta como "¿cuánto cuesta el tour a Laguna Parón y qué
+clima hará?" ya se sabe, antes de la primera llamada al modelo, qué
+herramientas va a pedir. El prefetcher detecta en el mensaje los tours y
+atracciones conocidos y las intenciones de clima (con el vocabulario del
+enrutador local) y lanza esas herramientas en paralelo con la primera
+llamada al modelo. Cuando el modelo las pide, la herramienta entrega el
+resultado ya obtenido (o espera al que está en curso) en lugar de
+ejecutarse otra vez: se ahorra el tiempo de una ronda de herramientas.
+
+Solo se adelantan herramientas de lectura. Los argumentos se comparan en
+forma canónica (sin tildes ni mayúsculas y, si el argumento completo es un
+alias conocido, reducidos a su entidad), así que "Laguna Parón" coincide
+con el prefetch de "paron" pero "Parón y Llanganuco" no. Un prefetch que
+el modelo no pide se descarta; su resultado queda igualmente en la caché de
+resultados de herramientas.
+"""
+import asyncio
+import contextvars
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.tools import BaseTool
+
+from src.agents.intent_router import (
+    ALTITUDE_TERMS,
+    DETAILS_TERMS,
+    FORECAST_TERMS,
+    IntentRouter,
+    PRICE_TERMS,
+    TOUR_ALIASES,
+    WEATHER_TERMS,
+    normalize,
+)
+from src.utils.metrics import metrics
+from src.utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+TOOL_PREFETCH = metrics.counter(
+    "chatbot_tool_prefetch_total", "Herramientas adelantadas según su uso por el modelo", ["tool", "result"]
+)
+
+# Lote de prefetch del turno en curso (lo consultan las herramientas asíncronas)
+_current_batch: contextvars.ContextVar[Optional["PrefetchBatch"]] = contextvars.ContextVar(
+    "tool_prefetch_batch", default=None
+)
+
+MAX_PREFETCH = 3
+
+
+def _entity_map() -> Dict[str, str]:
+    """Alias normalizado -> entidad canónica"""
+    entities = {alias: normalize(name) for alias, name in IntentRouter._attraction_aliases()}
+    for alias in TOUR_ALIASES:
+        # "paron" y "laguna paron" son la misma entidad: la atracción del tour
+        attraction = IntentRouter._attraction_for(alias)
+        entities.setdefault(normalize(alias), normalize(attraction.name) if attraction else normalize(alias))
+    return entities
+
+
+_ENTITIES = _entity_map()
+
+
+def _canonical(value: Any) -> Any:
+    """
+    Forma canónica de un argumento: la entidad si el texto completo es uno
+    de sus alias, si no el texto normalizado.
+
+    Un argumento que solo contiene un alias ("laguna 69 y llanganuco") no se
+    reduce a esa entidad: la herramienta podría responder otra cosa.
+    """
+    if not isinstance(value, str):
+        return value
+    text = normalize(value)
+    return _ENTITIES.get(text, text)
+
+
+def _key(tool: str, args: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (tool,) + tuple(sorted((k, _canonical(v)) for k, v in args.items()))
+
+
+class PrefetchBatch:
+    """Herramientas lanzadas por adelantado para un turno"""
+
+    def __init__(self) -> None:
+        self.tasks: Dict[Tuple[Any, ...], asyncio.Future] = {}
+        self.tools: Dict[Tuple[Any, ...], str] = {}
+        self.claimed: set = set()
+
+    def add(self, tool: BaseTool, args: Dict[str, Any]) -> None:
+        """Lanzar la corrutina de la herramienta (timeouts y presupuesto incluidos)"""
+        key = _key(tool.name, args)
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.ensure_future(self._run(tool, args))
+            self.tools[key] = tool.name
+
+    @staticmethod
+    async def _run(tool: BaseTool, args: Dict[str, Any]) -> Any:
+        with span(f"prefetch {tool.name}", "prefetch"):
+            return await tool.coroutine(**args)
+
+    def claim(self, tool: str, args: Dict[str, Any]) -> Optional[asyncio.Future]:
+        """Tarea adelantada para una llamada del modelo (None si no se adelantó)"""
+        key = _key(tool, args)
+        task = self.tasks.get(key)
+        if task is not None and key not in self.claimed:
+            self.claimed.add(key)
+            TOOL_PREFETCH.inc(tool=tool, result="hit")
+        return task
+
+    def finish(self) -> Tuple[int, int]:
+        """
+        Cerrar el lote al terminar el turno.
+
+        Returns:
+            (adelantadas que usó el modelo, descartadas)
+        """
+        wasted = 0
+        for key, task in self.tasks.items():
+            if key in self.claimed:
+                continue
+            wasted += 1
+            TOOL_PREFETCH.inc(tool=self.tools[key], result="wasted")
+            # El hilo no se puede interrumpir; solo se evita un error sin recoger
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return len(self.claimed), wasted
+
+
+def current_batch() -> Optional[PrefetchBatch]:
+    """Lote de prefetch del turno en curso"""
+    return _current_batch.get()
+
+
+class ToolPrefetcher:
+    """Decide y lanza las herramientas a adelantar para una consulta"""
+
+    def __init__(self, tools: Sequence[BaseTool], max_prefetch: int = MAX_PREFETCH):
+        """
+        Inicializar el prefetcher.
+
+        Args:
+            tools: Herramientas del agente (asíncronas)
+            max_prefetch: Herramientas adelantadas como máximo por consulta
+        """
+        self.tools = {tool.name: tool for tool in tools}
+        self.max_prefetch = max_prefetch
+        self.tour_aliases = sorted((normalize(a) for a in TOUR_ALIASES), key=len, reverse=True)
+        self.attractions = IntentRouter._attraction_aliases()
+        self.started = 0
+        self.hits = 0
+        self.wasted = 0
+
+    def _entities(self, text: str) -> Tuple[List[str], List[str]]:
+        """(tours, atracciones) mencionados, sin alias contenidos en otro más largo"""
+        padded = f" {text} "
+        tours = [alias for alias in self.tour_aliases if f" {alias} " in padded]
+        tours = [a for a in tours if not any(a != b and a in b for b in tours)]
+        attractions = []
+        for alias, name in self.attractions:
+            if f" {alias} " in padded and name not in attractions:
+                attractions.append(name)
+        return tours, attractions
+
+    def plan(self, query: str, allowed: Optional[Sequence[str]] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Herramientas que el modelo casi seguro pedirá para la consulta.
+
+        Args:
+            query: Mensaje del usuario
+            allowed: Herramientas enlazadas al modelo en este turno (None = todas)
+
+        Returns:
+            Lista de (herramienta, argumentos)
+        """
+        text = normalize(query)
+        has = IntentRouter._has
+        tours, attractions = self._entities(text)
+        calls: List[Tuple[str, Dict[str, Any]]] = []
+
+        if has(text, PRICE_TERMS):
+            calls.extend(("get_tour_price", {"tour_name": tour}) for tour in tours[:2])
+        elif has(text, DETAILS_TERMS):
+            calls.extend(("get_attraction_details", {"attraction_name": name}) for name in attractions[:2])
+        if has(text, WEATHER_TERMS):
+            if has(text, FORECAST_TERMS) or " hara " in f" {text} ":
+                calls.append(("get_weather_forecast", {"days": 3}))
+            else:
+                calls.append(("get_current_weather", {"location": "Huaraz"}))
+        if has(text, ALTITUDE_TERMS):
+            calls.append(("get_altitude_advice", {}))
+
+        return [
+            (name, args) for name, args in calls
+            if name in self.tools and (allowed is None or name in allowed)
+        ][:self.max_prefetch]
+
+    def start(self, query: str, allowed: Optional[Sequence[str]] = None) -> Optional[PrefetchBatch]:
+        """
+        Lanzar el prefetch de una consulta y activarlo en el contexto actual.
+
+        Debe llamarse dentro de la tarea que ejecuta el grafo: las
+        herramientas de esa ejecución heredan el lote por contextvars.
+
+        Returns:
+            El lote lanzado, o None si no había nada que adelantar
+        """
+        calls = self.plan(query, allowed)
+        if not calls:
+            return None
+        batch = PrefetchBatch()
+        # Las tareas se crean antes de activar el lote: no deben encontrarse a sí mismas
+        for name, args in calls:
+            batch.add(self.tools[name], args)
+        _current_batch.set(batch)
+        self.started += len(batch.tasks)
+        logger.debug(f"Prefetch: {[name for name, _ in calls]}")
+        return batch
+
+    def finish(self, batch: Optional[PrefetchBatch]) -> None:
+        """Desactivar el lote y contabilizar su uso"""
+        if batch is None:
+            return
+        _current_batch.set(None)
+        hits, wasted = batch.finish()
+        self.hits += hits
+        self.wasted += wasted
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "started": self.started,
+            "hits": self.hits,
+            "wasted": self.wasted,
+            "hit_rate": round(self.hits / self.started, 3) if self.started else 0.0
+        }
@@ -0,0 +1,191 @@
+"""
+Selección de herramientas por consulta.
+
+Enviar los esquemas de las 12 herramientas en cada llamada al modelo
+(también en un saludo) es el mayor costo fijo del prompt. El selector
+clasifica la consulta con palabras clave y entidades conocidas (los mismos
+términos del enrutador local) y enlaza al modelo solo los grupos de
+herramientas relevantes:
+
+    "¿cómo estará el clima mañana?"  ->  get_current_weather, get_weather_forecast
+
+Si la consulta no encaja en ningún grupo se envían todas las herramientas;
+un saludo o agradecimiento breve no lleva ninguna. Cada subconjunto se
+ordena como la lista completa y su modelo enlazado se crea una sola vez,
+así que los esquemas enviados son idénticos byte a byte para todas las
+consultas del mismo subconjunto y la caché de prompts del proveedor sigue
+funcionando.
+"""
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Sequence, Tuple
+
+from langchain_core.messages import HumanMessage
+from langchain_core.tools import BaseTool
+
+from src.agents.intent_router import (
+    ALTITUDE_TERMS,
+    DETAILS_TERMS,
+    FORECAST_TERMS,
+    IntentRouter,
+    LIST_TERMS,
+    LODGING_TERMS,
+    PRICE_TERMS,
+    TOUR_ALIASES,
+    WEATHER_TERMS,
+    normalize,
+)
+from src.utils.metrics import metrics
+
+TOOL_SELECTIONS = metrics.counter(
+    "chatbot_tool_selection_total", "Consultas por grupo de herramientas enlazado al modelo", ["group"]
+)
+
+# Grupo -> (términos que lo activan, herramientas que aporta)
+TOOL_GROUPS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    "weather": (
+        WEATHER_TERMS + FORECAST_TERMS,
+        ("get_current_weather", "get_weather_forecast"),
+    ),
+    "season": (
+        ("epoca", "temporada", "cuando ir", "que mes", "meses", "estacion"),
+        ("get_best_season", "get_weather_forecast"),
+    ),
+    "tours": (
+        PRICE_TERMS + LIST_TERMS + ("tour", "paquete", "excursion", "reserv", "full day"),
+        ("get_tour_price", "list_all_tours_with_prices"),
+    ),
+    "attractions": (
+        DETAILS_TERMS + (
+            "laguna", "nevado", "visitar", "conocer", "lugares", "atracci", "ruinas", "museo",
+            "mirador", "termales", "que ver", "donde ir",
+        ),
+        ("search_attractions", "get_attraction_details", "search_web_tourism_info"),
+    ),
+    "activities": (
+        (
+            "trekking", "caminata", "escalada", "andinismo", "ciclismo", "bicicleta", "aventura",
+            "actividad", "deporte", "cultura", "que hacer", "dificultad",
+        ),
+        ("get_activity_recommendations", "search_attractions"),
+    ),
+    "itinerary": (
+        ("itinerario", "planific", "plan de", "organiz", "cuantos dias", "horario", "ruta"),
+        ("create_daily_itinerary", "get_attraction_details", "list_all_tours_with_prices"),
+    ),
+    "lodging": (
+        LODGING_TERMS + ("dormir", "quedarme", "hospedarme"),
+        ("search_accommodations",),
+    ),
+    "health": (
+        ALTITUDE_TERMS + ("altura", "oxigeno", "mareo", "salud", "dolor de cabeza"),
+        ("get_altitude_advice",),
+    ),
+}
+
+# Consultas sociales breves que no necesitan herramientas
+SMALL_TALK_TERMS = (
+    "hola", "buenos dias", "buenas tardes", "buenas noches", "gracias", "adios", "chau", "hasta luego",
+    "ok ", "vale ", "genial", "perfecto", "excelente",
+)
+SMALL_TALK_MAX_WORDS = 5
+
+
+class ToolSelector:
+    """Elige el subconjunto de herramientas de cada consulta y el modelo enlazado"""
+
+    def __init__(self, llm: Any, tools: Sequence[BaseTool], groups: Dict[str, Any] = TOOL_GROUPS):
+        """
+        Inicializar el selector.
+
+        Args:
+            llm: Modelo de lenguaje (sin herramientas enlazadas)
+            tools: Herramientas del agente, en el orden canónico de envío
+            groups: Grupos de herramientas y términos que los activan
+        """
+        self.llm = llm
+        self.tools = list(tools)
+        self.all_names = tuple(tool.name for tool in self.tools)
+        self.groups = {
+            group: (terms, tuple(name for name in names if name in self.all_names))
+            for group, (terms, names) in groups.items()
+        }
+        self.entities = tuple(normalize(alias) for alias in TOUR_ALIASES) + tuple(
+            alias for alias, _ in IntentRouter._attraction_aliases()
+        )
+        self._bound: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        self.selections: Dict[str, int] = {}
+        self._select_cached = lru_cache(maxsize=4096)(self._select)
+
+    def _select(self, text: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        """(grupos activados, herramientas en orden canónico)"""
+        groups = [group for group, (terms, _) in self.groups.items() if IntentRouter._has(text, terms)]
+
+        padded = f" {text} "
+        if any(f" {entity} " in padded for entity in self.entities):
+            # Un tour o atracción concreta: su ficha y su precio
+            groups.extend(g for g in ("tours", "attractions") if g not in groups)
+
+        if not groups:
+            if IntentRouter._has(text, SMALL_TALK_TERMS) and len(text.split()) <= SMALL_TALK_MAX_WORDS:
+                return ("small_talk",), ()
+            # Sin señales claras (p. ej. "¿y el segundo?"): todas las herramientas
+            return ("all",), self.all_names
+
+        selected = {name for group in groups for name in self.groups[group][1]}
+        return tuple(groups), tuple(name for name in self.all_names if name in selected)
+
+    def select(self, query: str, record: bool = False) -> Tuple[str, ...]:
+        """
+        Herramientas para una consulta.
+
+        Args:
+            query: Pregunta del usuario
+            record: Registrar los grupos elegidos (una vez por consulta nueva)
+
+        Returns:
+            Nombres en el orden de la lista completa (vacío = sin herramientas)
+        """
+        groups, names = self._select_cached(normalize(query))
+        if record:
+            for group in groups:
+                self.selections[group] = self.selections.get(group, 0) + 1
+                TOOL_SELECTIONS.inc(group=group)
+        return names
+
+    def model_for(self, names: Tuple[str, ...]) -> Any:
+        """Modelo enlazado a un subconjunto (se crea una vez por subconjunto)"""
+        bound = self._bound.get(names)
+        if bound is None:
+            with self._lock:
+                bound = self._bound.get(names)
+                if bound is None:
+                    if names:
+                        by_name = {tool.name: tool for tool in self.tools}
+                        bound = self.llm.bind_tools([by_name[name] for name in names])
+                    else:
+                        # Sin herramientas se llama al modelo tal cual (las APIs
+                        # rechazan una lista de herramientas vacía)
+                        bound = self.llm
+                    self._bound[names] = bound
+        return bound
+
+    def __call__(self, state: Dict[str, Any], runtime: Any) -> Any:
+        """
+        Modelo dinámico del grafo: se resuelve en cada paso según la última
+        pregunta del usuario, así que todos los pasos de un turno usan el
+        mismo subconjunto.
+        """
+        query = next(
+            (str(m.content) for m in reversed(state["messages"]) if isinstance(m, HumanMessage)),
+            ""
+        )
+        return self.model_for(self.select(query))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "groups": dict(self.selections),
+            "bound_subsets": len(self._bound),
+            "tools_total": len(self.all_names)
+        }
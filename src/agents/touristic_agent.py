@@ -1,11 +1,34 @@
 """
 Agente Turístico con capacidades AgentIC y RAG
 """
-from typing import Optional, List, Dict, Any
+import asyncio
+import functools
+import threading
+import uuid
+from contextlib import nullcontext
+from typing import Optional, List, Dict, Any, AsyncIterator, Set, Tuple
 from langgraph.prebuilt import create_react_agent
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import HumanMessage, AIMessage, trim_messages
-from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
+from langchain_core.runnables import RunnableConfig
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, RemoveMessage, ToolMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+from src.agents.checkpointing import get_checkpointer
+from src.agents.memory import SessionMemory
+from src.agents.single_flight import SingleFlight
+from src.agents.summary_memory import (
+    Compaction,
+    ConversationSummarizer,
+    compaction_update,
+    fold_point,
+    is_dialogue,
+    split_summary,
+    summary_text
+)
+from src.agents.intent_router import IntentRouter, Route
+from src.agents.tool_prefetch import PrefetchBatch, ToolPrefetcher
+from src.agents.tool_selector import ToolSelector
+from src.agents.token_budget import PROMPT_TOKENS, TokenCounter, trim_history
+from src.rag.semantic_cache import SemanticCache
 from src.handlers.tools import (
     search_attractions,
     get_attraction_details,
@@ -22,13 +45,50 @@ from src.handlers.rag_tools import (
     get_tour_price,
     list_all_tours_with_prices
 )
-from src.prompt_engineering.prompts import PromptManager
+from src.handlers.async_tools import as_async_tools
+from src.llm.callbacks import MetricsCallbackHandler, TracingCallbackHandler
+from src.utils.helpers import Logger
+from src.utils.deadline import deadline_after, deadline_scope, remaining, set_deadline
+from src.utils.metrics import AGENT_DEADLINE_EXCEEDED, AGENT_RUNS_IN_FLIGHT, AGENT_STEP_LIMIT
+from src.utils.tracing import span
+from src.prompt_engineering.prompt_layout import PromptLayout
+
+
+# Herramientas, prefijo del prompt, selector y grafo compilado compartidos
+# por todos los agentes del proceso que usan el mismo LLM y checkpointer
+_shared_runtimes: Dict[Tuple[int, bool, int], Dict[str, Any]] = {}
+_shared_runtimes_lock = threading.Lock()
+
+# Respuesta de create_react_agent al agotar el límite de pasos del grafo
+STEP_LIMIT_MESSAGE = "Sorry, need more steps to process this request."
+# Respuesta al usuario cuando el grafo agota `max_iterations`
+STEP_LIMIT_RESPONSE = (
+    "No alcancé a completar la consulta en el número máximo de pasos. "
+    "¿Puedes concretarla un poco más (un destino, una fecha o un presupuesto)?"
+)
+
+
+def _turn_prompt(state: Dict[str, Any], config: RunnableConfig) -> List[BaseMessage]:
+    """Prompt de cada llamada al modelo: lo arma el agente del turno en curso"""
+    return config["configurable"]["turn_prompt"](state["messages"])
 
 
 class TouristicAgent:
     """Agente turístico con capacidades agénticas"""
     
-    def __init__(self, llm: Any, max_iterations: int = 10, memory_k: int = 10):
+    # Tiempo máximo para buscar una respuesta de respaldo tras agotar el plazo
+    FALLBACK_LOOKUP_TIMEOUT = 2.0
+    
+    def __init__(
+        self,
+        llm: Any,
+        max_iterations: int = 10,
+        memory_k: int = 10,
+        max_execution_time: Optional[float] = None,
+        max_history_tokens: int = 2000,
+        select_tools: bool = True,
+        max_history: int = 20
+    ):
         """
         Inicializar el agente turístico.
         
@@ -36,20 +96,69 @@ class TouristicAgent:
             llm: Modelo de lenguaje a utilizar
             max_iterations: Máximo número de iteraciones del agente
             memory_k: Número de mensajes a mantener en memoria (default: 10)
+            max_execution_time: Plazo en segundos de cada consulta (None = sin plazo)
+            max_history_tokens: Presupuesto de tokens del historial enviado en cada turno
+            select_tools: Enlazar al modelo solo las herramientas relevantes de cada consulta
+            max_history: Mensajes de diálogo que conserva el hilo de una sesión sin resumen
         """
         self.llm = llm
         self.max_iterations = max_iterations
         self.memory_k = memory_k
-        self.tools = self._setup_tools()
-        self.conversation_history: List[Dict[str, str]] = []
-        self.user_context: Dict[str, Any] = {}
-        # Sistema de memoria conversacional
-        self.chat_history = InMemoryChatMessageHistory()
-        self.agent_executor = self._create_agent_executor()
+        self.max_execution_time = max_execution_time
+        self.max_history_tokens = max_history_tokens
+        self.max_history = max_history
+        # Tokenizer del modelo con conteos cacheados por mensaje
+        self.token_counter = TokenCounter(getattr(llm, "model_name", None))
+        # Conversación de cada sesión, por hilo; el grafo en sí no guarda estado
+        self.checkpointer = get_checkpointer()
+        runtime = self._shared_runtime(select_tools)
+        self.tools = runtime["tools"]
+        # Prompt del sistema y esquemas de herramientas: prefijo fijo para la caché del proveedor
+        self.prompt_layout: PromptLayout = runtime["prompt_layout"]
+        # Subconjunto de herramientas por consulta (None = todas en cada llamada)
+        self.tool_selector: Optional[ToolSelector] = runtime["tool_selector"]
+        self.metrics_handler = MetricsCallbackHandler()
+        # Pasos del grafo y llamadas al LLM en la traza de la petición (si la hay)
+        self.tracing_handler = TracingCallbackHandler()
+        # Consultas de apertura idénticas comparten una sola ejecución
+        self.single_flight = SingleFlight()
+        # Caché semántica de respuestas de primer turno (la asigna ChatbotTouristico)
+        self.answer_cache: Optional[SemanticCache] = None
+        # Resumen incremental del historial (lo asigna ChatbotTouristico según memory.type)
+        self.summarizer: Optional[ConversationSummarizer] = None
+        # Consultas simples resueltas sin el ciclo ReAct (lo asigna ChatbotTouristico)
+        self.router: Optional[IntentRouter] = None
+        # Herramientas adelantadas por consulta (lo asigna ChatbotTouristico)
+        self.prefetcher: Optional[ToolPrefetcher] = None
+        # Memoria por defecto (modo consola); el servidor pasa la memoria de cada sesión
+        self.memory = SessionMemory(memory_k)
+        # Hilos de sesiones liberadas pendientes de borrar y tareas que los borran
+        self._pending_releases: Set[str] = set()
+        self._releases: Set[asyncio.Task] = set()
+        self.agent_executor = runtime["graph"]
+    
+    @property
+    def conversation_history(self) -> List[Dict[str, str]]:
+        """Historial de intercambios de la memoria por defecto"""
+        return self.memory.conversation_history
+    
+    @conversation_history.setter
+    def conversation_history(self, value: List[Dict[str, str]]) -> None:
+        self.memory.conversation_history = value
+    
+    @property
+    def user_context(self) -> Dict[str, Any]:
+        """Contexto del usuario de la memoria por defecto"""
+        return self.memory.user_context
+    
+    @user_context.setter
+    def user_context(self, value: Dict[str, Any]) -> None:
+        self.memory.user_context = value
     
     def _setup_tools(self) -> List:
         """Configurar las herramientas disponibles para el agente"""
-        return [
+        # Cada herramienta expone además una corrutina sobre un pool acotado
+        return as_async_tools([
             # Herramientas locales
             search_attractions,
             get_attraction_details,
@@ -66,100 +175,1056 @@ class TouristicAgent:
             # Herramientas de scraping de precios (más precisas)
             get_tour_price,
             list_all_tours_with_prices
-        ]
+        ])
+    
+    def _shared_runtime(self, select_tools: bool) -> Dict[str, Any]:
+        """
+        Obtener (o crear una vez por proceso) las herramientas y el grafo compilado.
+        
+        Crear un agente o una sesión nueva no vuelve a enlazar herramientas
+        ni a compilar el grafo; el estado de cada conversación vive en el
+        checkpointer, por `thread_id`.
+        """
+        key = (id(self.llm), select_tools, id(self.checkpointer))
+        with _shared_runtimes_lock:
+            runtime = _shared_runtimes.get(key)
+            if runtime is None:
+                self.tools = self._setup_tools()
+                self.prompt_layout = PromptLayout(self.tools)
+                self.tool_selector = ToolSelector(self.llm, self.tools) if select_tools else None
+                runtime = {
+                    # Referencia al LLM: su id no se reutiliza mientras viva la entrada
+                    "llm": self.llm,
+                    "tools": self.tools,
+                    "prompt_layout": self.prompt_layout,
+                    "tool_selector": self.tool_selector,
+                    "graph": self._create_agent_executor()
+                }
+                _shared_runtimes[key] = runtime
+            return runtime
     
     def _create_agent_executor(self) -> Any:
         """Crear el ejecutor del agente"""
-        # Crear agente reactivo con herramientas
-        # create_react_agent solo acepta model y tools como argumentos principales
+        # Crear agente reactivo con herramientas; el prompt de cada llamada
+        # lo arma el agente del turno a partir del hilo (`_layout`).
+        # Con selector, el modelo de cada paso se resuelve con las herramientas
+        # de la consulta; el nodo de herramientas conserva todas
         agent = create_react_agent(
-            self.llm,
-            self.tools
+            self.tool_selector or self.llm,
+            self.tools,
+            prompt=_turn_prompt,
+            checkpointer=self.checkpointer
         )
         
         return agent
     
-    def process_query(self, user_input: str) -> Dict[str, Any]:
+    def _run_config(self, memory: SessionMemory, turn: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Configuración de ejecución del grafo para un turno.
+        
+        Incluye los callbacks de instrumentación, el hilo de la sesión en el
+        checkpointer, el armado del prompt del turno y el límite de pasos:
+        cada iteración ReAct son dos pasos del grafo (modelo y herramientas),
+        más el paso de entrada y la respuesta final.
+        """
+        return {
+            "callbacks": [self.metrics_handler, self.tracing_handler],
+            "recursion_limit": 2 * max(self.max_iterations, 1) + 2,
+            "configurable": {
+                "thread_id": memory.thread_id,
+                "turn_prompt": functools.partial(self._layout, turn)
+            }
+        }
+    
+    @staticmethod
+    def _thread_config(memory: SessionMemory) -> Dict[str, Any]:
+        """Configuración para leer o actualizar el hilo de una sesión"""
+        return {"configurable": {"thread_id": memory.thread_id}}
+    
+    def release_thread(self, memory: SessionMemory) -> None:
+        """
+        Liberar el estado de una sesión desalojada o eliminada.
+        
+        Dentro del event loop el borrado no bloquea el loop ni corre junto a
+        un turno del hilo: queda pendiente y lo aplica quien tome primero el
+        lock del hilo, esta tarea o el próximo turno de la sesión.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.checkpointer.delete_thread(memory.thread_id)
+            return
+        self._pending_releases.add(memory.thread_id)
+        task = loop.create_task(self.arelease_thread(memory))
+        # Referencia fuerte hasta que termine (el loop solo guarda una débil)
+        self._releases.add(task)
+        task.add_done_callback(self._releases.discard)
+    
+    async def wait_released(self) -> None:
+        """Esperar los borrados de hilos programados por `release_thread`"""
+        if self._releases:
+            await asyncio.gather(*self._releases, return_exceptions=True)
+    
+    async def arelease_thread(self, memory: SessionMemory) -> None:
+        """Borrar el hilo de una sesión cuando no tenga un turno en curso"""
+        self._pending_releases.add(memory.thread_id)
+        # El turno en curso escribe su checkpoint al terminar: borrar antes lo reviviría
+        async with memory.lock:
+            await self._apply_release(memory)
+    
+    async def _apply_release(self, memory: SessionMemory) -> None:
+        """Aplicar el borrado pendiente del hilo (requiere el lock del hilo)"""
+        if memory.thread_id not in self._pending_releases:
+            return
+        self._pending_releases.discard(memory.thread_id)
+        try:
+            await self.checkpointer.adelete_thread(memory.thread_id)
+        except Exception as e:
+            Logger.warning(f"No se pudo borrar el hilo {memory.thread_id}: {e}")
+    
+    def _begin_turn(self, user_input: str, memory: SessionMemory) -> Dict[str, Any]:
+        """
+        Preparar un turno que ejecutará el grafo.
+        
+        Al grafo solo se envía el mensaje nuevo del usuario: el resto de la
+        conversación ya está en el hilo de la sesión.
+        
+        Returns:
+            Datos del turno: mensaje del usuario (con id propio), contexto
+            volátil, herramientas enlazadas y tokens del prompt (se miden
+            en la primera llamada al modelo)
+        """
+        tool_names = None
+        if self.tool_selector is not None:
+            tool_names = self.tool_selector.select(user_input, record=True)
+        return {
+            "human": HumanMessage(content=user_input, id=uuid.uuid4().hex),
+            "context": self.prompt_layout.context_message(memory.user_context),
+            "tool_names": tool_names,
+            "prompt_tokens": 0
+        }
+    
+    def _layout(self, turn: Dict[str, Any], messages: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        Construir los mensajes de una llamada al modelo a partir del hilo.
+        
+        El hilo no se modifica. De los turnos anteriores se envían solo las
+        preguntas y respuestas, recortadas a `max_history_tokens` medidos con
+        el tokenizer del modelo; del turno en curso, todos sus mensajes. El
+        orden sigue `PromptLayout`: prompt del sistema, resumen de los turnos
+        antiguos (si existe), historial, contexto volátil (hora,
+        preferencias) y el turno en curso, para que el historial forme parte
+        del prefijo cacheable en el turno siguiente.
+        
+        Args:
+            turn: Datos del turno (de `_begin_turn`)
+            messages: Mensajes del hilo
+        
+        Returns:
+            Mensajes para el modelo
+        """
+        with span("prepare_messages", "serialization") as current:
+            summary, conversation = split_summary(messages)
+            start = self._turn_start(conversation, turn["human"].id)
+            history = [m for m in conversation[:start] if is_dialogue(m)]
+            current_turn = conversation[start:]
+            history = trim_history(
+                history,
+                current_turn[0],
+                self.token_counter,
+                self.max_history_tokens - self.token_counter(summary + [turn["context"]])
+            )
+            prompt = summary + history[:-1] + [turn["context"]] + current_turn
+            
+            if len(current_turn) == 1:
+                # Primera llamada del turno: tamaño del prompt completo
+                turn["prompt_tokens"] = (
+                    self.prompt_layout.prefix_tokens(self.token_counter, turn["tool_names"])
+                    + self.token_counter(prompt)
+                )
+                PROMPT_TOKENS.observe(turn["prompt_tokens"])
+            if current is not None:
+                current.attrs.update(prompt_tokens=turn["prompt_tokens"], messages=len(prompt))
+        return [self.prompt_layout.system_message] + prompt
+    
+    @staticmethod
+    def _turn_start(messages: List[BaseMessage], human_id: Optional[str]) -> int:
+        """Posición del mensaje del usuario que abre el turno (o de la última pregunta)"""
+        for index in range(len(messages) - 1, -1, -1):
+            if messages[index].id == human_id:
+                return index
+        for index in range(len(messages) - 1, -1, -1):
+            if isinstance(messages[index], HumanMessage):
+                return index
+        return 0
+    
+    @staticmethod
+    def _turn_messages(messages: List[BaseMessage], human_id: str) -> List[BaseMessage]:
+        """Mensajes generados en un turno (después de su pregunta; vacío si no está)"""
+        for index in range(len(messages) - 1, -1, -1):
+            if messages[index].id == human_id:
+                return list(messages[index + 1:])
+        return []
+    
+    async def _flight_key(self, user_input: str, memory: SessionMemory) -> Optional[str]:
+        """
+        Clave de coalescencia para consultas de primer turno sin contexto.
+        
+        Returns:
+            Consulta normalizada, o None si la respuesta depende de la sesión
+        """
+        if memory.user_context or not await self._athread_is_new(memory):
+            return None
+        return self.single_flight.normalize(user_input) or None
+    
+    async def _athread_is_new(self, memory: SessionMemory) -> bool:
+        """La sesión aún no tiene turnos (tampoco en el hilo, p. ej. de antes de un reinicio)"""
+        if memory.turns:
+            return False
+        return await self.checkpointer.aget_tuple(self._thread_config(memory)) is None
+    
+    async def _lookup_answer(self, user_input: str, key: Optional[str]) -> Tuple[Optional[str], Any]:
+        """
+        Buscar la consulta en la caché de respuestas.
+        
+        Returns:
+            (respuesta cacheada o None, embedding para guardar la respuesta)
+        """
+        if key is None or self.answer_cache is None:
+            return None, None
+        with span("answer_cache", "cache") as current:
+            cached, vector = await self.answer_cache.alookup(user_input)
+            if current is not None:
+                current.attrs["hit"] = cached is not None
+        return cached, vector
+    
+    @staticmethod
+    def _complete(run: Dict[str, Any]) -> bool:
+        """
+        Indicar si una ejecución terminó con una respuesta completa.
+        
+        Una respuesta parcial (plazo vencido) o el aviso de pasos agotados
+        no se comparte con otras sesiones ni se guarda en la caché.
+        """
+        return not run.get("timed_out") and run["response"] != STEP_LIMIT_RESPONSE
+    
+    def _store_answer(self, user_input: str, response: str, vector: Any) -> None:
+        """Guardar una respuesta de primer turno en la caché"""
+        if self.answer_cache is not None and vector is not None:
+            self.answer_cache.store(user_input, response, vector)
+    
+    def _route(self, user_input: str) -> Optional[Route]:
+        """
+        Clasificar la consulta con el enrutador local.
+        
+        Returns:
+            La ruta, o None si la consulta sigue al agente
+        """
+        if self.router is None:
+            return None
+        route = self.router.route(user_input)
+        if route is None:
+            self.router.record(None)
+        return route
+    
+    async def _answer_locally(self, user_input: str, route: Route) -> Optional[str]:
+        """
+        Resolver una consulta enrutada con su herramienta.
+        
+        Returns:
+            Respuesta, o None si la herramienta no sirvió y la consulta sigue al agente
+        """
+        with span("router", "router") as current:
+            response = None
+            try:
+                response = await self.router.answer(user_input, route)
+            except Exception as e:
+                Logger.warning(f"Enrutador local: {route.tool} falló, se usa el agente: {e}")
+            if current is not None:
+                current.attrs["route"] = route.tool if response is not None else None
+        self.router.record(route if response is not None else None)
+        return response
+    
+    async def _acached_turn(self, user_input: str, response: str, memory: SessionMemory) -> Dict[str, Any]:
+        """Registrar un turno respondido sin ejecutar el grafo"""
+        human = HumanMessage(content=user_input, id=uuid.uuid4().hex)
+        messages = await self._aappend_turn(memory, human, response)
+        return self._record_turn(user_input, response, memory, messages)
+    
+    async def _aappend_turn(self, memory: SessionMemory, human: HumanMessage, response: str) -> List[BaseMessage]:
+        """
+        Agregar al hilo una pregunta y su respuesta.
+        
+        Returns:
+            Mensajes del hilo tras agregarlas
+        """
+        config = self._thread_config(memory)
+        state = await self.agent_executor.aget_state(config)
+        exchange = [human, AIMessage(content=response, id=uuid.uuid4().hex)]
+        await self.agent_executor.aupdate_state(config, {"messages": exchange}, as_node="agent")
+        return state.values.get("messages", []) + exchange
+    
+    @classmethod
+    def _answered(cls, messages: List[BaseMessage], human: HumanMessage, response: str) -> bool:
+        """El hilo ya termina el turno con la respuesta que vio el usuario"""
+        turn = cls._turn_messages(messages, human.id)
+        return (
+            bool(turn) and isinstance(turn[-1], AIMessage) and not turn[-1].tool_calls
+            and cls._content_text(turn[-1]) == response
+        )
+    
+    @staticmethod
+    def _rewritten_thread(
+        messages: List[BaseMessage],
+        human: HumanMessage,
+        response: Optional[str]
+    ) -> List[BaseMessage]:
+        """
+        Hilo con un turno tal como lo vio el usuario.
+        
+        Los mensajes intermedios del turno (p. ej. llamadas a herramientas
+        sin resultado de una ejecución cortada) se quitan: el hilo debe
+        seguir siendo válido para el modelo en el turno siguiente.
+        
+        Args:
+            messages: Mensajes actuales del hilo
+            human: Pregunta del turno
+            response: Respuesta mostrada, o None para descartar el turno
+        
+        Returns:
+            Mensajes del hilo reescrito (la misma lista si no hay cambios)
+        """
+        index = next((i for i, m in enumerate(messages) if m.id == human.id), None)
+        if index is None and response is None:
+            return messages
+        kept = list(messages if index is None else messages[:index])
+        if response is None:
+            return kept
+        return kept + [human, AIMessage(content=response, id=uuid.uuid4().hex)]
+    
+    async def _arewrite_turn(
+        self,
+        memory: SessionMemory,
+        human: HumanMessage,
+        response: Optional[str]
+    ) -> List[BaseMessage]:
+        """
+        Reescribir (o descartar, con `response=None`) un turno que no terminó normalmente.
+        
+        Returns:
+            Mensajes del hilo reescrito
+        """
+        config = self._thread_config(memory)
+        messages = (await self.agent_executor.aget_state(config)).values.get("messages", [])
+        thread = self._rewritten_thread(messages, human, response)
+        if not thread:
+            # El grafo no admite un hilo sin mensajes
+            await self.checkpointer.adelete_thread(memory.thread_id)
+        elif thread is not messages:
+            await self.agent_executor.aupdate_state(
+                config, {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES)] + thread}, as_node="agent"
+            )
+        return thread
+    
+    def _rewrite_turn(
+        self,
+        memory: SessionMemory,
+        human: HumanMessage,
+        response: Optional[str]
+    ) -> List[BaseMessage]:
+        config = self._thread_config(memory)
+        messages = self.agent_executor.get_state(config).values.get("messages", [])
+        thread = self._rewritten_thread(messages, human, response)
+        if not thread:
+            self.checkpointer.delete_thread(memory.thread_id)
+        elif thread is not messages:
+            self.agent_executor.update_state(
+                config, {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES)] + thread}, as_node="agent"
+            )
+        return thread
+    
+    async def _adiscard_turn(self, memory: SessionMemory, turn: Dict[str, Any]) -> None:
+        """Quitar del hilo un turno abandonado o fallido"""
+        try:
+            await self._arewrite_turn(memory, turn["human"], None)
+        except Exception as e:
+            Logger.warning(f"No se pudo descartar el turno incompleto: {e}")
+    
+    def _discard_turn(self, memory: SessionMemory, turn: Dict[str, Any]) -> None:
+        try:
+            self._rewrite_turn(memory, turn["human"], None)
+        except Exception as e:
+            Logger.warning(f"No se pudo descartar el turno incompleto: {e}")
+    
+    async def _afinish_turn(
+        self,
+        user_input: str,
+        response: str,
+        memory: SessionMemory,
+        turn: Dict[str, Any],
+        messages: Optional[List[BaseMessage]]
+    ) -> Dict[str, Any]:
+        """
+        Cerrar un turno que ejecutó el grafo.
+        
+        Si el hilo no termina con la respuesta mostrada (plazo vencido,
+        límite de pasos) el turno se reescribe con ella.
+        
+        Args:
+            messages: Mensajes del hilo al terminar la ejecución (None si se cortó)
+        """
+        if messages is None or not self._answered(messages, turn["human"], response):
+            messages = await self._arewrite_turn(memory, turn["human"], response)
+        return self._record_turn(user_input, response, memory, messages)
+    
+    def _finish_turn(
+        self,
+        user_input: str,
+        response: str,
+        memory: SessionMemory,
+        turn: Dict[str, Any],
+        messages: List[BaseMessage]
+    ) -> Dict[str, Any]:
+        if not self._answered(messages, turn["human"], response):
+            messages = self._rewrite_turn(memory, turn["human"], response)
+        return self._record_turn(user_input, response, memory, messages)
+    
+    def _take_compaction(self, memory: SessionMemory) -> Optional[Compaction]:
+        """Compactación lista para aplicar (None si no hay o el resumen sigue en curso)"""
+        pending = memory.compaction
+        if pending is None:
+            return None
+        if not isinstance(pending, Compaction):
+            if not pending.done():
+                return None
+            pending = None if pending.cancelled() else pending.result()
+        memory.compaction = None
+        return pending
+    
+    async def _acompact(self, memory: SessionMemory) -> None:
+        """Aplicar al hilo la compactación pendiente (al inicio de un turno, con el hilo libre)"""
+        compaction = self._take_compaction(memory)
+        if compaction is None:
+            return
+        config = self._thread_config(memory)
+        state = await self.agent_executor.aget_state(config)
+        update = compaction_update(state.values.get("messages", []), compaction)
+        if update is not None:
+            await self.agent_executor.aupdate_state(config, {"messages": update}, as_node="agent")
+    
+    def _compact(self, memory: SessionMemory) -> None:
+        compaction = self._take_compaction(memory)
+        if compaction is None:
+            return
+        config = self._thread_config(memory)
+        update = compaction_update(self.agent_executor.get_state(config).values.get("messages", []), compaction)
+        if update is not None:
+            self.agent_executor.update_state(config, {"messages": update}, as_node="agent")
+    
+    def _plan_compaction(self, memory: SessionMemory, messages: List[BaseMessage]) -> None:
+        """
+        Preparar la compactación del hilo tras un turno.
+        
+        Con resumen, los turnos antiguos se resumen en segundo plano (en el
+        servidor como tarea; en modo consola, sin event loop, en un hilo);
+        sin resumen, se descartan los que exceden `max_history`. En ambos
+        casos el hilo se actualiza al inicio del turno siguiente.
+        """
+        if memory.compaction is not None:
+            return
+        if self.summarizer is not None:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                memory.compaction = self.summarizer.submit(messages)
+                return
+            memory.compaction = self.summarizer.schedule(messages)
+            return
+        _, conversation = split_summary(messages)
+        # Se descarta hasta la mitad del máximo para no reescribir el hilo en cada turno
+        cut = fold_point(conversation, self.max_history, max(self.max_history // 2, 1))
+        if cut:
+            memory.compaction = Compaction([m.id for m in conversation[:cut]])
+    
+    async def _arun(
+        self,
+        turn: Dict[str, Any],
+        user_input: str,
+        memory: SessionMemory,
+        deadline: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Ejecutar el grafo sobre el hilo de la sesión dentro del plazo.
+        
+        Si el plazo vence, la ejecución se cancela y se responde con lo
+        obtenido hasta ese momento (o una respuesta de respaldo).
+        
+        Returns:
+            {"response": str, "usage": dict, "tool_calls": list, "timed_out": bool,
+            "messages": mensajes del hilo al terminar (None si se cortó)}
+        """
+        # Estado parcial visible aunque la ejecución se cancele
+        progress = {"messages": []}
+        run = asyncio.ensure_future(self._arun_graph(turn, user_input, progress, memory, deadline))
+        
+        try:
+            state = await asyncio.wait_for(run, timeout=self._time_left(deadline))
+            timed_out = False
+        except asyncio.TimeoutError:
+            state = progress
+            timed_out = True
+        
+        # Solo los mensajes generados en este turno
+        new_messages = self._turn_messages(state["messages"], turn["human"].id)
+        usage = self._empty_usage()
+        for message in new_messages:
+            if isinstance(message, AIMessage):
+                self._add_usage(usage, message)
+        
+        if timed_out:
+            tool_outputs = [self._display_text(m) for m in new_messages if isinstance(m, ToolMessage)]
+            response = await self._partial_answer(user_input, "", tool_outputs)
+        else:
+            response = self._extract_output(state)
+        return {
+            "response": response,
+            "usage": usage,
+            "tool_calls": self._tool_names(new_messages),
+            "timed_out": timed_out,
+            "messages": None if timed_out else state["messages"]
+        }
+    
+    async def _arun_graph(
+        self,
+        turn: Dict[str, Any],
+        user_input: str,
+        progress: Dict[str, Any],
+        memory: SessionMemory,
+        deadline: Optional[float]
+    ) -> Any:
+        """Ejecutar el grafo registrando cada estado intermedio en `progress`"""
+        # Tarea propia: el plazo y el prefetch se propagan al grafo y a las herramientas
+        set_deadline(deadline)
+        batch = self._start_prefetch(user_input, turn["tool_names"])
+        try:
+            with AGENT_RUNS_IN_FLIGHT.track_inprogress():
+                # Un solo checkpoint por turno, al terminar (o al cortarse) la ejecución
+                async for state in self.agent_executor.astream(
+                    {"messages": [turn["human"]]},
+                    config=self._run_config(memory, turn),
+                    stream_mode="values",
+                    durability="exit"
+                ):
+                    progress["messages"] = state["messages"]
+        finally:
+            self._finish_prefetch(batch)
+        return progress
+    
+    def _start_prefetch(self, user_input: str, tool_names: Optional[Tuple[str, ...]]) -> Optional[PrefetchBatch]:
+        """
+        Lanzar las herramientas que la consulta seguro necesitará.
+        
+        Solo se adelantan las que el modelo tendrá enlazadas en este turno
+        (`tool_names`, elegidas al preparar el turno; None = todas).
+        Debe llamarse en la tarea que ejecuta el grafo.
+        """
+        if self.prefetcher is None:
+            return None
+        return self.prefetcher.start(user_input, tool_names)
+    
+    def _finish_prefetch(self, batch: Optional[PrefetchBatch]) -> None:
+        """Cerrar el prefetch del turno (los resultados no usados se descartan)"""
+        if self.prefetcher is not None:
+            self.prefetcher.finish(batch)
+    
+    @staticmethod
+    def _time_left(deadline: Optional[float]) -> Optional[float]:
+        """Segundos restantes hasta el plazo (None = sin plazo)"""
+        left = remaining(deadline)
+        return None if left is None else max(left, 0.0)
+    
+    @staticmethod
+    def _display_text(message: Any) -> str:
+        """Versión para mostrar de un resultado de herramienta (el artefacto, si lo hay)"""
+        artifact = getattr(message, "artifact", None)
+        if isinstance(artifact, str):
+            return artifact
+        return str(getattr(message, "content", message))
+    
+    async def _partial_answer(self, user_input: str, streamed_text: str, tool_outputs: List[str]) -> str:
+        """
+        Construir la respuesta de una consulta que agotó su plazo.
+        
+        Prioridad: texto ya generado, resultados de herramientas obtenidos,
+        respuesta cacheada para una consulta similar y, por último, un aviso.
+        """
+        if streamed_text.strip():
+            AGENT_DEADLINE_EXCEEDED.inc(fallback="partial_text")
+            return streamed_text.rstrip() + "\n\n⏱️ _Respuesta incompleta: se agotó el tiempo de la consulta._"
+        
+        if tool_outputs:
+            AGENT_DEADLINE_EXCEEDED.inc(fallback="tool_results")
+            return (
+                "⏱️ No alcancé a completar la respuesta a tiempo. Esto es lo que encontré:\n\n"
+                + "\n\n".join(tool_outputs)
+            )
+        
+        if self.answer_cache is not None:
+            try:
+                cached, _ = await asyncio.wait_for(
+                    self.answer_cache.alookup(user_input),
+                    timeout=self.FALLBACK_LOOKUP_TIMEOUT
+                )
+            except Exception:
+                cached = None
+            if cached is not None:
+                AGENT_DEADLINE_EXCEEDED.inc(fallback="cache")
+                return cached
+        
+        AGENT_DEADLINE_EXCEEDED.inc(fallback="none")
+        return "⏱️ Tu consulta está tardando más de lo esperado. Por favor, intenta de nuevo en unos momentos o reformula tu pregunta."
+    
+    @staticmethod
+    def _content_text(message: Any) -> str:
+        """Texto de un mensaje"""
+        if not hasattr(message, 'content'):
+            return str(message)
+        content = message.content
+        # Si es una lista de dicts (formato de Google), extraer el texto
+        if isinstance(content, list) and len(content) > 0 and isinstance(content[0], dict):
+            return content[0].get('text', str(content))
+        return str(content)
+    
+    @classmethod
+    def _extract_output(cls, response: Any) -> str:
+        """Extraer el texto de la respuesta final del agente"""
+        output_text = ""
+        if isinstance(response, dict) and "messages" in response:
+            # Obtener el último mensaje que no sea del usuario
+            messages = response["messages"]
+            if messages:
+                output_text = cls._content_text(messages[-1])
+        elif isinstance(response, str):
+            output_text = response
+        else:
+            output_text = str(response)
+        if output_text == STEP_LIMIT_MESSAGE:
+            # El grafo agotó `max_iterations` con herramientas pendientes
+            AGENT_STEP_LIMIT.inc()
+            output_text = STEP_LIMIT_RESPONSE
+        return output_text
+    
+    def _record_turn(
+        self,
+        user_input: str,
+        output_text: str,
+        memory: SessionMemory,
+        messages: List[BaseMessage]
+    ) -> Dict[str, Any]:
+        """
+        Registrar un turno ya guardado en el hilo y construir el resultado.
+        
+        Args:
+            messages: Mensajes del hilo al cerrar el turno
+        """
+        memory.turns += 1
+        
+        # Guardar en historial de conversación (mantener últimos 10)
+        memory.conversation_history.append({
+            "user": user_input,
+            "assistant": output_text
+        })
+        
+        # Limitar historial a últimos 10 intercambios
+        if len(memory.conversation_history) > memory.memory_k:
+            memory.conversation_history = memory.conversation_history[-memory.memory_k:]
+        
+        self._plan_compaction(memory, messages)
+        
+        return {
+            "success": True,
+            "response": output_text,
+            "tool_calls": []
+        }
+    
+    @staticmethod
+    def _error_result(error: Exception) -> Dict[str, Any]:
+        """Construir el resultado de un error"""
+        return {
+            "success": False,
+            "error": str(error),
+            "response": "Disculpa, ocurrió un error procesando tu consulta. Por favor, intenta de nuevo."
+        }
+    
+    def process_query(self, user_input: str, memory: Optional[SessionMemory] = None) -> Dict[str, Any]:
         """
         Procesar una consulta del usuario.
         
         Args:
             user_input: Pregunta del usuario
+            memory: Memoria de la sesión (por defecto la del agente)
         
         Returns:
             Respuesta del agente
         """
+        memory = memory or self.memory
+        turn = None
         try:
-            # Agregar mensaje del usuario al historial
-            self.chat_history.add_user_message(user_input)
-            
-            # Obtener mensajes del historial y limitar a los últimos K mensajes
-            all_messages = self.chat_history.messages
-            
-            # Usar trim_messages para mantener solo los últimos K mensajes
-            # Esto mantiene el contexto reciente sin sobrecargar el modelo
-            trimmed_messages = trim_messages(
-                all_messages,
-                max_tokens=self.memory_k * 200,  # Aproximadamente K mensajes
-                strategy="last",
-                token_counter=len
-            )
+            self._compact(memory)
+            turn = self._begin_turn(user_input, memory)
             
-            # Agregar el mensaje actual
-            messages_to_send = list(trimmed_messages) + [HumanMessage(content=user_input)]
+            # Invocar el agente sobre el hilo; en modo síncrono el plazo
+            # solo acota las herramientas (las llamadas al LLM usan api_timeout)
+            with AGENT_RUNS_IN_FLIGHT.track_inprogress(), deadline_scope(self.max_execution_time):
+                state = self.agent_executor.invoke(
+                    {"messages": [turn["human"]]},
+                    config=self._run_config(memory, turn),
+                    durability="exit"
+                )
             
-            # Invocar el agente con el historial
-            response = self.agent_executor.invoke({
-                "messages": messages_to_send
-            })
+            new_messages = self._turn_messages(state["messages"], turn["human"].id)
+            usage = self._empty_usage()
+            for message in new_messages:
+                if isinstance(message, AIMessage):
+                    self._add_usage(usage, message)
+            usage["prompt_tokens"] = turn["prompt_tokens"]
             
-            # Extraer la respuesta del último mensaje
-            output_text = ""
-            if isinstance(response, dict) and "messages" in response:
-                # Obtener el último mensaje que no sea del usuario
-                messages = response["messages"]
-                if messages:
-                    last_message = messages[-1]
-                    # Manejar diferentes formatos de contenido
-                    if hasattr(last_message, 'content'):
-                        content = last_message.content
-                        # Si es una lista de dicts (formato de Google), extraer el texto
-                        if isinstance(content, list) and len(content) > 0 and isinstance(content[0], dict):
-                            output_text = content[0].get('text', str(content))
-                        else:
-                            output_text = str(content)
+            result = self._finish_turn(user_input, self._extract_output(state), memory, turn, state["messages"])
+            result["usage"] = usage
+            result["tool_calls"] = self._tool_names(new_messages)
+            return result
+        
+        except Exception as e:
+            if turn is not None:
+                self._discard_turn(memory, turn)
+            return self._error_result(e)
+    
+    async def aprocess_query(self, user_input: str, memory: Optional[SessionMemory] = None) -> Dict[str, Any]:
+        """
+        Procesar una consulta del usuario sin bloquear el event loop.
+        
+        Las llamadas al LLM son asíncronas y las herramientas síncronas se
+        ejecutan en el pool acotado de herramientas. La consulta completa
+        (incluida la espera por turnos previos de la sesión) está acotada por
+        `max_execution_time`; al vencer se responde con un resultado parcial.
+        
+        Args:
+            user_input: Pregunta del usuario
+            memory: Memoria de la sesión (por defecto la del agente)
+        
+        Returns:
+            Respuesta del agente
+        """
+        memory = memory or self.memory
+        deadline = deadline_after(self.max_execution_time)
+        try:
+            async with memory.lock:
+                await self._apply_release(memory)
+                await self._acompact(memory)
+                route = self._route(user_input)
+                routed = await self._answer_locally(user_input, route) if route is not None else None
+                if routed is not None:
+                    return {
+                        **(await self._acached_turn(user_input, routed, memory)),
+                        "usage": self._empty_usage(),
+                        "tool_calls": [route.tool],
+                        "routed": route.tool
+                    }
+                
+                key = await self._flight_key(user_input, memory)
+                cached, vector = await self._lookup_answer(user_input, key)
+                if cached is not None:
+                    return {**(await self._acached_turn(user_input, cached, memory)), "cached": True}
+                
+                turn = self._begin_turn(user_input, memory)
+                try:
+                    if key is None:
+                        run, shared = await self._arun(turn, user_input, memory, deadline), False
+                    else:
+                        run, shared = await self.single_flight.do(
+                            key, lambda: self._arun(turn, user_input, memory, deadline), self._complete
+                        )
+                    
+                    if shared:
+                        # La ejecución fue de otra sesión: aquí solo se agrega la respuesta
+                        self.single_flight.record_shared(run["usage"]["llm_calls"])
+                        result = await self._acached_turn(user_input, run["response"], memory)
                     else:
-                        output_text = str(last_message)
-            elif isinstance(response, str):
-                output_text = response
-            else:
-                output_text = str(response)
+                        if key is not None and self._complete(run):
+                            self._store_answer(user_input, run["response"], vector)
+                        result = await self._afinish_turn(user_input, run["response"], memory, turn, run["messages"])
+                except BaseException:
+                    # También si se cancela la consulta: el hilo no guarda turnos a medias
+                    await self._adiscard_turn(memory, turn)
+                    raise
+                
+                # Copia: el uso de una ejecución coalescida es compartido
+                result["usage"] = {**run["usage"], "prompt_tokens": turn["prompt_tokens"]}
+                result["tool_calls"] = list(run["tool_calls"])
+                if run["timed_out"]:
+                    result["timed_out"] = True
+                return result
+        
+        except Exception as e:
+            return self._error_result(e)
+    
+    async def astream_query(
+        self,
+        user_input: str,
+        memory: Optional[SessionMemory] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Procesar una consulta emitiendo eventos incrementales.
+        
+        Usa `astream_events` del grafo. Los eventos emitidos son:
+            - {"type": "token", "content": str}: fragmento de texto del modelo
+            - {"type": "tool_start", "tool": str, "content": str}: inicio de herramienta
+            - {"type": "tool_end", "tool": str, "display"?: str}: fin de herramienta
+              (`display`: ficha en markdown para mostrar, si la herramienta la genera)
+            - {"type": "final", "success": bool, "response": str, "usage": dict, ...}:
+              resultado final con el uso de tokens acumulado del turno
+              (`prompt_tokens`: tamaño estimado del prompt; `cached_tokens`:
+              tokens servidos desde la caché de prompts del proveedor)
+        
+        Si el consumidor abandona el stream, la ejecución del grafo se cancela
+        y el turno incompleto se descarta del hilo de la sesión. Si vence el plazo
+        (`max_execution_time`), la ejecución se cancela y el evento final trae
+        una respuesta parcial marcada con `timed_out: True`.
+        
+        Una consulta simple que resuelve el enrutador local no ejecuta el grafo:
+        se emiten los eventos de la herramienta y el final, marcado con
+        `routed: <herramienta>`.
+        
+        Una consulta de apertura idéntica a otra en curso, o similar a una ya
+        respondida (caché semántica), no ejecuta el grafo: se emite solo el
+        evento final, marcado con `coalesced: True` o `cached: True`.
+        
+        Args:
+            user_input: Pregunta del usuario
+            memory: Memoria de la sesión (por defecto la del agente)
+        
+        Yields:
+            Eventos del turno en curso
+        """
+        memory = memory or self.memory
+        deadline = deadline_after(self.max_execution_time)
+        async with memory.lock:
+            await self._apply_release(memory)
+            await self._acompact(memory)
+            route = self._route(user_input)
+            if route is not None:
+                # El progreso de la herramienta enrutada se emite mientras se ejecuta
+                yield {"type": "tool_start", "tool": route.tool, "content": f"Consultando {route.tool}…"}
+                routed = await self._answer_locally(user_input, route)
+                yield {"type": "tool_end", "tool": route.tool}
+                if routed is not None:
+                    result = await self._acached_turn(user_input, routed, memory)
+                    yield {
+                        "type": "final",
+                        **result,
+                        "usage": self._empty_usage(),
+                        "tool_calls": [route.tool],
+                        "routed": route.tool
+                    }
+                    return
             
-            # Guardar respuesta del asistente en memoria
-            self.chat_history.add_ai_message(output_text)
+            key = await self._flight_key(user_input, memory)
+            cached, vector = await self._lookup_answer(user_input, key)
+            if cached is not None:
+                result = await self._acached_turn(user_input, cached, memory)
+                yield {"type": "final", **result, "usage": self._empty_usage(), "cached": True}
+                return
             
-            # Guardar en historial de conversación (mantener últimos 10)
-            self.conversation_history.append({
-                "user": user_input,
-                "assistant": output_text
-            })
+            if key is not None:
+                shared = await self.single_flight.wait(key)
+                if shared is not None:
+                    self.single_flight.record_shared(shared["usage"]["llm_calls"])
+                    result = await self._acached_turn(user_input, shared["response"], memory)
+                    yield {"type": "final", **result, "usage": self._empty_usage(), "coalesced": True}
+                    return
             
-            # Limitar historial a últimos 10 intercambios
-            if len(self.conversation_history) > self.memory_k:
-                self.conversation_history = self.conversation_history[-self.memory_k:]
+            turn = self._begin_turn(user_input, memory)
+            completed = False
+            AGENT_RUNS_IN_FLIGHT.inc()
+            flight = self.single_flight.lead(key) if key is not None else nullcontext()
+            progress = {"usage": self._empty_usage(), "tool_outputs": []}
+            # El grafo corre en su propia tarea para poder cortarlo al vencer el plazo
+            queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+            pump = asyncio.ensure_future(
+                self._pump_events(self._astream_run(user_input, memory, turn, progress), queue, deadline)
+            )
+            streamed: List[str] = []
+            try:
+                with flight as future:
+                    while True:
+                        try:
+                            event = await asyncio.wait_for(queue.get(), timeout=self._time_left(deadline))
+                        except asyncio.TimeoutError:
+                            pump.cancel()
+                            await asyncio.wait({pump})
+                            response = await self._partial_answer(
+                                user_input, "".join(streamed), progress["tool_outputs"]
+                            )
+                            event = {
+                                "type": "final",
+                                **(await self._afinish_turn(user_input, response, memory, turn, None)),
+                                "usage": {**progress["usage"], "prompt_tokens": turn["prompt_tokens"]},
+                                "timed_out": True
+                            }
+                        
+                        if event is None:
+                            break
+                        if event["type"] == "token":
+                            streamed.append(event["content"])
+                        elif event["type"] == "final":
+                            completed = True
+                            if future is not None and event["success"] and self._complete(event):
+                                # Publicar el resultado con la misma forma que `_arun`: lo
+                                # leen tanto /chat como otros streams coalescidos
+                                future.set_result({
+                                    "response": event["response"],
+                                    "usage": event["usage"],
+                                    "tool_calls": list(event.get("tool_calls", [])),
+                                    "timed_out": False,
+                                    "messages": None
+                                })
+                                self._store_answer(user_input, event["response"], vector)
+                        yield event
+                        if completed:
+                            break
+            finally:
+                # Cancela la ejecución del grafo si el stream se abandonó
+                if not pump.done():
+                    pump.cancel()
+                    await asyncio.wait({pump})
+                AGENT_RUNS_IN_FLIGHT.dec()
+                if not completed:
+                    # Stream abandonado o cancelado antes de terminar
+                    await self._adiscard_turn(memory, turn)
+    
+    @staticmethod
+    async def _pump_events(events: AsyncIterator[Dict[str, Any]], queue: asyncio.Queue, deadline: Optional[float]) -> None:
+        """Trasladar los eventos del grafo a la cola (se ejecuta en su propia tarea)"""
+        # El plazo se propaga al grafo y a las herramientas desde esta tarea
+        set_deadline(deadline)
+        try:
+            async for event in events:
+                await queue.put(event)
+            await queue.put(None)
+        finally:
+            await events.aclose()
+    
+    async def _astream_run(
+        self,
+        user_input: str,
+        memory: SessionMemory,
+        turn: Dict[str, Any],
+        progress: Dict[str, Any]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Ejecutar el grafo en streaming (requiere el lock de la sesión).
+        
+        `progress` acumula el uso de tokens y los resultados de herramientas
+        para poder construir una respuesta parcial si se corta la ejecución.
+        """
+        batch = None
+        try:
+            final_state = None
+            tool_calls: List[str] = []
+            usage = progress["usage"]
             
-            return {
-                "success": True,
-                "response": output_text,
-                "tool_calls": []
-            }
+            batch = self._start_prefetch(user_input, turn["tool_names"])
+            async for event in self.agent_executor.astream_events(
+                {"messages": [turn["human"]]},
+                config=self._run_config(memory, turn),
+                version="v2",
+                durability="exit"
+            ):
+                kind = event["event"]
+                
+                if kind == "on_chat_model_stream":
+                    text = self._chunk_text(event["data"].get("chunk"))
+                    if text:
+                        yield {"type": "token", "content": text}
+                elif kind == "on_tool_start":
+                    tool_calls.append(event["name"])
+                    yield {
+                        "type": "tool_start",
+                        "tool": event["name"],
+                        "content": f"Consultando {event['name']}…"
+                    }
+                elif kind == "on_tool_end":
+                    output = event["data"].get("output")
+                    display = self._display_text(output)
+                    progress["tool_outputs"].append(display)
+                    if isinstance(getattr(output, "artifact", None), str):
+                        yield {"type": "tool_end", "tool": event["name"], "display": display}
+                    else:
+                        yield {"type": "tool_end", "tool": event["name"]}
+                elif kind == "on_chat_model_end":
+                    self._add_usage(usage, event["data"].get("output"))
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    # Fin del grafo raíz: contiene el estado final
+                    final_state = event["data"].get("output")
+            
+            usage["prompt_tokens"] = turn["prompt_tokens"]
+            messages = final_state.get("messages") if isinstance(final_state, dict) else None
+            result = await self._afinish_turn(user_input, self._extract_output(final_state), memory, turn, messages)
+            yield {"type": "final", **result, "usage": usage, "tool_calls": tool_calls}
         
         except Exception as e:
-            return {
-                "success": False,
-                "error": str(e),
-                "response": "Disculpa, ocurrió un error procesando tu consulta. Por favor, intenta de nuevo."
-            }
+            await self._adiscard_turn(memory, turn)
+            yield {"type": "final", **self._error_result(e)}
+        finally:
+            self._finish_prefetch(batch)
+    
+    @staticmethod
+    def _chunk_text(chunk: Any) -> str:
+        """Extraer el texto de un fragmento de mensaje en streaming"""
+        if chunk is None:
+            return ""
+        content = getattr(chunk, "content", "")
+        if isinstance(content, str):
+            return content
+        if isinstance(content, list):
+            return "".join(
+                part.get("text", "") if isinstance(part, dict) else str(part)
+                for part in content
+            )
+        return ""
+    
+    @staticmethod
+    def _empty_usage() -> Dict[str, int]:
+        """Contadores de uso de un turno"""
+        return {
+            "llm_calls": 0,
+            "input_tokens": 0,
+            "cached_tokens": 0,
+            "output_tokens": 0,
+            "total_tokens": 0,
+            "prompt_tokens": 0
+        }
+    
+    @staticmethod
+    def _tool_names(messages: List) -> List[str]:
+        """Herramientas pedidas por el modelo en los mensajes de un turno"""
+        return [
+            call["name"]
+            for message in messages if isinstance(message, AIMessage)
+            for call in message.tool_calls
+        ]
+    
+    @staticmethod
+    def _add_usage(usage: Dict[str, int], message: Any) -> None:
+        """Acumular el uso de tokens de una llamada al LLM"""
+        usage["llm_calls"] += 1
+        metadata = getattr(message, "usage_metadata", None)
+        if not metadata:
+            return
+        for key in ("input_tokens", "output_tokens", "total_tokens"):
+            usage[key] += metadata.get(key, 0)
+        # Tokens de entrada servidos desde la caché de prompts del proveedor
+        usage["cached_tokens"] += (metadata.get("input_token_details") or {}).get("cache_read", 0)
     
     def get_conversation_history(self) -> str:
         """Obtener historial de conversación formateado"""
@@ -170,21 +1235,23 @@ class TouristicAgent:
     
     def get_memory_summary(self) -> Dict[str, Any]:
         """Obtener resumen del estado de la memoria"""
+        messages = self.agent_executor.get_state(self._thread_config(self.memory)).values.get("messages", [])
+        _, conversation = split_summary(messages)
         return {
-            "total_messages": len(self.chat_history.messages),
+            "total_messages": len(conversation),
             "conversation_exchanges": len(self.conversation_history),
             "memory_limit": self.memory_k,
+            "summary": summary_text(messages),
             "messages_in_history": [
                 {"role": msg.type, "preview": str(msg.content)[:100]} 
-                for msg in self.chat_history.messages[-5:]  # Últimos 5 mensajes
+                for msg in conversation[-5:]  # Últimos 5 mensajes
             ]
         }
     
     def clear_memory(self) -> None:
         """Limpiar completamente la memoria de conversación"""
-        self.conversation_history = []
-        self.chat_history.clear()
-        self.user_context = {}
+        self.release_thread(self.memory)
+        self.memory.clear()
     
     def set_user_context(self, context: Dict[str, Any]) -> None:
         """
@@ -209,7 +1276,11 @@ class AgentBuilder:
     def create_agent(
         llm: Any,
         agent_type: str = "standard",
-        max_iterations: int = 10
+        max_iterations: int = 10,
+        max_execution_time: Optional[float] = None,
+        max_history_tokens: int = 2000,
+        select_tools: bool = True,
+        max_history: int = 20
     ) -> TouristicAgent:
         """
         Crear un agente turístico personalizado.
@@ -218,11 +1289,22 @@ class AgentBuilder:
             llm: Modelo de lenguaje
             agent_type: Tipo de agente ("standard", "expert", "budget")
             max_iterations: Máximo de iteraciones
+            max_execution_time: Plazo en segundos de cada consulta
+            max_history_tokens: Presupuesto de tokens del historial por turno
+            select_tools: Enlazar solo las herramientas relevantes de cada consulta
+            max_history: Mensajes de diálogo que conserva el hilo sin resumen
         
         Returns:
             Instancia del agente
         """
-        agent = TouristicAgent(llm, max_iterations)
+        agent = TouristicAgent(
+            llm,
+            max_iterations,
+            max_execution_time=max_execution_time,
+            max_history_tokens=max_history_tokens,
+            select_tools=select_tools,
+            max_history=max_history
+        )
         
         if agent_type == "expert":
             # Para expertos: más iteraciones y herramientas avanzadas
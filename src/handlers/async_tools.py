@@ -0,0 +1,253 @@
+"""
+Adaptadores asíncronos para las herramientas del agente.
+
+Las herramientas de `tools.py` y `rag_tools.py` son síncronas (usan
+`requests.get`, BeautifulSoup, FAISS). Para que el camino asíncrono del
+agente no bloquee el event loop, cada herramienta se expone también como
+corrutina que se ejecuta en un pool de hilos acotado y compartido.
+
+Cuando el modelo pide varias herramientas en un mismo paso, el nodo de
+herramientas del grafo ejecuta sus corrutinas a la vez, así que el paso
+dura lo que la herramienta más lenta. Cada llamada tiene además su propio
+timeout: si se agota, el modelo recibe un aviso en lugar del resultado y
+el paso no espera más por ella. Un hilo no se puede interrumpir, así que
+una llamada que ya estaba en ejecución sigue ocupando su hilo del pool
+hasta terminar; esas llamadas se cuentan en `chatbot_tool_calls_abandoned`
+y en `get_tool_pool_stats`. El texto que vuelve al modelo se recorta
+al presupuesto de tokens de la herramienta (ver `tool_output.py`). Si la
+llamada ya se adelantó por prefetch (ver `tool_prefetch.py`), se entrega
+ese resultado en lugar de ejecutar la herramienta otra vez.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional
+
+from langchain_core.tools import BaseTool, StructuredTool
+
+from src.agents.tool_prefetch import current_batch
+from src.handlers.tool_output import budgeted
+from src.utils.deadline import remaining
+from src.utils.metrics import TOOL_CALLS_ABANDONED, TOOL_ERRORS, TOOL_LATENCY, TOOL_TIMEOUTS
+from src.utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Pool compartido para herramientas síncronas
+_tool_executor: Optional[ThreadPoolExecutor] = None
+_tool_workers = 0
+_DEFAULT_MAX_WORKERS = 8
+
+# Timeouts por llamada a herramienta (segundos; None = sin límite propio)
+_default_tool_timeout: Optional[float] = None
+_tool_timeouts: Dict[str, float] = {}
+
+
+def get_tool_executor(max_workers: Optional[int] = None) -> ThreadPoolExecutor:
+    """
+    Obtener el pool de hilos compartido para herramientas síncronas.
+
+    Args:
+        max_workers: Tamaño del pool (solo aplica en la primera llamada)
+
+    Returns:
+        Executor acotado compartido por todas las sesiones
+    """
+    global _tool_executor, _tool_workers
+
+    if _tool_executor is None:
+        _tool_workers = max_workers or _DEFAULT_MAX_WORKERS
+        _tool_executor = ThreadPoolExecutor(
+            max_workers=_tool_workers,
+            thread_name_prefix="agent-tool"
+        )
+
+    return _tool_executor
+
+
+def get_tool_pool_stats() -> Dict[str, int]:
+    """
+    Estado del pool de herramientas.
+
+    Returns:
+        Tamaño del pool y llamadas abandonadas por timeout que siguen en ejecución
+    """
+    get_tool_executor()
+    return {
+        "workers": _tool_workers,
+        "abandoned": int(TOOL_CALLS_ABANDONED.total())
+    }
+
+
+def configure_tool_timeouts(default: Optional[float], overrides: Optional[Dict[str, float]] = None) -> None:
+    """
+    Configurar los timeouts de las herramientas.
+
+    Args:
+        default: Timeout de cualquier herramienta (None = sin límite propio)
+        overrides: Timeouts específicos por nombre de herramienta
+    """
+    global _default_tool_timeout, _tool_timeouts
+
+    _default_tool_timeout = default
+    _tool_timeouts = dict(overrides or {})
+
+
+def get_tool_timeout(name: str) -> Optional[float]:
+    """
+    Timeout de una llamada a herramienta, acotado por el plazo de la consulta.
+
+    Returns:
+        Segundos disponibles para la llamada, o None si no hay límite
+    """
+    timeout = _tool_timeouts.get(name, _default_tool_timeout)
+    left = remaining()
+    if left is not None:
+        timeout = left if timeout is None else min(timeout, left)
+    return None if timeout is None else max(timeout, 0.0)
+
+
+def _timeout_message(name: str, timeout: float) -> str:
+    """Resultado que recibe el modelo cuando una herramienta no respondió a tiempo"""
+    TOOL_TIMEOUTS.inc(tool=name)
+    return (
+        f"La herramienta {name} no respondió en {timeout:g} s. "
+        "Responde con la información disponible e indica que ese dato no se pudo consultar."
+    )
+
+
+def _submit(func: Any, **kwargs: Any) -> Future:
+    """Enviar una llamada al pool copiando el contexto de la petición"""
+    ctx = contextvars.copy_context()
+    return get_tool_executor().submit(ctx.run, func, **kwargs)
+
+
+def _abandon(name: str, future: Future) -> None:
+    """
+    Soltar una llamada cuyo timeout se agotó.
+
+    Si aún esperaba un hilo libre se cancela; si ya se estaba ejecutando
+    sigue ocupando su hilo hasta terminar y se cuenta como abandonada.
+    """
+    if future.cancel() or future.done():
+        return
+    TOOL_CALLS_ABANDONED.inc(tool=name)
+    logger.warning(
+        "La herramienta %s superó su timeout y sigue ocupando un hilo del pool (%d abandonadas, %d hilos)",
+        name, int(TOOL_CALLS_ABANDONED.total()), _tool_workers
+    )
+    future.add_done_callback(lambda _: TOOL_CALLS_ABANDONED.dec(tool=name))
+
+
+async def run_in_tool_executor(func: Any, *args: Any, **kwargs: Any) -> Any:
+    """
+    Ejecutar una función síncrona en el pool de herramientas.
+
+    El contexto (contextvars) se copia al hilo para que la información de
+    la petición actual siga disponible dentro de la herramienta.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_tool_executor(), call)
+
+
+def as_async_tool(sync_tool: BaseTool) -> BaseTool:
+    """
+    Envolver una herramienta síncrona para que tenga versión asíncrona.
+
+    Si la herramienta ya define una corrutina se devuelve sin cambios.
+    Ambas versiones registran latencia y errores por herramienta, respetan
+    el timeout de la herramienta y recortan su texto al presupuesto. Un
+    hilo no se puede interrumpir: al agotarse el timeout la llamada termina
+    en segundo plano ocupando su hilo (ver `_abandon`); sus peticiones de
+    red ya están acotadas por el plazo de la consulta.
+
+    Args:
+        sync_tool: Herramienta creada con @tool
+
+    Returns:
+        Herramienta con `func` síncrona y `coroutine` sobre el pool acotado
+    """
+    if not isinstance(sync_tool, StructuredTool) or sync_tool.coroutine is not None:
+        return sync_tool
+
+    name = sync_tool.name
+    func = _instrumented(name, sync_tool.func)
+    with_artifact = sync_tool.response_format == "content_and_artifact"
+
+    def _timed_out(timeout: float) -> Any:
+        message = _timeout_message(name, timeout)
+        return (message, None) if with_artifact else message
+
+    def _call(**kwargs: Any) -> Any:
+        with span(name, "tool", args=kwargs):
+            timeout = get_tool_timeout(name)
+            if timeout is None:
+                return budgeted(name, func(**kwargs))
+            future = _submit(func, **kwargs)
+            try:
+                return budgeted(name, future.result(timeout=timeout))
+            except FutureTimeoutError:
+                _abandon(name, future)
+                return _timed_out(timeout)
+
+    async def _acall(**kwargs: Any) -> Any:
+        # El span incluye la espera por un hilo libre del pool
+        with span(name, "tool", args=kwargs) as current:
+            timeout = get_tool_timeout(name)
+            batch = current_batch()
+            prefetched = batch.claim(name, kwargs) if batch is not None else None
+            if prefetched is not None:
+                if current is not None:
+                    current.attrs["prefetched"] = True
+                # Resultado adelantado (ya recortado); shield: otra llamada puede esperarlo
+                try:
+                    return await asyncio.wait_for(asyncio.shield(prefetched), timeout=timeout)
+                except asyncio.TimeoutError:
+                    return _timed_out(timeout)
+            if timeout is None:
+                return budgeted(name, await run_in_tool_executor(func, **kwargs))
+            future = _submit(func, **kwargs)
+            try:
+                result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+            except asyncio.TimeoutError:
+                _abandon(name, future)
+                return _timed_out(timeout)
+            return budgeted(name, result)
+
+    return StructuredTool(
+        name=sync_tool.name,
+        description=sync_tool.description,
+        args_schema=sync_tool.args_schema,
+        return_direct=sync_tool.return_direct,
+        response_format=sync_tool.response_format,
+        func=_call,
+        coroutine=_acall
+    )
+
+
+def _instrumented(name: str, func: Any) -> Any:
+    """Envolver la implementación de una herramienta con métricas"""
+
+    @functools.wraps(func)
+    def _call(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            with span(f"exec {name}", "tool.exec"):
+                return func(*args, **kwargs)
+        except Exception:
+            TOOL_ERRORS.inc(tool=name)
+            raise
+        finally:
+            TOOL_LATENCY.observe(time.perf_counter() - start, tool=name)
+
+    return _call
+
+
+def as_async_tools(tools: List[BaseTool]) -> List[BaseTool]:
+    """Envolver una lista de herramientas con `as_async_tool`"""
+    return [as_async_tool(t) for t in tools]
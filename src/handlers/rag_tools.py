@@ -1,10 +1,13 @@
 """
 Herramientas RAG para búsqueda web híbrida
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from langchain_core.tools import tool
 from src.rag.web_loader import HuarazWebRAG, format_search_results
 from src.rag.price_scraper import get_scraper, HuarazPriceScraper
+from src.rag.data_version import current_version
+from src.handlers.tool_cache import cached_tool
+from src.handlers.tool_output import content_of
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,81 +31,94 @@ def get_rag_instance() -> HuarazWebRAG:
     return _rag_instance
 
 
-@tool
-def get_tour_price(tour_name: str) -> str:
+def _complete_tours_result(result: Tuple[str, str]) -> bool:
+    """No cachear errores ni resultados de un scraping incompleto"""
+    return not content_of(result).startswith("Error") and not get_scraper().partial
+
+
+def _search_ok(result: str) -> bool:
+    """No cachear errores ni respuestas sin índice disponible"""
+    return not result.startswith(("⚠️", "Error"))
+
+
+@tool(response_format="content_and_artifact")
+@cached_tool(version=current_version, cache_if=_complete_tours_result)
+def get_tour_price(tour_name: str) -> Tuple[str, str]:
     """
     Obtener información completa de un tour específico desde huarazturismo.com.
-    Incluye precio actualizado, duración, qué incluye, y enlace clickeable para más detalles.
+    Incluye precio actualizado, duración, qué incluye, enlace para más detalles y contacto de reservas.
     
     Args:
         tour_name: Nombre del tour o destino (ej: "laguna 69", "pastoruri", "paquete 3d", "trekking santa cruz")
     
     Returns:
-        Información detallada del tour con enlace clickeable para ver detalles completos
+        Datos del tour en formato clave: valor (la ficha con enlace se muestra al usuario aparte)
     """
     try:
         scraper = get_scraper()
         
-        # Si no hay datos en caché, hacer scraping
-        if not scraper.tours:
-            logger.info("Realizando scraping de tours...")
-            scraper.scrape_all_tours()
-            scraper.save_to_cache()
+        # Si no hay datos (o el último scraping quedó incompleto), hacer scraping
+        scraper.refresh()
         
         # Buscar el tour
         tour = scraper.get_tour_by_name(tour_name)
         
         if tour:
+            compact = scraper.compact_tour_info(tour)
             formatted = scraper.format_tour_info(tour, include_html_link=True)
             
             # Si no tiene descripción completa, agregar nota
             if not tour.description or len(tour.description) < 50:
                 formatted += "\n💡 **Tip**: Para más detalles específicos sobre este destino, pregúntame sobre características, altitud, mejor época para visitar, etc.\n"
             
-            return formatted
+            return compact, formatted
         else:
             # Intentar búsqueda más amplia
             results = scraper.search_tours(tour_name)
             if results:
+                compact = scraper.compact_tour_info(results[0])
                 formatted = scraper.format_tour_info(results[0], include_html_link=True)
                 if len(results) > 1:
+                    compact += f"\notros_relacionados: {len(results)-1}"
                     formatted += f"\n\n📌 También encontré {len(results)-1} tour(es) relacionado(s). ¿Quieres ver más opciones?\n"
-                return formatted
+                return compact, formatted
             else:
-                return f"No encontré información específica sobre '{tour_name}'.\n\n✅ Tours disponibles: laguna 69, pastoruri, llanganuco, chavin, paron, churup, santa cruz, entre otros.\n\n💡 Tip: Usa list_all_tours_with_prices() para ver todos los tours."
+                message = f"No encontré información específica sobre '{tour_name}'.\n\n✅ Tours disponibles: laguna 69, pastoruri, llanganuco, chavin, paron, churup, santa cruz, entre otros.\n\n💡 Tip: Usa list_all_tours_with_prices() para ver todos los tours."
+                return message, message
     
     except Exception as e:
         logger.error(f"Error obteniendo precio: {str(e)}")
-        return f"Error al buscar información del tour. Por favor intenta con otro nombre o consulta la lista completa de tours."
+        message = f"Error al buscar información del tour. Por favor intenta con otro nombre o consulta la lista completa de tours."
+        return message, message
 
 
-@tool
-def list_all_tours_with_prices() -> str:
+@tool(response_format="content_and_artifact")
+@cached_tool(version=current_version, cache_if=_complete_tours_result)
+def list_all_tours_with_prices() -> Tuple[str, str]:
     """
     Listar TODOS los tours, paquetes y trekking organizados por categoría.
     Muestra: Paquetes Turísticos (varios días), Tours Diarios (full day), y Trekking.
     Incluye precios y duraciones actualizadas.
     
     Returns:
-        Lista completa categorizada con precios actualizados desde huarazturismo.com
+        Una línea por tour (tipo | tour | precio | duración) con precios de huarazturismo.com
     """
     try:
         scraper = get_scraper()
         
-        # Si no hay datos, hacer scraping
-        if not scraper.tours:
-            logger.info("Realizando scraping de tours...")
-            scraper.scrape_all_tours()
-            scraper.save_to_cache()
+        # Si no hay datos (o el último scraping quedó incompleto), hacer scraping
+        scraper.refresh()
         
-        return scraper.get_all_tours_summary()
+        return scraper.get_all_tours_compact(), scraper.get_all_tours_summary()
     
     except Exception as e:
         logger.error(f"Error listando tours: {str(e)}")
-        return f"Error al obtener lista de tours: {str(e)}"
+        message = f"Error al obtener lista de tours: {str(e)}"
+        return message, message
 
 
 @tool
+@cached_tool(version=current_version, cache_if=_search_ok)
 def search_web_tourism_info(query: str, max_results: int = 3) -> str:
     """
     Buscar información de turismo en páginas web externas de Huaraz.
@@ -0,0 +1,187 @@
+"""
+Caché de resultados de herramientas compartida entre sesiones.
+
+Muchas herramientas son funciones puras de datos estáticos o que cambian
+poco (base de conocimiento, snapshot de tours, índice FAISS). El
+decorador `cached_tool` guarda su resultado indexado por los argumentos
+normalizados y por la versión de los datos de los que depende; cuando la
+versión cambia las entradas anteriores dejan de usarse y salen por LRU.
+Cada llamada recibe su propia copia del resultado: una sesión que modifica
+el diccionario o la lista devuelta no altera lo que reciben las demás.
+
+Uso (debajo de @tool, para que el esquema se genere de la función original):
+
+    @tool
+    @cached_tool(version=knowledge_version)
+    def get_altitude_advice() -> Dict[str, Any]:
+        ...
+"""
+import copy
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from src.utils.metrics import metrics
+
+TOOL_CACHE_LOOKUPS = metrics.counter(
+    "chatbot_tool_cache_lookups_total", "Consultas a la caché de resultados de herramientas", ["tool", "result"]
+)
+
+
+class ToolResultCache:
+    """Caché LRU de resultados con vigencia opcional por entrada"""
+
+    def __init__(self, max_entries: int = 2048):
+        """
+        Inicializar la caché.
+
+        Args:
+            max_entries: Resultados máximos; se descartan los menos usados
+        """
+        self.max_entries = max_entries
+        self.enabled = True
+        # clave -> (resultado, vence en time.monotonic o None)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = defaultdict(int)
+        self.misses: Dict[str, int] = defaultdict(int)
+        self.evictions = 0
+
+    def get(self, tool: str, key: Hashable) -> Tuple[bool, Any]:
+        """
+        Buscar un resultado.
+
+        Returns:
+            (encontrado, resultado)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits[tool] += 1
+                TOOL_CACHE_LOOKUPS.inc(tool=tool, result="hit")
+                return True, entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses[tool] += 1
+        TOOL_CACHE_LOOKUPS.inc(tool=tool, result="miss")
+        return False, None
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Guardar un resultado (ttl en segundos, None = mientras no cambie la versión)"""
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Vaciar la caché"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = sum(self.hits.values())
+            misses = sum(self.misses.values())
+            per_tool = {
+                tool: {"hits": self.hits.get(tool, 0), "misses": self.misses.get(tool, 0)}
+                for tool in sorted(set(self.hits) | set(self.misses))
+            }
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+                "evictions": self.evictions,
+                "tools": per_tool
+            }
+
+
+# Caché compartida del proceso
+_tool_cache = ToolResultCache()
+
+
+def get_tool_cache() -> ToolResultCache:
+    """Obtener la caché de resultados compartida"""
+    return _tool_cache
+
+
+def configure_tool_cache(enabled: bool = True, max_entries: int = 2048) -> None:
+    """
+    Configurar la caché de resultados compartida.
+
+    Args:
+        enabled: Si es False las herramientas se ejecutan siempre
+        max_entries: Resultados máximos en memoria
+    """
+    with _tool_cache._lock:
+        _tool_cache.enabled = enabled
+        _tool_cache.max_entries = max_entries
+
+
+def _normalize(value: Any) -> Hashable:
+    """Forma canónica de un argumento (las herramientas no distinguen mayúsculas)"""
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), _normalize(v)) for k, v in value.items()))
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def cached_tool(
+    version: Callable[[], str] = lambda: "",
+    ttl: Optional[float] = None,
+    cache_if: Optional[Callable[[Any], bool]] = None
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Cachear el resultado de una herramienta entre sesiones.
+
+    Args:
+        version: Función que devuelve la versión de los datos de la herramienta
+        ttl: Segundos de vigencia de cada resultado (None = sin vencimiento)
+        cache_if: Filtro de resultados cacheables (p. ej. descartar errores)
+
+    Returns:
+        Decorador que conserva la firma y el docstring de la función
+    """
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        signature = inspect.signature(func)
+        name = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _tool_cache.enabled:
+                return func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = tuple((k, _normalize(v)) for k, v in bound.arguments.items())
+
+            found, result = _tool_cache.get(name, (name, arguments, version()))
+            if found:
+                # Copia por llamada (inmediata para textos, el caso habitual)
+                return copy.deepcopy(result)
+
+            result = func(*args, **kwargs)
+            if cache_if is None or cache_if(result):
+                # La versión se recalcula: la herramienta pudo publicar datos nuevos
+                _tool_cache.put((name, arguments, version()), copy.deepcopy(result), ttl)
+            return result
+
+        return wrapper
+
+    return decorator
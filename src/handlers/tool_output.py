@@ -0,0 +1,120 @@
+"""
+Salida de herramientas para el modelo y para el usuario.
+
+Las herramientas que generan texto pensado para mostrarse (tours, clima)
+usan `response_format="content_and_artifact"` y devuelven dos versiones:
+
+    (contenido compacto en líneas "clave: valor", markdown para mostrar)
+
+El contenido compacto es lo único que vuelve al prompt como ToolMessage;
+el markdown con iconos, enlaces HTML y datos de reserva viaja como
+artefacto y solo se usa para mostrar (enrutador local, eventos de
+streaming). Además, el texto que recibe el modelo de cualquier
+herramienta se recorta a un presupuesto de tokens por herramienta.
+"""
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from src.agents.token_budget import TokenCounter
+from src.utils.metrics import metrics
+from src.utils.tracing import span
+
+TOOL_OUTPUT_TOKENS = metrics.histogram(
+    "chatbot_tool_output_tokens",
+    "Tokens del resultado de herramienta enviado al modelo",
+    ["tool"],
+    buckets=(25, 50, 100, 200, 400, 800, 1600)
+)
+TOOL_OUTPUT_TRUNCATIONS = metrics.counter(
+    "chatbot_tool_output_truncations_total", "Resultados de herramienta recortados por presupuesto", ["tool"]
+)
+
+TRUNCATION_NOTE = "[recortado: pide un dato más específico si lo necesitas]"
+
+# Presupuesto de tokens por resultado (None = sin límite)
+_default_budget: Optional[int] = 600
+_budgets: Dict[str, int] = {}
+_counter = TokenCounter()
+
+
+def configure_tool_output(default_tokens: Optional[int] = 600, overrides: Optional[Dict[str, int]] = None) -> None:
+    """
+    Configurar el presupuesto de tokens de los resultados de herramientas.
+
+    Args:
+        default_tokens: Presupuesto de cualquier herramienta (None = sin límite)
+        overrides: Presupuestos específicos por nombre de herramienta
+    """
+    global _default_budget, _budgets
+
+    _default_budget = default_tokens
+    _budgets = dict(overrides or {})
+
+
+def key_values(fields: Iterable[Tuple[str, Any]]) -> str:
+    """
+    Formato compacto "clave: valor" (se omiten los valores vacíos).
+
+    Las listas se unen con "; " y los saltos de línea se colapsan.
+    """
+    lines = []
+    for key, value in fields:
+        if isinstance(value, (list, tuple)):
+            value = "; ".join(str(v) for v in value if v)
+        if value is None or value == "":
+            continue
+        lines.append(f"{key}: {' '.join(str(value).split())}")
+    return "\n".join(lines)
+
+
+def fit_budget(name: str, content: str) -> str:
+    """
+    Recortar el texto de una herramienta a su presupuesto de tokens.
+
+    Se conservan líneas completas desde el inicio (los formatos compactos
+    ponen primero los datos principales).
+
+    Args:
+        name: Nombre de la herramienta
+        content: Texto que recibirá el modelo
+
+    Returns:
+        El texto sin cambios o recortado con una nota al final
+    """
+    budget = _budgets.get(name, _default_budget)
+    tokens = _counter.count_text(content)
+    if budget is None or tokens <= budget:
+        TOOL_OUTPUT_TOKENS.observe(tokens, tool=name)
+        return content
+
+    available = budget - _counter.count_text(TRUNCATION_NOTE)
+    kept, used = [], 0
+    for line in content.splitlines():
+        cost = _counter.count_text(line) + 1
+        if used + cost > available:
+            if not kept:
+                # Una sola línea larga: se corta por caracteres (~4 por token)
+                kept.append(line[:max(available, 0) * 4])
+            break
+        kept.append(line)
+        used += cost
+
+    TOOL_OUTPUT_TRUNCATIONS.inc(tool=name)
+    TOOL_OUTPUT_TOKENS.observe(budget, tool=name)
+    return "\n".join(kept + [TRUNCATION_NOTE])
+
+
+def content_of(result: Any) -> Any:
+    """Contenido para el modelo de un resultado con o sin artefacto"""
+    if isinstance(result, tuple) and len(result) == 2:
+        return result[0]
+    return result
+
+
+def budgeted(name: str, result: Any) -> Any:
+    """Aplicar el presupuesto al contenido de texto de un resultado"""
+    with span("tool_output", "serialization", tool=name):
+        if isinstance(result, tuple) and len(result) == 2 and isinstance(result[0], str):
+            return fit_budget(name, result[0]), result[1]
+        if isinstance(result, str):
+            return fit_budget(name, result)
+        return result
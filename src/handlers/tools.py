@@ -1,15 +1,39 @@
 """
 Herramientas para el Agente Turístico
 """
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from langchain_core.tools import tool
 from data.knowledge.huaraz_knowledge import HuarazKnowledgeBase, Attraction
 import requests
 import os
 from datetime import datetime
+from src.handlers.tool_cache import cached_tool
+from src.handlers.tool_output import content_of, key_values
+from src.utils.deadline import timeout_for
+from src.utils.tracing import span
+
+
+def knowledge_version() -> str:
+    """Versión de la base de conocimiento local"""
+    return f"kb-{HuarazKnowledgeBase.REVISION}"
+
+
+def _weather_ok(result: Tuple[str, str]) -> bool:
+    """Solo se cachean respuestas del clima sin error"""
+    return not content_of(result).startswith(("⚠️", "Error"))
+
+
+# Clima típico para el modelo cuando no hay datos en tiempo real
+TYPICAL_WEATHER = key_values([
+    ("altitud", "3052 msnm"),
+    ("temporada_seca", "mayo-octubre; días soleados 18-22°C, noches 5-8°C, lluvias mínimas"),
+    ("temporada_lluvias", "noviembre-abril; lluvias por la tarde, 15-20°C"),
+    ("nota", "gran diferencia térmica entre día y noche; llevar ropa abrigada"),
+])
 
 
 @tool
+@cached_tool(version=knowledge_version)
 def search_attractions(query: str, difficulty: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Buscar atracciones turísticas en Huaraz.
@@ -46,6 +70,7 @@ def search_attractions(query: str, difficulty: Optional[str] = None) -> List[Dic
 
 
 @tool
+@cached_tool(version=knowledge_version)
 def get_attraction_details(attraction_name: str) -> Dict[str, Any]:
     """
     Obtener detalles completos de una atracción.
@@ -78,6 +103,7 @@ def get_attraction_details(attraction_name: str) -> Dict[str, Any]:
 
 
 @tool
+@cached_tool(version=knowledge_version)
 def get_activity_recommendations(activity_type: str, difficulty: Optional[str] = None) -> Dict[str, Any]:
     """
     Obtener recomendaciones de actividades.
@@ -103,6 +129,7 @@ def get_activity_recommendations(activity_type: str, difficulty: Optional[str] =
 
 
 @tool
+@cached_tool(version=knowledge_version)
 def search_accommodations(budget: str, location: str = "Huaraz") -> List[Dict[str, str]]:
     """
     Buscar alojamientos según presupuesto.
@@ -124,6 +151,7 @@ def search_accommodations(budget: str, location: str = "Huaraz") -> List[Dict[st
 
 
 @tool
+@cached_tool(version=knowledge_version)
 def get_best_season(travel_style: str) -> Dict[str, Any]:
     """
     Obtener la mejor época para viajar según estilo de viaje.
@@ -164,6 +192,7 @@ def get_best_season(travel_style: str) -> Dict[str, Any]:
 
 
 @tool
+@cached_tool(version=knowledge_version)
 def get_altitude_advice() -> Dict[str, Any]:
     """
     Obtener consejos para evitar el mal de altura.
@@ -195,6 +224,7 @@ def get_altitude_advice() -> Dict[str, Any]:
 
 
 @tool
+@cached_tool(version=knowledge_version)
 def create_daily_itinerary(attractions: List[str], duration_hours: int) -> Dict[str, Any]:
     """
     Crear un itinerario diario basado en atracciones.
@@ -236,8 +266,9 @@ def create_daily_itinerary(attractions: List[str], duration_hours: int) -> Dict[
     }
 
 
-@tool
-def get_current_weather(location: str = "Huaraz") -> str:
+@tool(response_format="content_and_artifact")
+@cached_tool(ttl=600, cache_if=_weather_ok)
+def get_current_weather(location: str = "Huaraz") -> Tuple[str, str]:
     """
     Obtiene el clima actual en tiempo real de Huaraz, Perú.
     Incluye temperatura, sensación térmica, humedad, viento, y descripción del clima.
@@ -246,7 +277,7 @@ def get_current_weather(location: str = "Huaraz") -> str:
         location: Ciudad (default: "Huaraz")
     
     Returns:
-        Información detallada del clima actual
+        Clima actual en formato clave: valor
     """
     try:
         # API Key de OpenWeatherMap (requiere configuración en .env)
@@ -254,7 +285,7 @@ def get_current_weather(location: str = "Huaraz") -> str:
         
         if not api_key:
             # Información estática si no hay API key
-            return """🌤️ **Clima en Huaraz, Perú**
+            return "tiempo_real: no disponible\n" + TYPICAL_WEATHER, """🌤️ **Clima en Huaraz, Perú**
 
 📍 **Ubicación**: 3,052 msnm
 🌡️ **Temperatura promedio**: 
@@ -278,7 +309,8 @@ def get_current_weather(location: str = "Huaraz") -> str:
             "lang": "es"
         }
         
-        response = requests.get(base_url, params=params, timeout=10)
+        with span("http GET api.openweathermap.org", "io", url=base_url):
+            response = requests.get(base_url, params=params, timeout=timeout_for(10))
         response.raise_for_status()
         
         data = response.json()
@@ -319,10 +351,21 @@ def get_current_weather(location: str = "Huaraz") -> str:
 - Hidratación constante
 """
         
-        return weather_info
+        compact = key_values([
+            ("ubicacion", f"{location}, Perú (3052 msnm)"),
+            ("hora", now),
+            ("temperatura", f"{temp}°C (sensación {feels_like}°C, min {temp_min}°C, max {temp_max}°C)"),
+            ("condicion", description),
+            ("humedad", f"{humidity}%"),
+            ("viento", f"{wind_speed} m/s"),
+            ("nubosidad", f"{clouds}%"),
+            ("presion", f"{pressure} hPa"),
+        ])
+        
+        return compact, weather_info
         
     except requests.exceptions.RequestException as e:
-        return f"""⚠️ No pude obtener el clima en tiempo real. 
+        return f"⚠️ tiempo_real: no disponible ({e})\n" + TYPICAL_WEATHER, f"""⚠️ No pude obtener el clima en tiempo real. 
 
 🌤️ **Clima Típico en Huaraz**:
 - **Mayo-Oct** (Seco): ☀️ Días soleados 18-22°C, noches frías 5-8°C
@@ -332,11 +375,13 @@ def get_current_weather(location: str = "Huaraz") -> str:
 
 Error técnico: {str(e)}"""
     except Exception as e:
-        return f"Error al consultar clima: {str(e)}"
+        message = f"Error al consultar clima: {str(e)}"
+        return message, message
 
 
-@tool 
-def get_weather_forecast(days: int = 3) -> str:
+@tool(response_format="content_and_artifact")
+@cached_tool(ttl=1800, cache_if=_weather_ok)
+def get_weather_forecast(days: int = 3) -> Tuple[str, str]:
     """
     Obtiene el pronóstico del clima para los próximos días en Huaraz.
     
@@ -344,12 +389,12 @@ def get_weather_forecast(days: int = 3) -> str:
         days: Número de días del pronóstico (1-5)
     
     Returns:
-        Pronóstico del clima
+        Pronóstico del clima en una línea por día
     """
     api_key = os.getenv("OPENWEATHER_API_KEY")
     
     if not api_key:
-        return """📅 **Pronóstico General para Huaraz**
+        return "pronostico: no disponible\n" + TYPICAL_WEATHER, """📅 **Pronóstico General para Huaraz**
 
 **Temporada Seca** (Mayo - Octubre):
 - ☀️ Días: Soleado, 18-22°C
@@ -373,15 +418,17 @@ def get_weather_forecast(days: int = 3) -> str:
             "cnt": min(days * 8, 40)  # 8 mediciones por día
         }
         
-        response = requests.get(base_url, params=params, timeout=10)
+        with span("http GET api.openweathermap.org", "io", url=base_url):
+            response = requests.get(base_url, params=params, timeout=timeout_for(10))
         response.raise_for_status()
         
         data = response.json()
         
         forecast_text = "📅 **Pronóstico del Clima - Huaraz**\n\n"
         
-        # Agrupar por día
+        # Agrupar por día (el modelo recibe una línea por día: min-max y condiciones)
         current_date = None
+        daily: Dict[str, Dict[str, list]] = {}
         for item in data["list"][:days*8]:
             date = datetime.fromtimestamp(item["dt"]).strftime("%Y-%m-%d")
             time = datetime.fromtimestamp(item["dt"]).strftime("%H:%M")
@@ -394,10 +441,19 @@ def get_weather_forecast(days: int = 3) -> str:
             temp = item["main"]["temp"]
             desc = item["weather"][0]["description"]
             forecast_text += f"   • {time}: {temp}°C - {desc}\n"
+            day = daily.setdefault(date, {"temps": [], "conditions": []})
+            day["temps"].append(temp)
+            if desc not in day["conditions"]:
+                day["conditions"].append(desc)
         
         forecast_text += "\n💡 **Tip**: En Huaraz el clima puede cambiar rápidamente. Lleva ropa por capas."
         
-        return forecast_text
+        compact = key_values(
+            (date, f"{min(day['temps'])}-{max(day['temps'])}°C; {', '.join(day['conditions'][:3])}")
+            for date, day in daily.items()
+        )
+        return compact, forecast_text
         
     except Exception as e:
-        return f"Error al obtener pronóstico: {str(e)}"
+        message = f"Error al obtener pronóstico: {str(e)}"
+        return message, message
@@ -7,6 +7,8 @@ from abc import ABC, abstractmethod
 
 from langchain_openai import ChatOpenAI
 
+from src.llm.fake import ScriptedChatModel
+
 
 class LLMClient(ABC):
     """Clase base para clientes LLM"""
@@ -25,27 +27,49 @@ class OpenAIClient(LLMClient):
         model_name: str = "gpt-4o",
         temperature: float = 0.7,
         max_tokens: int = 2048,
-        api_key: Optional[str] = None
+        api_key: Optional[str] = None,
+        timeout: Optional[float] = None,
+        max_retries: int = 2
     ):
         self.model_name = model_name
         self.temperature = temperature
         self.max_tokens = max_tokens
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.timeout = timeout
+        self.max_retries = max_retries
     
     def get_model(self) -> Any:
         return ChatOpenAI(
             model=self.model_name,
             temperature=self.temperature,
             max_tokens=self.max_tokens,
-            openai_api_key=self.api_key
+            openai_api_key=self.api_key,
+            # Timeout por llamada HTTP; el plazo total lo impone el agente
+            timeout=self.timeout,
+            max_retries=self.max_retries,
+            # Incluir uso de tokens también en respuestas en streaming
+            stream_usage=True
         )
 
 
+class FakeClient(LLMClient):
+    """Cliente con un modelo simulado y determinista (pruebas de carga sin red)"""
+    
+    def __init__(self, think_time: float = 0.05, model_name: str = "scripted-fake", **kwargs: Any):
+        # timeout, max_retries, etc. no aplican al modelo simulado
+        self.think_time = think_time
+        self.model_name = model_name
+    
+    def get_model(self) -> Any:
+        return ScriptedChatModel(think_time=self.think_time, model_name=self.model_name)
+
+
 class LLMFactory:
     """Factory para crear clientes LLM"""
     
     _clients: Dict[str, LLMClient] = {
         "openai": OpenAIClient,
+        "fake": FakeClient,
     }
     
     @classmethod
@@ -0,0 +1,163 @@
+"""
+Callbacks de LangChain para instrumentar las llamadas al LLM
+"""
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from src.utils.metrics import LLM_LATENCY, LLM_TOKENS
+from src.utils.tracing import Trace, current_trace
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Registra latencia y tokens de cada llamada al LLM"""
+
+    def __init__(self):
+        # run_id -> (inicio, modelo)
+        self._starts: Dict[UUID, tuple] = {}
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[Any]],
+        *,
+        run_id: UUID,
+        **kwargs: Any
+    ) -> None:
+        model = (kwargs.get("metadata") or {}).get("ls_model_name", "unknown")
+        self._starts[run_id] = (time.perf_counter(), model)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id)
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    LLM_TOKENS.inc(usage.get("input_tokens", 0), type="input")
+                    LLM_TOKENS.inc(usage.get("output_tokens", 0), type="output")
+                    cached = (usage.get("input_token_details") or {}).get("cache_read", 0)
+                    if cached:
+                        LLM_TOKENS.inc(cached, type="cached")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id)
+
+    def _finish(self, run_id: UUID) -> None:
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            LLM_LATENCY.observe(time.perf_counter() - start[0], model=start[1])
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Registra en la traza de la petición los pasos del grafo y las llamadas
+    al LLM (con sus tokens).
+
+    Se ejecuta en línea para ver los contextvars de la petición. Las
+    ejecuciones intermedias de LangChain no abren span: se asocian al span
+    más cercano que las contiene, para que los spans internos (herramientas,
+    E/S) encuentren su padre.
+    """
+
+    run_inline = True
+
+    @staticmethod
+    def _parent(trace: Trace, parent_run_id: Optional[UUID]) -> Optional[int]:
+        if parent_run_id is not None and parent_run_id in trace.run_spans:
+            return trace.run_spans[parent_run_id]
+        return trace.parent_id()
+
+    def on_chain_start(
+        self,
+        serialized: Optional[Dict[str, Any]],
+        inputs: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> None:
+        trace = current_trace()
+        if trace is None:
+            return
+        parent = self._parent(trace, parent_run_id)
+        node = (metadata or {}).get("langgraph_node")
+        if node and node == kwargs.get("name") and not node.startswith("__"):
+            # Nodo del grafo: un paso ReAct (modelo o herramientas). Cada
+            # llamada a herramienta de un paso corre como su propia tarea del nodo
+            step = (metadata or {}).get("langgraph_step")
+            call = inputs.get("tool_call") if isinstance(inputs, dict) else None
+            label = f"{node}: {call['name']}" if isinstance(call, dict) and call.get("name") else node
+            span = trace.open(f"{label} (paso {step})", "step", parent, node=node, step=step)
+            trace.open_runs[run_id] = span
+            trace.run_spans[run_id] = span.id
+        else:
+            trace.run_spans[run_id] = parent
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._close(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._close(run_id, error=type(error).__name__)
+
+    def on_tool_start(
+        self,
+        serialized: Dict[str, Any],
+        input_str: str,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any
+    ) -> None:
+        # La herramienta abre su propio span (ver async_tools); aquí solo se enlaza
+        trace = current_trace()
+        if trace is not None:
+            trace.run_spans[run_id] = self._parent(trace, parent_run_id)
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[Any]],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> None:
+        trace = current_trace()
+        if trace is None:
+            return
+        model = (metadata or {}).get("ls_model_name", "unknown")
+        span = trace.open(
+            f"llm {model}", "llm", self._parent(trace, parent_run_id),
+            model=model, messages=sum(len(batch) for batch in messages)
+        )
+        trace.open_runs[run_id] = span
+        trace.run_spans[run_id] = span.id
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        usage: Dict[str, int] = {}
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                for key in ("input_tokens", "output_tokens"):
+                    usage[key] = usage.get(key, 0) + metadata.get(key, 0)
+                cached = (metadata.get("input_token_details") or {}).get("cache_read", 0)
+                if cached:
+                    usage["cached_tokens"] = usage.get("cached_tokens", 0) + cached
+        self._close(run_id, **usage)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._close(run_id, error=type(error).__name__)
+
+    @staticmethod
+    def _close(run_id: UUID, **attrs: Any) -> None:
+        trace = current_trace()
+        if trace is None:
+            return
+        span = trace.open_runs.pop(run_id, None)
+        if span is not None:
+            Trace.close(span, **attrs)
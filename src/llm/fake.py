@@ -0,0 +1,161 @@
+"""
+Modelo de chat simulado y determinista para pruebas de carga.
+
+Responde sin red ni costo: según palabras clave de la consulta emite
+llamadas a herramientas guionizadas (por ejemplo `get_tour_price("laguna 69")`),
+todas en el mismo paso si la consulta toca varios temas, y con los
+resultados de las herramientas una respuesta final. Cada respuesta
+espera `think_time` segundos para simular la latencia del proveedor.
+"""
+import asyncio
+import itertools
+import json
+import time
+import unicodedata
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable
+
+# (palabras clave, herramienta, argumentos): se usan todas las reglas que
+# coinciden, una llamada por herramienta
+DEFAULT_SCRIPT: List[Tuple[Tuple[str, ...], str, Dict[str, Any]]] = [
+    (("pastoruri",), "get_tour_price", {"tour_name": "pastoruri"}),
+    (("laguna 69", "cuesta", "precio"), "get_tour_price", {"tour_name": "laguna 69"}),
+    (("clima", "temperatura"), "get_current_weather", {"location": "Huaraz"}),
+    (("altura", "soroche", "altitud"), "get_altitude_advice", {}),
+    (("tours", "paquetes"), "list_all_tours_with_prices", {}),
+    (("epoca", "temporada"), "get_best_season", {"travel_style": "trekking"}),
+    (("atracciones", "lagunas"), "search_attractions", {"query": "laguna"}),
+]
+
+
+# Ids de llamadas a herramientas únicos en el proceso
+_call_ids = itertools.count(1)
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Modelo de chat con llamadas a herramientas guionizadas"""
+
+    think_time: float = 0.05
+    chunk_size: int = 4
+    script: List[Tuple[Tuple[str, ...], str, Dict[str, Any]]] = DEFAULT_SCRIPT
+    model_name: str = "scripted-fake"
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> Runnable:
+        # Como los modelos reales: las herramientas viajan como argumento de la
+        # llamada; sin ellas (p. ej. al resumir) el modelo solo responde texto
+        return self.bind(tools=[getattr(tool, "name", str(tool)) for tool in tools], **kwargs)
+
+    def _match(self, text: str) -> List[Tuple[str, Dict[str, Any]]]:
+        text = _normalize(text)
+        calls: Dict[str, Dict[str, Any]] = {}
+        for keywords, tool_name, args in self.script:
+            if tool_name not in calls and any(keyword in text for keyword in keywords):
+                calls[tool_name] = dict(args)
+        return list(calls.items())
+
+    def _reply(self, messages: List[BaseMessage], tools: Optional[List[str]] = None) -> AIMessage:
+        """Siguiente mensaje según el guion"""
+        last = messages[-1]
+        prompt_chars = sum(len(str(m.content)) for m in messages)
+
+        if not tools and str(last.content).startswith("Resumen actual"):
+            content = f"Resumen: {str(last.content)[-300:]}"
+        elif not tools:
+            # Sin herramientas enlazadas (saludos, redacción): solo texto
+            content = "¡Hola! Soy tu guía de Huaraz. ¿Qué te gustaría conocer?"
+        elif isinstance(last, ToolMessage):
+            results = []
+            for message in reversed(messages):
+                if not isinstance(message, ToolMessage):
+                    break
+                results.append(f"Según {message.name}: {str(message.content)[:300]}")
+            content = "\n\n".join(reversed(results))
+        else:
+            human = last if isinstance(last, HumanMessage) else next(
+                (m for m in reversed(messages) if isinstance(m, HumanMessage)), last
+            )
+            # Como un modelo real, solo llama a herramientas enlazadas
+            calls = [call for call in self._match(str(human.content)) if call[0] in tools]
+            if calls:
+                return AIMessage(
+                    content="",
+                    tool_calls=[
+                        {"name": tool_name, "args": args, "id": f"call_{next(_call_ids)}"}
+                        for tool_name, args in calls
+                    ],
+                    usage_metadata=self._usage(prompt_chars, 20 * len(calls))
+                )
+            content = "Huaraz ofrece lagunas, nevados y trekking para todos los niveles. ¿Qué te interesa?"
+
+        return AIMessage(content=content, usage_metadata=self._usage(prompt_chars, len(content)))
+
+    @staticmethod
+    def _usage(prompt_chars: int, output_chars: int) -> Dict[str, int]:
+        # Aproximación de ~4 caracteres por token
+        input_tokens = prompt_chars // 4 + 1
+        output_tokens = output_chars // 4 + 1
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens
+        }
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.think_time)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages, kwargs.get("tools")))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.think_time)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages, kwargs.get("tools")))])
+
+    def _chunks(self, message: AIMessage) -> Iterator[AIMessageChunk]:
+        if message.tool_calls:
+            yield AIMessageChunk(
+                content="",
+                tool_call_chunks=[
+                    {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+                    for i, call in enumerate(message.tool_calls)
+                ],
+                usage_metadata=message.usage_metadata
+            )
+            return
+
+        words = message.content.split(" ")
+        for i in range(0, len(words), self.chunk_size):
+            text = " ".join(words[i:i + self.chunk_size])
+            last = i + self.chunk_size >= len(words)
+            yield AIMessageChunk(
+                content=text if last else text + " ",
+                usage_metadata=message.usage_metadata if last else None
+            )
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.think_time)
+        for chunk in self._chunks(self._reply(messages, kwargs.get("tools"))):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.think_time)
+        for chunk in self._chunks(self._reply(messages, kwargs.get("tools"))):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
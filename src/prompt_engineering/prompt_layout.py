@@ -0,0 +1,80 @@
+"""
+Disposición de los mensajes enviados al modelo.
+
+Los proveedores con caché automática de prompts (OpenAI la aplica a partir
+de 1024 tokens) reutilizan el prefijo idéntico más largo entre llamadas.
+Por eso el orden es:
+
+    [prompt del sistema + esquemas de herramientas]   prefijo fijo, byte a byte
+                                                      (uno por subconjunto de herramientas)
+    [resumen de la conversación]                      cambia solo al resumir
+    [historial]                                       crece por el final
+    [contexto volátil: fecha y hora, preferencias]    cambia en cada consulta
+    [mensaje actual del usuario]
+"""
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from langchain_core.messages import SystemMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from src.prompt_engineering.prompts import PromptManager
+
+
+class PromptLayout:
+    """Prefijo estable del prompt y mensaje de contexto volátil"""
+
+    def __init__(self, tools: Sequence[Any], system_prompt: Optional[str] = None):
+        """
+        Construir el prefijo una sola vez.
+
+        Args:
+            tools: Herramientas del agente (en el orden en que se envían)
+            system_prompt: Prompt del sistema (por defecto el de PromptManager)
+        """
+        # Un único objeto reutilizado en todas las llamadas
+        self.system_message = SystemMessage(content=system_prompt or PromptManager.get_system_prompt())
+        self.tool_schemas = [convert_to_openai_tool(tool) for tool in tools]
+        self._schemas_text = json.dumps(self.tool_schemas, ensure_ascii=False, sort_keys=True)
+        self._schemas_by_name = {schema["function"]["name"]: schema for schema in self.tool_schemas}
+        self._subset_tokens: Dict[Tuple[str, ...], int] = {}
+        self.fingerprint = hashlib.sha1(
+            (self.system_message.content + self._schemas_text).encode("utf-8")
+        ).hexdigest()[:12]
+
+    def prefix_tokens(self, counter: Any, tool_names: Optional[Tuple[str, ...]] = None) -> int:
+        """
+        Tokens del prefijo fijo (prompt del sistema + esquemas de herramientas).
+
+        Args:
+            counter: Contador de tokens
+            tool_names: Subconjunto de herramientas enlazado (None = todas)
+        """
+        if tool_names is None:
+            schema_tokens = counter.count_text(self._schemas_text)
+        else:
+            schema_tokens = self._subset_tokens.get(tool_names)
+            if schema_tokens is None:
+                schemas = [self._schemas_by_name[name] for name in tool_names]
+                schema_tokens = counter.count_text(json.dumps(schemas, ensure_ascii=False, sort_keys=True)) if schemas else 0
+                self._subset_tokens[tool_names] = schema_tokens
+        return counter.count_message(self.system_message) + schema_tokens
+
+    @staticmethod
+    def context_message(user_context: Dict[str, Any], now: Optional[datetime] = None) -> SystemMessage:
+        """
+        Datos que cambian en cada consulta; van después del historial.
+
+        La hora se redondea al minuto para no variar más de lo necesario.
+        """
+        now = now or datetime.now()
+        lines = [f"- Fecha y hora actual en Huaraz: {now.strftime('%Y-%m-%d %H:%M')}"]
+        for key, value in user_context.items():
+            lines.append(f"- {key}: {value}")
+        return SystemMessage(content="Contexto de esta consulta:\n" + "\n".join(lines))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"prefix_fingerprint": self.fingerprint, "tools": len(self.tool_schemas)}
+
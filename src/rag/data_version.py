@@ -0,0 +1,60 @@
+"""
+Versión de los datos publicados (caché de tours e índice FAISS).
+
+Las cachés derivadas de estos datos (por ejemplo, la caché de respuestas)
+comparan su versión con `current_version()` y se invalidan cuando cambia.
+La versión combina la huella de los archivos en disco (detecta cambios de
+otros procesos, como los scripts de scraping) y un contador que se
+incrementa al publicar desde este proceso.
+"""
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Union
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_generation = 0
+# Archivos publicados que definen la versión de los datos
+_tracked: Dict[str, Path] = {
+    "tours": Path("data/rag_cache/tours_data.json"),
+    "faiss": Path("data/rag_cache/faiss_index/index.faiss"),
+}
+
+
+def publish_data_version(name: str, path: Union[str, Path]) -> None:
+    """
+    Registrar la publicación de nuevos datos.
+
+    Args:
+        name: Fuente de datos ("tours" o "faiss")
+        path: Archivo recién escrito
+    """
+    global _generation
+    with _lock:
+        _tracked[name] = Path(path)
+        _generation += 1
+    logger.info(f"Datos publicados ({name}): nueva versión {current_version()}")
+
+
+def current_version() -> str:
+    """
+    Obtener la versión actual de los datos.
+
+    Returns:
+        Huella corta de los archivos publicados y del contador de publicaciones
+    """
+    with _lock:
+        parts = [str(_generation)]
+        tracked = sorted(_tracked.items())
+
+    for name, path in tracked:
+        try:
+            stat = path.stat()
+            parts.append(f"{name}:{stat.st_mtime_ns}:{stat.st_size}")
+        except OSError:
+            parts.append(f"{name}:-")
+
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:12]
@@ -2,6 +2,8 @@
 Scraper especializado para extraer precios y tours de huarazturismo.com
 """
 import re
+import threading
+import time
 import requests
 from bs4 import BeautifulSoup
 from typing import List, Dict, Optional
@@ -10,8 +12,15 @@ from dataclasses import dataclass, asdict
 import json
 from pathlib import Path
 
+from src.handlers.tool_output import key_values
+from src.rag.data_version import publish_data_version
+from src.utils.deadline import expired, remaining, timeout_for
+from src.utils.tracing import span
+
 logger = logging.getLogger(__name__)
 
+BOOKING_CONTACT = "WhatsApp +51 943833972 | Email: reservas@huarazviajes.com"
+
 
 @dataclass
 class TourInfo:
@@ -35,6 +44,9 @@ class HuarazPriceScraper:
     
     BASE_URL = "https://www.huarazturismo.com"
     
+    # Longitud máxima del nombre en la lista compacta
+    COMPACT_NAME_CHARS = 80
+    
     # Paquetes Turísticos
     PACKAGE_PAGES = [
         "/paquete-huaraz-4d-3n.php",
@@ -78,8 +90,17 @@ class HuarazPriceScraper:
         """Combinar todas las páginas"""
         return self.PACKAGE_PAGES + self.DAILY_TOUR_PAGES + self.TREKKING_PAGES
     
+    # Segundos antes de reintentar un scraping que quedó incompleto
+    PARTIAL_RETRY_BACKOFF = 30.0
+    
     def __init__(self):
+        # Se reemplaza completa al terminar cada scraping, nunca se modifica en sitio
         self.tours: List[TourInfo] = []
+        # True si el último scraping se cortó por el plazo de la consulta
+        self.partial = False
+        # Un solo scraping a la vez; quien llega después usa su resultado
+        self._lock = threading.Lock()
+        self._retry_at = 0.0
         self.cache_file = Path("data/rag_cache/tours_data.json")
         self.cache_file.parent.mkdir(parents=True, exist_ok=True)
     
@@ -172,10 +193,12 @@ class HuarazPriceScraper:
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             }
-            response = requests.get(full_url, headers=headers, timeout=10)
+            with span(f"http GET {url_path}", "io", url=full_url):
+                response = requests.get(full_url, headers=headers, timeout=timeout_for(10))
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            with span("BeautifulSoup parse", "parse", bytes=len(response.content)):
+                soup = BeautifulSoup(response.content, 'html.parser')
             
             # Extraer título
             title = soup.find('title')
@@ -215,17 +238,68 @@ class HuarazPriceScraper:
             return None
     
     def scrape_all_tours(self) -> List[TourInfo]:
-        """Scrape todas las páginas de tours"""
+        """
+        Scrape todas las páginas de tours.
+        
+        Los tours se reúnen en una lista nueva que reemplaza a `self.tours` al
+        final, así que las consultas concurrentes nunca ven una lista a medias.
+        Si el plazo corta el scraping, lo obtenido se combina con los tours
+        anteriores y el reintento espera `PARTIAL_RETRY_BACKOFF` segundos.
+        
+        Returns:
+            Tours disponibles tras el scraping
+        """
+        with self._lock:
+            return self._scrape_all_tours()
+    
+    def _scrape_all_tours(self) -> List[TourInfo]:
         logger.info("Iniciando scraping de tours...")
         
-        self.tours = []
+        tours: List[TourInfo] = []
+        partial = False
         for url_path in self.TOUR_PAGES:
+            if expired():
+                # Responder con lo obtenido; se completará en un próximo intento
+                logger.warning(f"Plazo agotado: scraping parcial ({len(tours)} tours)")
+                partial = True
+                break
             tour = self.scrape_tour_page(url_path)
             if tour:
-                self.tours.append(tour)
+                tours.append(tour)
         
-        logger.info(f"✓ Scraping completado: {len(self.tours)} tours encontrados")
-        return self.tours
+        if partial:
+            # Conservar los tours anteriores que este intento no alcanzó
+            scraped = {tour.url for tour in tours}
+            tours += [tour for tour in self.tours if tour.url not in scraped]
+            self._retry_at = time.monotonic() + self.PARTIAL_RETRY_BACKOFF
+        else:
+            logger.info(f"✓ Scraping completado: {len(tours)} tours encontrados")
+        self.tours, self.partial = tours, partial
+        return tours
+    
+    def needs_refresh(self) -> bool:
+        """Verificar si hay que hacer scraping: sin datos, o incompletos y vencida la espera"""
+        return not self.tours or (self.partial and time.monotonic() >= self._retry_at)
+    
+    def refresh(self) -> None:
+        """
+        Hacer scraping si hace falta y guardar el resultado si quedó completo.
+        
+        Si otro hilo ya está haciendo scraping se espera a que termine (como
+        mucho hasta el plazo de la consulta) y se usa su resultado.
+        """
+        left = remaining()
+        if not self._lock.acquire(timeout=max(left, 0) if left is not None else -1):
+            return
+        try:
+            if not self.needs_refresh():
+                return
+            logger.info("Realizando scraping de tours...")
+            self._scrape_all_tours()
+            if not self.partial:
+                self.save_to_cache()
+        finally:
+            self._lock.release()
     
     def save_to_cache(self):
         """Guardar datos en caché"""
@@ -234,6 +308,8 @@ class HuarazPriceScraper:
             with open(self.cache_file, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
             logger.info(f"✓ Datos guardados en: {self.cache_file}")
+            # Invalida las respuestas cacheadas con los datos anteriores
+            publish_data_version("tours", self.cache_file)
         except Exception as e:
             logger.error(f"Error guardando caché: {str(e)}")
     
@@ -247,6 +323,7 @@ class HuarazPriceScraper:
                 data = json.load(f)
             
             self.tours = [TourInfo(**tour_data) for tour_data in data]
+            self.partial = False
             logger.info(f"✓ Cargados {len(self.tours)} tours desde caché")
             return True
         except Exception as e:
@@ -322,10 +399,42 @@ class HuarazPriceScraper:
             # Para texto plano
             text += f"\n🔗 **Más información**: {tour.url}\n"
         
-        text += f"\n📞 **Reservas**: WhatsApp +51 943833972 | Email: reservas@huarazviajes.com\n"
+        text += f"\n📞 **Reservas**: {BOOKING_CONTACT}\n"
         
         return text
     
+    @staticmethod
+    def _includes(tour: TourInfo) -> List[str]:
+        return [item.strip() for item in tour.includes[:8] if item and len(item.strip()) > 3]
+    
+    def compact_tour_info(self, tour: TourInfo) -> str:
+        """Información del tour en líneas clave: valor (para el modelo)"""
+        return key_values([
+            ("tour", tour.name),
+            ("tipo", tour.tour_type),
+            ("precio", f"{tour.price} por persona" if tour.price else "consultar disponibilidad"),
+            ("duracion", tour.duration),
+            ("dificultad", tour.difficulty),
+            ("descripcion", tour.description),
+            ("incluye", self._includes(tour)),
+            ("url", tour.url),
+            ("reservas", BOOKING_CONTACT),
+        ])
+    
+    def get_all_tours_compact(self) -> str:
+        """Lista de tours en una línea por tour: tipo | nombre | precio | duración (para el modelo)"""
+        if not self.tours:
+            return "No hay tours disponibles."
+        
+        lines = ["tipo | tour | precio | duracion"]
+        for tour in self.tours:
+            name = " ".join(tour.name.split())
+            if len(name) > self.COMPACT_NAME_CHARS:
+                # Los nombres del sitio arrastran palabras clave SEO al final
+                name = name[:self.COMPACT_NAME_CHARS].rsplit(" ", 1)[0] + "…"
+            lines.append(f"{tour.tour_type} | {name} | {tour.price or 'consultar'} | {tour.duration or '-'}")
+        return "\n".join(lines)
+    
     def get_all_tours_summary(self) -> str:
         """Obtener resumen de todos los tours"""
         if not self.tours:
@@ -373,17 +482,20 @@ class HuarazPriceScraper:
 
 # Instancia global
 _scraper_instance: Optional[HuarazPriceScraper] = None
+_scraper_lock = threading.Lock()
 
 
 def get_scraper() -> HuarazPriceScraper:
     """Obtener instancia del scraper"""
     global _scraper_instance
     
-    if _scraper_instance is None:
-        _scraper_instance = HuarazPriceScraper()
-        
-        # Intentar cargar desde caché
-        if not _scraper_instance.load_from_cache():
-            logger.info("No hay caché, scraping necesario")
+    with _scraper_lock:
+        if _scraper_instance is None:
+            scraper = HuarazPriceScraper()
+            
+            # Intentar cargar desde caché
+            if not scraper.load_from_cache():
+                logger.info("No hay caché, scraping necesario")
+            _scraper_instance = scraper
     
     return _scraper_instance
@@ -0,0 +1,230 @@
+"""
+Caché semántica de respuestas.
+
+Guarda respuestas a consultas de primer turno y las reutiliza para
+consultas parecidas (paráfrasis), comparando sus embeddings con similitud
+coseno. Las entradas expiran por TTL y la caché completa se invalida
+cuando cambia la versión de los datos (tours o índice FAISS).
+
+La similitud sola no distingue "¿cuánto cuesta el tour a Pastoruri?" de
+"¿cuánto cuesta el tour a Laguna 69?": cada entrada guarda además las
+entidades de su consulta (tours, lugares, números) y un acierto exige
+exactamente las mismas.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.rag.data_version import current_version
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_LOOKUPS = metrics.counter(
+    "chatbot_answer_cache_lookups_total", "Consultas a la caché semántica de respuestas", ["result"]
+)
+
+
+class SemanticCache:
+    """Caché de respuestas por similitud de embeddings con TTL y versión de datos"""
+
+    def __init__(
+        self,
+        embeddings_provider: Callable[[], Embeddings],
+        similarity_threshold: float = 0.92,
+        ttl: float = 900,
+        max_entries: int = 1000,
+        entity_extractor: Optional[Callable[[str], FrozenSet[str]]] = None
+    ):
+        """
+        Inicializar la caché.
+
+        Args:
+            embeddings_provider: Función que devuelve el modelo de embeddings
+                                 (se resuelve con `warm` o, fuera del event
+                                 loop, en la primera consulta)
+            similarity_threshold: Similitud coseno mínima para un acierto
+            ttl: Segundos de vigencia de cada respuesta
+            max_entries: Respuestas máximas; se descartan las más antiguas
+            entity_extractor: Entidades de una consulta que deben coincidir
+                              exactamente para un acierto (None = solo similitud)
+        """
+        self._embeddings_provider = embeddings_provider
+        self._embeddings: Optional[Embeddings] = None
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entity_extractor = entity_extractor
+
+        # texto normalizado -> (vector, respuesta, creado, entidades)
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, str, float, FrozenSet[str]]]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._keys: List[str] = []
+        self._version = current_version()
+        self._lock = threading.Lock()
+        self._provider_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Aciertos por similitud descartados porque las entidades no coincidían
+        self.entity_mismatches = 0
+
+    @staticmethod
+    def _normalize_text(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def warm(self) -> Embeddings:
+        """
+        Resolver el modelo de embeddings (síncrono: puede cargar el índice FAISS).
+
+        Returns:
+            Modelo de embeddings
+        """
+        with self._provider_lock:
+            if self._embeddings is None:
+                self._embeddings = self._embeddings_provider()
+        return self._embeddings
+
+    async def _aembed(self, query: str) -> np.ndarray:
+        embeddings = self._embeddings
+        if embeddings is None:
+            # La primera resolución puede tardar segundos: fuera del event loop
+            embeddings = await asyncio.to_thread(self.warm)
+        return self._unit(await embeddings.aembed_query(query))
+
+    def _check_version(self) -> None:
+        """Vaciar la caché si los datos publicados cambiaron (requiere el lock)"""
+        version = current_version()
+        if version != self._version:
+            if self._entries:
+                logger.info(f"Datos actualizados ({self._version} -> {version}): caché de respuestas invalidada")
+                self.invalidations += 1
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+
+    def _fresh(self, entry: Tuple[np.ndarray, str, float, FrozenSet[str]], now: float) -> bool:
+        return now - entry[2] <= self.ttl
+
+    def _entities(self, query: str) -> FrozenSet[str]:
+        return self.entity_extractor(query) if self.entity_extractor is not None else frozenset()
+
+    async def alookup(self, query: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Buscar una respuesta para la consulta.
+
+        Una coincidencia exacta del texto normalizado no requiere embeddings;
+        en otro caso se calcula el embedding y se busca la entrada más similar
+        con las mismas entidades.
+
+        Args:
+            query: Consulta del usuario
+
+        Returns:
+            (respuesta o None, embedding calculado para reutilizar en `store`)
+        """
+        key = self._normalize_text(query)
+        now = time.monotonic()
+
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is not None and self._fresh(entry, now):
+                self._record(True)
+                return entry[1], entry[0]
+
+        try:
+            vector = await self._aembed(query)
+        except Exception as e:
+            logger.warning(f"No se pudo calcular el embedding para la caché: {e}")
+            self._record(False)
+            return None, None
+
+        entities = self._entities(query)
+        with self._lock:
+            self._check_version()
+            if self._entries:
+                if self._matrix is None:
+                    self._keys = list(self._entries)
+                    self._matrix = np.vstack([self._entries[k][0] for k in self._keys])
+
+                scores = self._matrix @ vector
+                similar = np.flatnonzero(scores >= self.similarity_threshold)
+                for index in similar[np.argsort(-scores[similar])]:
+                    entry = self._entries.get(self._keys[index])
+                    if entry is None or not self._fresh(entry, now):
+                        continue
+                    if entry[3] != entities:
+                        self.entity_mismatches += 1
+                        continue
+                    self._record(True)
+                    return entry[1], vector
+
+        self._record(False)
+        return None, vector
+
+    def store(self, query: str, answer: str, vector: Optional[np.ndarray]) -> None:
+        """
+        Guardar la respuesta de una consulta.
+
+        Args:
+            query: Consulta del usuario
+            answer: Respuesta del agente
+            vector: Embedding devuelto por `alookup` (None si no se pudo calcular)
+        """
+        if vector is None or not answer:
+            return
+
+        key = self._normalize_text(query)
+        entities = self._entities(query)
+        with self._lock:
+            self._check_version()
+            self._entries.pop(key, None)
+            self._entries[key] = (vector, answer, time.monotonic(), entities)
+
+            # Descartar expiradas y, si sobra, las más antiguas
+            now = time.monotonic()
+            while self._entries:
+                oldest = next(iter(self._entries.values()))
+                if self._fresh(oldest, now) and len(self._entries) <= self.max_entries:
+                    break
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self) -> None:
+        """Vaciar la caché"""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def _record(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        ANSWER_CACHE_LOOKUPS.inc(result="hit" if hit else "miss")
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "entity_mismatches": self.entity_mismatches,
+            "data_version": self._version
+        }
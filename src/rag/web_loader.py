@@ -13,6 +13,9 @@ from pathlib import Path
 import pickle
 import logging
 
+from src.rag.data_version import publish_data_version
+from src.utils.tracing import span
+
 logger = logging.getLogger(__name__)
 
 
@@ -138,6 +141,8 @@ class HuarazWebRAG:
                 'timestamp': pd.Timestamp.now() if 'pd' in dir() else None
             }, f)
         
+        # Invalida las respuestas cacheadas con el índice anterior
+        publish_data_version("faiss", path.parent / "faiss_index" / "index.faiss")
         logger.info("✓ Vector store guardado")
     
     def load_vector_store(self, path: Optional[Path] = None) -> bool:
@@ -190,7 +195,9 @@ class HuarazWebRAG:
             raise ValueError("Vector store no inicializado. Ejecuta create_vector_store() primero.")
         
         logger.info(f"Buscando: '{query}'")
-        results = self.vector_store.similarity_search(query, k=k)
+        # Incluye el embedding de la consulta (llamada a la API) y la búsqueda FAISS
+        with span("faiss similarity_search", "search", k=k):
+            results = self.vector_store.similarity_search(query, k=k)
         logger.info(f"✓ Encontrados {len(results)} resultados")
         
         return results
@@ -209,7 +216,8 @@ class HuarazWebRAG:
         if not self.vector_store:
             raise ValueError("Vector store no inicializado")
         
-        results = self.vector_store.similarity_search_with_score(query, k=k)
+        with span("faiss similarity_search_with_score", "search", k=k):
+            results = self.vector_store.similarity_search_with_score(query, k=k)
         return results
     
     def initialize(self, force_reload: bool = False) -> bool:
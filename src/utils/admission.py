@@ -0,0 +1,211 @@
+"""
+Control de admisión para las ejecuciones del agente.
+
+Dos capas delante del agente:
+    - `KeyedRateLimiter`: una cubeta de tokens por clave (sesión o IP).
+    - `AdmissionController`: un máximo de ejecuciones simultáneas y una cola
+      acotada con tiempo máximo de espera.
+
+Cuando no hay capacidad se lanza `AdmissionRejected` de inmediato en lugar
+de acumular trabajo, para proteger la latencia y la cuota de OpenAI.
+"""
+import asyncio
+import math
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from src.utils.helpers import TokenBucket
+from src.utils.metrics import metrics
+
+ADMISSION_REJECTED = metrics.counter(
+    "chatbot_admission_rejected_total", "Peticiones rechazadas por falta de capacidad", ["reason"]
+)
+ADMISSION_QUEUE_DEPTH = metrics.gauge(
+    "chatbot_admission_queue_depth", "Peticiones esperando turno para ejecutar el agente"
+)
+
+
+class AdmissionRejected(Exception):
+    """La petición excede la capacidad disponible"""
+
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"Capacidad excedida ({reason})")
+
+    @property
+    def retry_after_header(self) -> str:
+        """Valor para la cabecera HTTP Retry-After (segundos enteros)"""
+        if math.isinf(self.retry_after):
+            return "60"
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class KeyedRateLimiter:
+    """Cubetas de tokens por clave con un número acotado de claves (LRU)"""
+
+    def __init__(self, capacity: float, refill_per_second: float, max_keys: int = 10000):
+        """
+        Inicializar el limitador.
+
+        Args:
+            capacity: Ráfaga máxima por clave
+            refill_per_second: Tokens recuperados por segundo
+            max_keys: Claves a recordar; las menos usadas se olvidan
+        """
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, key: str, reason: str) -> None:
+        """
+        Consumir un token para `key`.
+
+        Raises:
+            AdmissionRejected: si la clave no tiene tokens disponibles
+        """
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.capacity, self.refill_per_second)
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+
+            if bucket.try_acquire():
+                return
+            retry_after = bucket.retry_after()
+
+        ADMISSION_REJECTED.inc(reason=reason)
+        raise AdmissionRejected(reason, retry_after)
+
+
+class AdmissionController:
+    """Ejecuciones simultáneas acotadas con cola de espera acotada y con plazo"""
+
+    def __init__(self, max_concurrent: int = 16, max_queue: int = 64, queue_timeout: float = 10.0):
+        """
+        Inicializar el controlador.
+
+        Args:
+            max_concurrent: Ejecuciones del agente en paralelo
+            max_queue: Peticiones que pueden esperar turno
+            queue_timeout: Segundos máximos de espera en cola
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._waiting = 0
+
+    async def acquire(self) -> None:
+        """
+        Obtener un turno de ejecución.
+
+        Raises:
+            AdmissionRejected: si la cola está llena o se agota el plazo de espera
+        """
+        if not self._semaphore.locked():
+            # Hay turno libre: se obtiene sin suspender la corrutina
+            await self._semaphore.acquire()
+            return
+
+        if self._waiting >= self.max_queue:
+            ADMISSION_REJECTED.inc(reason="queue_full")
+            raise AdmissionRejected("queue_full", self.queue_timeout)
+
+        self._waiting += 1
+        ADMISSION_QUEUE_DEPTH.inc()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            ADMISSION_REJECTED.inc(reason="queue_timeout")
+            raise AdmissionRejected("queue_timeout", self.queue_timeout)
+        finally:
+            self._waiting -= 1
+            ADMISSION_QUEUE_DEPTH.dec()
+
+    def release(self) -> None:
+        """Liberar un turno de ejecución"""
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """Ejecutar el bloque con un turno asignado"""
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "waiting": self._waiting
+        }
+
+
+class AdmissionPolicy:
+    """Límites por sesión, por IP y global, en ese orden"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Construir la política desde la configuración.
+
+        Args:
+            config: Sección `admission` de server_config.yaml
+        """
+        config = config or {}
+        max_keys = config.get("max_tracked_keys", 10000)
+        session_limits = config.get("per_session", {})
+        ip_limits = config.get("per_ip", {})
+
+        self.per_session = KeyedRateLimiter(
+            session_limits.get("capacity", 5),
+            session_limits.get("refill_per_second", 0.2),
+            max_keys
+        )
+        self.per_ip = KeyedRateLimiter(
+            ip_limits.get("capacity", 20),
+            ip_limits.get("refill_per_second", 1.0),
+            max_keys
+        )
+        self.controller = AdmissionController(
+            max_concurrent=config.get("max_concurrent_runs", 16),
+            max_queue=config.get("max_queue", 64),
+            queue_timeout=config.get("queue_timeout", 10.0)
+        )
+
+    def check_rate(self, session_id: str, client_ip: Optional[str]) -> None:
+        """Aplicar los límites por sesión y por IP"""
+        self.per_session.check(session_id, "session_rate")
+        if client_ip:
+            self.per_ip.check(client_ip, "ip_rate")
+
+    async def acquire(self, session_id: str, client_ip: Optional[str]) -> None:
+        """
+        Aplicar todos los límites y ocupar un turno de ejecución.
+
+        El llamador debe liberar el turno con `controller.release()`.
+
+        Raises:
+            AdmissionRejected: si algún límite se excede
+        """
+        self.check_rate(session_id, client_ip)
+        await self.controller.acquire()
+
+    @asynccontextmanager
+    async def admit(self, session_id: str, client_ip: Optional[str]) -> AsyncIterator[None]:
+        """Aplicar todos los límites y ocupar un turno durante el bloque"""
+        await self.acquire(session_id, client_ip)
+        try:
+            yield
+        finally:
+            self.controller.release()
@@ -0,0 +1,303 @@
+"""
+Ejecución de consultas por lotes (modo offline).
+
+Lee un archivo JSONL con una consulta por línea:
+
+    {"id": "q1", "query": "¿Cuánto cuesta el tour a Pastoruri?"}
+    {"id": "q2", "query": "¿Y qué clima hará?", "session_id": "guion-7"}
+
+y escribe otro JSONL con la respuesta, la latencia, las herramientas usadas
+y los tokens de cada consulta. Las consultas de una misma sesión se
+ejecutan en el orden del archivo (guiones multi-turno); sesiones distintas
+y consultas sin sesión corren en paralelo, hasta `concurrency`
+conversaciones a la vez y con un límite opcional de consultas por segundo.
+Cada resultado se escribe al terminar, así que una corrida interrumpida
+conserva lo ya procesado (en orden de finalización; `index` es la línea
+de entrada).
+
+Las consultas pueden ejecutarse en el propio proceso o, con `ServerClient`,
+enviarse al servidor en marcha (POST /chat): en ese modo las respuestas y
+los resultados de herramientas quedan en las cachés del servidor, así que
+un lote nocturno sirve también para precalentarlo.
+"""
+import asyncio
+import inspect
+import json
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, IO, List, Optional
+
+import httpx
+
+from src.utils.helpers import Logger, TokenBucket
+
+# Cada cuántos resultados se informa el avance
+PROGRESS_EVERY = 50
+
+
+@dataclass
+class BatchQuery:
+    """Consulta de un archivo de lote"""
+    index: int
+    query: str
+    id: Optional[str] = None
+    session_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+def read_batch(path: str) -> List[BatchQuery]:
+    """
+    Leer un archivo JSONL de consultas.
+
+    Las líneas vacías se ignoran; una línea inválida se conserva con su
+    error para que aparezca en los resultados.
+
+    Args:
+        path: Ruta del archivo de entrada
+
+    Returns:
+        Consultas en el orden del archivo (`index` = número de línea)
+    """
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for index, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                query = item.get("query") if isinstance(item, dict) else None
+                if not isinstance(query, str) or not query.strip():
+                    raise ValueError('falta el campo "query"')
+            except ValueError as e:
+                queries.append(BatchQuery(index, "", error=f"Línea inválida: {e}"))
+                continue
+            session_id = item.get("session_id")
+            queries.append(BatchQuery(
+                index,
+                query.strip(),
+                id=None if item.get("id") is None else str(item["id"]),
+                session_id=None if session_id is None else str(session_id)
+            ))
+    return queries
+
+
+class BatchRunner:
+    """Ejecuta un lote con concurrencia acotada y límite de tasa"""
+
+    def __init__(
+        self,
+        run_query: Callable[[str, Optional[str]], Awaitable[Dict[str, Any]]],
+        concurrency: int = 4,
+        rate_limit: Optional[float] = None,
+        end_session: Optional[Callable[[str], Any]] = None
+    ):
+        """
+        Inicializar el ejecutor.
+
+        Args:
+            run_query: Corrutina (consulta, session_id) -> resultado del agente
+            concurrency: Conversaciones simultáneas
+            rate_limit: Máximo de consultas por segundo (None = sin límite)
+            end_session: Se llama con cada session_id al terminar su guion (puede ser corrutina)
+        """
+        self.run_query = run_query
+        self.concurrency = max(concurrency, 1)
+        # Sin ráfagas: una consulta cada 1/rate_limit segundos
+        self.bucket = TokenBucket(1, rate_limit) if rate_limit else None
+        self.end_session = end_session
+        self.done = 0
+
+    @staticmethod
+    def _conversations(queries: List[BatchQuery]) -> List[List[BatchQuery]]:
+        """Agrupar por sesión conservando el orden; sin sesión, una por consulta"""
+        sessions: Dict[str, List[BatchQuery]] = {}
+        conversations = []
+        for item in queries:
+            if item.session_id is None:
+                conversations.append([item])
+            elif item.session_id in sessions:
+                sessions[item.session_id].append(item)
+            else:
+                sessions[item.session_id] = [item]
+                conversations.append(sessions[item.session_id])
+        return conversations
+
+    async def _throttle(self) -> None:
+        """Esperar turno según el límite de tasa"""
+        if self.bucket is None:
+            return
+        while not self.bucket.try_acquire():
+            await asyncio.sleep(self.bucket.retry_after())
+
+    async def _run_one(self, item: BatchQuery) -> Dict[str, Any]:
+        """Ejecutar una consulta y construir su registro de resultado"""
+        record: Dict[str, Any] = {
+            "index": item.index,
+            "id": item.id,
+            "session_id": item.session_id,
+            "query": item.query
+        }
+        if item.error is not None:
+            return {**record, "success": False, "error": item.error, "latency_ms": 0.0}
+
+        await self._throttle()
+        start = time.perf_counter()
+        try:
+            result = await self.run_query(item.query, item.session_id)
+        except Exception as e:
+            result = {"success": False, "error": str(e), "response": None}
+        latency = time.perf_counter() - start
+
+        record.update({
+            "success": result.get("success", False),
+            "response": result.get("response"),
+            "latency_ms": round(latency * 1000, 1),
+            "tool_calls": result.get("tool_calls", []),
+            "usage": result.get("usage", {})
+        })
+        if result.get("error"):
+            record["error"] = result["error"]
+        for flag in ("routed", "cached", "coalesced", "timed_out"):
+            if result.get(flag):
+                record[flag] = result[flag]
+        return record
+
+    def _write(self, out: IO[str], record: Dict[str, Any], total: int) -> None:
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+        self.done += 1
+        if self.done % PROGRESS_EVERY == 0 or self.done == total:
+            Logger.info(f"📦 Lote: {self.done}/{total} consultas")
+
+    async def run(self, queries: List[BatchQuery], output_path: str) -> Dict[str, Any]:
+        """
+        Ejecutar el lote y escribir los resultados.
+
+        Args:
+            queries: Consultas leídas con `read_batch`
+            output_path: Archivo JSONL de resultados (se sobrescribe)
+
+        Returns:
+            Resumen de la corrida (totales, latencias y tokens)
+        """
+        pending: asyncio.Queue = asyncio.Queue()
+        for conversation in self._conversations(queries):
+            pending.put_nowait(conversation)
+        records: List[Dict[str, Any]] = []
+        self.done = 0
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+
+        with open(output_path, "w", encoding="utf-8") as out:
+
+            async def worker() -> None:
+                while not pending.empty():
+                    conversation = pending.get_nowait()
+                    for item in conversation:
+                        record = await self._run_one(item)
+                        records.append(record)
+                        self._write(out, record, len(queries))
+                    session_id = conversation[0].session_id
+                    if session_id is not None and self.end_session is not None:
+                        ended = self.end_session(session_id)
+                        if inspect.isawaitable(ended):
+                            await ended
+
+            start = time.perf_counter()
+            await asyncio.gather(*[worker() for _ in range(min(self.concurrency, pending.qsize()) or 1)])
+            duration = time.perf_counter() - start
+
+        return self._summary(records, duration)
+
+    @staticmethod
+    def _summary(records: List[Dict[str, Any]], duration: float) -> Dict[str, Any]:
+        latencies = sorted(r["latency_ms"] for r in records if r.get("usage") is not None)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(int(p * len(latencies)), len(latencies) - 1)]
+
+        return {
+            "queries": len(records),
+            "succeeded": sum(1 for r in records if r["success"]),
+            "failed": sum(1 for r in records if not r["success"]),
+            "timed_out": sum(1 for r in records if r.get("timed_out")),
+            "duration_s": round(duration, 2),
+            "throughput_qps": round(len(records) / duration, 2) if duration > 0 else 0.0,
+            "latency_p50_ms": percentile(0.5),
+            "latency_p95_ms": percentile(0.95),
+            "llm_calls": sum(r.get("usage", {}).get("llm_calls", 0) for r in records),
+            "total_tokens": sum(r.get("usage", {}).get("total_tokens", 0) for r in records)
+        }
+
+
+class ServerClient:
+    """Ejecuta las consultas de un lote en el servidor web (POST /chat)"""
+
+    def __init__(self, base_url: str, timeout: float = 120.0, max_retries: int = 3):
+        """
+        Inicializar el cliente.
+
+        Args:
+            base_url: URL del servidor (p. ej. http://localhost:8000)
+            timeout: Segundos máximos por consulta
+            max_retries: Reintentos de una consulta rechazada por ocupado (429)
+        """
+        self.client = httpx.AsyncClient(base_url=base_url.rstrip("/"), timeout=timeout)
+        self.max_retries = max_retries
+
+    async def __call__(self, user_input: str, session_id: Optional[str]) -> Dict[str, Any]:
+        """
+        Enviar una consulta al servidor.
+
+        Args:
+            user_input: Pregunta del usuario
+            session_id: Sesión del guion (None = una propia que se cierra al responder)
+
+        Returns:
+            Resultado con la forma del agente: éxito, respuesta, tokens,
+            herramientas y marcas del turno según los informa /chat
+        """
+        if session_id is not None:
+            return await self._post(user_input, session_id)
+        # Sin sesión: una propia por consulta, como la memoria desechable local
+        session_id = f"batch-{uuid.uuid4().hex}"
+        try:
+            return await self._post(user_input, session_id)
+        finally:
+            await self.end_session(session_id)
+
+    async def _post(self, user_input: str, session_id: str) -> Dict[str, Any]:
+        for attempt in range(self.max_retries + 1):
+            response = await self.client.post("/chat", json={"message": user_input, "session_id": session_id})
+            if response.status_code != 429 or attempt == self.max_retries:
+                break
+            # Control de admisión del servidor: esperar lo que indica y reintentar
+            await asyncio.sleep(float(response.headers.get("retry-after", 1)))
+
+        if response.status_code != 200:
+            try:
+                detail = response.json().get("detail")
+            except ValueError:
+                detail = response.text
+            return {"success": False, "error": f"HTTP {response.status_code}: {detail}", "response": None}
+        body = response.json()
+        return {
+            **body.get("flags", {}),
+            "success": body.get("success", False),
+            "response": body["response"],
+            "usage": body.get("usage") or {},
+            "tool_calls": body.get("tool_calls", [])
+        }
+
+    async def end_session(self, session_id: str) -> None:
+        """Liberar en el servidor la memoria y el historial de una sesión del lote"""
+        try:
+            await self.client.delete(f"/history/{session_id}")
+        except httpx.HTTPError as e:
+            Logger.warning(f"No se pudo cerrar la sesión {session_id}: {e}")
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
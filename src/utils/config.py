@@ -31,3 +31,7 @@ class ConfigLoader:
     def load_agent_config(self) -> Dict[str, Any]:
         """Cargar configuración del agente"""
         return self.load_config("agent_config.yaml")
+    
+    def load_server_config(self) -> Dict[str, Any]:
+        """Cargar configuración del servidor web"""
+        return self.load_config("server_config.yaml")
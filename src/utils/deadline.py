@@ -0,0 +1,102 @@
+"""
+Plazo (deadline) de extremo a extremo para cada consulta.
+
+El plazo vive en una variable de contexto: el agente lo fija al iniciar
+la consulta y se propaga a las tareas del grafo y a los hilos del pool de
+herramientas (que copian el contexto). Las herramientas acotan sus
+timeouts de red con `timeout_for()` para no exceder el tiempo restante.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Se agotó el plazo de la consulta"""
+
+
+def deadline_after(seconds: Optional[float]) -> Optional[float]:
+    """
+    Calcular el instante límite para una consulta que empieza ahora.
+
+    Si el contexto ya tiene un plazo más cercano se conserva ese.
+
+    Args:
+        seconds: Segundos disponibles desde ahora (None = sin plazo)
+
+    Returns:
+        Instante límite (time.monotonic) o None
+    """
+    current = _deadline.get()
+    deadline = time.monotonic() + seconds if seconds else None
+    if current is not None and (deadline is None or current < deadline):
+        deadline = current
+    return deadline
+
+
+def set_deadline(deadline: Optional[float]) -> None:
+    """
+    Fijar el plazo en el contexto actual.
+
+    Pensado para el inicio de una tarea dedicada a la consulta: cada tarea
+    tiene su propia copia del contexto, así que no hace falta restaurarlo.
+    """
+    _deadline.set(deadline)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[Optional[float]]:
+    """Fijar un plazo durante un bloque de código síncrono"""
+    token = _deadline.set(deadline_after(seconds))
+    try:
+        yield _deadline.get()
+    finally:
+        _deadline.reset(token)
+
+
+def get_deadline() -> Optional[float]:
+    """Instante límite vigente (None = sin plazo)"""
+    return _deadline.get()
+
+
+def remaining(deadline: Optional[float] = None) -> Optional[float]:
+    """
+    Segundos restantes hasta el plazo.
+
+    Args:
+        deadline: Instante límite (por defecto el del contexto)
+
+    Returns:
+        Segundos restantes (puede ser negativo), o None si no hay plazo
+    """
+    deadline = deadline if deadline is not None else _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    """Verificar si el plazo del contexto ya venció"""
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def timeout_for(default: float) -> float:
+    """
+    Timeout para una operación de red acotado por el plazo restante.
+
+    Args:
+        default: Timeout propio de la operación
+
+    Raises:
+        DeadlineExceeded: si el plazo ya venció
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("Se agotó el tiempo de la consulta")
+    return min(default, left)
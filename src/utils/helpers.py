@@ -2,6 +2,7 @@
 Módulo de utilidades generales
 """
 import os
+import time
 from typing import Dict, Any
 from datetime import datetime
 
@@ -60,32 +61,61 @@ class UserPreferences:
         return self.preferences.copy()
 
 
+class TokenBucket:
+    """Cubeta de tokens: permite ráfagas de `capacity` y recarga continua"""
+    
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+    
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self.updated_at = now
+    
+    def try_acquire(self, amount: float = 1) -> bool:
+        """Consumir tokens si hay suficientes (O(1))"""
+        self._refill(time.monotonic())
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+    
+    def retry_after(self, amount: float = 1) -> float:
+        """Segundos hasta que haya `amount` tokens disponibles"""
+        self._refill(time.monotonic())
+        missing = amount - self.tokens
+        if missing <= 0:
+            return 0.0
+        if self.refill_per_second <= 0:
+            return float("inf")
+        return missing / self.refill_per_second
+    
+    def available(self) -> float:
+        """Tokens disponibles ahora"""
+        self._refill(time.monotonic())
+        return self.tokens
+
+
 class APIRateLimiter:
     """Limitador de tasa para llamadas a API"""
     
     def __init__(self, max_calls: int = 10, time_window: int = 60):
         self.max_calls = max_calls
         self.time_window = time_window
-        self.calls = []
+        # Cubeta equivalente: hasta max_calls seguidas, recarga de max_calls por ventana
+        self.bucket = TokenBucket(max_calls, max_calls / time_window)
     
     def is_allowed(self) -> bool:
         """Verificar si una llamada está permitida"""
-        import time
-        current_time = time.time()
-        
-        # Limpiar llamadas antiguas
-        self.calls = [call_time for call_time in self.calls 
-                     if current_time - call_time < self.time_window]
-        
-        if len(self.calls) < self.max_calls:
-            self.calls.append(current_time)
-            return True
-        
-        return False
+        return self.bucket.try_acquire()
     
     def get_remaining_calls(self) -> int:
         """Obtener llamadas restantes"""
-        return max(0, self.max_calls - len(self.calls))
+        return int(self.bucket.available())
 
 
 class EnvironmentConfig:
@@ -0,0 +1,418 @@
+"""
+Almacenamiento del historial de conversaciones del servidor web.
+
+El historial reciente de cada sesión vive en RAM como un buffer circular;
+lo que excede el buffer, o el presupuesto global de bytes, se escribe en
+SQLite (modo WAL) mediante un hilo de escritura diferida por lotes. Las
+lecturas no esperan al escritor: combinan lo que ya está en disco con lo
+que aún está en cola.
+"""
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from src.utils.helpers import Logger
+
+# (rol, contenido, timestamp epoch)
+HistoryEntry = Tuple[str, str, float]
+
+# Sobrecosto aproximado por mensaje en RAM (tupla, floats, referencias)
+_ENTRY_OVERHEAD = 120
+
+
+def _entry_size(entry: HistoryEntry) -> int:
+    """Estimar los bytes que ocupa un mensaje en RAM"""
+    return len(entry[1]) + len(entry[0]) + _ENTRY_OVERHEAD
+
+
+def _entry_to_dict(entry: HistoryEntry) -> Dict[str, str]:
+    """Convertir un mensaje al formato público de la API"""
+    role, content, timestamp = entry
+    return {
+        "role": role,
+        "content": content,
+        "timestamp": datetime.fromtimestamp(timestamp).isoformat()
+    }
+
+
+class HistoryStore(ABC):
+    """Interfaz base de almacenamiento de historial"""
+
+    @abstractmethod
+    def add(self, session_id: str, role: str, content: str) -> None:
+        """Agregar un mensaje al historial de una sesión"""
+        pass
+
+    @abstractmethod
+    def get(self, session_id: str) -> List[Dict[str, str]]:
+        """Obtener el historial completo de una sesión"""
+        pass
+
+    @abstractmethod
+    def clear(self, session_id: str) -> None:
+        """Eliminar el historial de una sesión"""
+        pass
+
+    @abstractmethod
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas del almacenamiento"""
+        pass
+
+    def close(self) -> None:
+        """Liberar recursos (vaciar escrituras pendientes)"""
+        pass
+
+
+class InMemoryHistoryStore(HistoryStore):
+    """
+    Historial en RAM con un buffer circular por sesión.
+
+    Los mensajes que salen del buffer o del presupuesto global se descartan.
+    `TieredHistoryStore` extiende esta clase para enviarlos a disco.
+    """
+
+    def __init__(self, ring_size: int = 50, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Inicializar el almacenamiento.
+
+        Args:
+            ring_size: Mensajes por sesión que se mantienen en RAM
+            max_bytes: Presupuesto global de bytes en RAM para todas las sesiones
+        """
+        self.ring_size = ring_size
+        self.max_bytes = max_bytes
+        # Orden de uso reciente: las sesiones más antiguas se desalojan primero
+        self._rings: "OrderedDict[str, Deque[HistoryEntry]]" = OrderedDict()
+        self._bytes = 0
+        # Reentrante: las subclases extienden operaciones bajo el mismo lock
+        self._lock = threading.RLock()
+
+    def add(self, session_id: str, role: str, content: str) -> None:
+        entry = (role, content, time.time())
+
+        with self._lock:
+            ring = self._rings.get(session_id)
+            if ring is None:
+                ring = deque()
+                self._rings[session_id] = ring
+            else:
+                self._rings.move_to_end(session_id)
+
+            if len(ring) >= self.ring_size:
+                oldest = ring.popleft()
+                self._bytes -= _entry_size(oldest)
+                self._overflow(session_id, [oldest])
+
+            ring.append(entry)
+            self._bytes += _entry_size(entry)
+
+            self._enforce_budget()
+
+    def _enforce_budget(self) -> None:
+        """Desalojar sesiones completas hasta cumplir el presupuesto (con lock)"""
+        while self._bytes > self.max_bytes and len(self._rings) > 1:
+            session_id, ring = self._rings.popitem(last=False)
+            self._bytes -= sum(_entry_size(e) for e in ring)
+            self._overflow(session_id, list(ring))
+
+    def _overflow(self, session_id: str, entries: List[HistoryEntry]) -> None:
+        """Destino de los mensajes desalojados de RAM (aquí se descartan)"""
+        pass
+
+    def _get_ram(self, session_id: str) -> List[HistoryEntry]:
+        with self._lock:
+            return list(self._rings.get(session_id, ()))
+
+    def get(self, session_id: str) -> List[Dict[str, str]]:
+        return [_entry_to_dict(e) for e in self._get_ram(session_id)]
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            ring = self._rings.pop(session_id, None)
+            if ring:
+                self._bytes -= sum(_entry_size(e) for e in ring)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "ram_sessions": len(self._rings),
+                "ram_messages": sum(len(r) for r in self._rings.values()),
+                "ram_bytes": self._bytes,
+                "max_bytes": self.max_bytes
+            }
+
+
+class SQLiteHistoryWriter:
+    """Escritura diferida por lotes sobre SQLite en modo WAL"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            ts REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id);
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 0.5,
+        batch_size: int = 200,
+        on_applied: Optional[Callable[[Tuple], None]] = None
+    ):
+        """
+        Inicializar el escritor.
+
+        Args:
+            path: Ruta del archivo SQLite
+            flush_interval: Segundos máximos que una escritura espera en cola
+            batch_size: Máximo de operaciones por transacción
+            on_applied: Se llama (en el hilo escritor) con cada operación ya
+                confirmada en disco, o descartada por un error
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.on_applied = on_applied
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+        conn.close()
+
+        self._reader = self._connect()
+        self._reader_lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[Tuple]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def insert(self, session_id: str, entries: List[HistoryEntry]) -> None:
+        """Encolar mensajes para insertar"""
+        self._queue.put(("insert", session_id, entries))
+
+    def delete(self, session_id: str) -> None:
+        """Encolar el borrado de una sesión (respeta el orden de la cola)"""
+        self._queue.put(("delete", session_id, None))
+
+    def flush(self) -> None:
+        """
+        Esperar a que todas las operaciones encoladas estén en disco.
+
+        Espera también a las que se encolen mientras tanto: no usar en el
+        camino de las peticiones.
+        """
+        self._queue.join()
+
+    def pending(self) -> int:
+        """Número de operaciones aún en cola"""
+        return self._queue.qsize()
+
+    def _run(self) -> None:
+        """Bucle del hilo escritor"""
+        conn = self._connect()
+        while True:
+            op = self._queue.get()
+            if op is None:
+                self._queue.task_done()
+                break
+
+            # Dar tiempo a que se acumulen más operaciones, salvo que ya haya un lote lleno
+            if self._queue.qsize() < self.batch_size:
+                time.sleep(self.flush_interval)
+            batch = [op]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            try:
+                with conn:
+                    for item in batch:
+                        if item is not None:
+                            self._apply(conn, item)
+            except sqlite3.Error as e:
+                Logger.error(f"Error escribiendo historial en SQLite: {e}")
+            finally:
+                for item in batch:
+                    if item is not None and self.on_applied is not None:
+                        self.on_applied(item)
+                    self._queue.task_done()
+
+            if stop:
+                break
+        conn.close()
+
+    @staticmethod
+    def _apply(conn: sqlite3.Connection, op: Tuple) -> None:
+        kind, session_id, entries = op
+        if kind == "insert":
+            conn.executemany(
+                "INSERT INTO messages (session_id, role, content, ts) VALUES (?, ?, ?, ?)",
+                [(session_id, role, content, ts) for role, content, ts in entries]
+            )
+        elif kind == "delete":
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+
+    def read(self, session_id: str) -> List[HistoryEntry]:
+        """Leer los mensajes de una sesión en orden de inserción"""
+        with self._reader_lock:
+            rows = self._reader.execute(
+                "SELECT role, content, ts FROM messages WHERE session_id = ? ORDER BY id",
+                (session_id,)
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def count(self) -> Tuple[int, int]:
+        """Contar sesiones y mensajes en disco"""
+        with self._reader_lock:
+            row = self._reader.execute(
+                "SELECT COUNT(DISTINCT session_id), COUNT(*) FROM messages"
+            ).fetchone()
+        return row[0], row[1]
+
+    def close(self) -> None:
+        """Vaciar la cola y detener el hilo escritor"""
+        self._queue.put(None)
+        self._thread.join()
+        with self._reader_lock:
+            self._reader.close()
+
+
+class TieredHistoryStore(InMemoryHistoryStore):
+    """
+    Historial en dos niveles: RAM (reciente) y SQLite (desbordamiento).
+
+    Las lecturas combinan ambos niveles de forma transparente. Los mensajes
+    que salen de RAM quedan en `_pending` de su sesión hasta que el
+    escritor los confirma en disco, así que una lectura nunca espera a la
+    cola de escritura (que con escrituras sostenidas no se vacía).
+    """
+
+    def __init__(
+        self,
+        sqlite_path: str = "data/history/history.db",
+        ring_size: int = 50,
+        max_bytes: int = 64 * 1024 * 1024,
+        flush_interval: float = 0.5,
+        batch_size: int = 200
+    ):
+        super().__init__(ring_size=ring_size, max_bytes=max_bytes)
+        # Mensajes en cola hacia disco, por sesión (se quitan al confirmarse)
+        self._pending: Dict[str, Deque[HistoryEntry]] = {}
+        # Borrados en cola: (momento del borrado, operaciones pendientes)
+        self._deleting: Dict[str, List[float]] = {}
+        self.writer = SQLiteHistoryWriter(sqlite_path, flush_interval, batch_size, on_applied=self._applied)
+
+    def _overflow(self, session_id: str, entries: List[HistoryEntry]) -> None:
+        # Se llama con el lock tomado
+        if entries:
+            self._pending.setdefault(session_id, deque()).extend(entries)
+            self.writer.insert(session_id, entries)
+
+    def _applied(self, op: Tuple) -> None:
+        """Operación confirmada por el escritor: deja de estar pendiente"""
+        kind, session_id, entries = op
+        with self._lock:
+            if kind == "insert":
+                pending = self._pending.get(session_id)
+                # La cola es FIFO: son los primeros pendientes de la sesión
+                # (salvo que la sesión se haya borrado mientras tanto)
+                for entry in entries:
+                    if not pending or pending[0] is not entry:
+                        break
+                    pending.popleft()
+                if pending is not None and not pending:
+                    del self._pending[session_id]
+            elif kind == "delete":
+                deleting = self._deleting.get(session_id)
+                if deleting is not None:
+                    deleting[1] -= 1
+                    if deleting[1] <= 0:
+                        del self._deleting[session_id]
+
+    def get(self, session_id: str) -> List[Dict[str, str]]:
+        # En disco está lo más antiguo, luego lo pendiente y luego la RAM; lo
+        # que el escritor confirme tras esta captura aparece también en disco
+        # y se filtra por fecha
+        with self._lock:
+            memory_entries = list(self._pending.get(session_id, ())) + list(self._rings.get(session_id, ()))
+            deleting = self._deleting.get(session_id)
+            cleared_at = deleting[0] if deleting is not None else None
+        disk_entries = self.writer.read(session_id)
+        if cleared_at is not None:
+            # Borrado aún en cola: en disco solo vale lo escrito después
+            disk_entries = [e for e in disk_entries if e[2] >= cleared_at]
+        if memory_entries:
+            disk_entries = [e for e in disk_entries if e[2] < memory_entries[0][2]]
+        return [_entry_to_dict(e) for e in disk_entries + memory_entries]
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            super().clear(session_id)
+            # Bajo el lock: el borrado queda en cola en orden con las inserciones
+            self._pending.pop(session_id, None)
+            deleting = self._deleting.setdefault(session_id, [0.0, 0])
+            deleting[0] = time.time()
+            deleting[1] += 1
+            self.writer.delete(session_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        disk_sessions, disk_messages = self.writer.count()
+        stats.update({
+            "backend": "tiered",
+            "disk_sessions": disk_sessions,
+            "disk_messages": disk_messages,
+            "pending_writes": self.writer.pending()
+        })
+        return stats
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def create_history_store(config: Optional[Dict[str, Any]] = None) -> HistoryStore:
+    """
+    Crear el almacenamiento de historial según configuración.
+
+    Args:
+        config: Sección `history` de server_config.yaml
+
+    Returns:
+        Instancia de HistoryStore
+    """
+    config = config or {}
+    backend = config.get("backend", "tiered")
+    ring_size = config.get("ring_size", 50)
+    max_bytes = config.get("max_bytes", 64 * 1024 * 1024)
+
+    if backend == "memory":
+        return InMemoryHistoryStore(ring_size=ring_size, max_bytes=max_bytes)
+    if backend == "tiered":
+        return TieredHistoryStore(
+            sqlite_path=config.get("sqlite_path", "data/history/history.db"),
+            ring_size=ring_size,
+            max_bytes=max_bytes,
+            flush_interval=config.get("flush_interval", 0.5),
+            batch_size=config.get("batch_size", 200)
+        )
+
+    raise ValueError(f"Backend de historial no soportado: {backend}")
@@ -0,0 +1,265 @@
+"""
+Métricas del servidor en formato de texto de Prometheus.
+
+Contadores, gauges e histogramas que se actualizan de forma incremental
+(O(1) por evento), de modo que exponerlos no depende del volumen de
+mensajes ni de sesiones acumuladas.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Buckets de latencia en segundos (de milisegundos a un minuto)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    """Formatear etiquetas como {a="x",b="y"}"""
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base común de las métricas con etiquetas"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}"
+        ]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Contador monótono"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Valor para un conjunto de etiquetas"""
+        return self._values.get(self._key(labels), 0)
+
+    def total(self) -> float:
+        """Suma sobre todas las etiquetas"""
+        with self._lock:
+            return sum(self._values.values())
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+            for key, v in items
+        ]
+
+
+class Gauge(Counter):
+    """Valor que puede subir y bajar"""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track_inprogress(self, **labels: str) -> Iterator[None]:
+        """Incrementar mientras dura el bloque"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """Histograma con buckets fijos"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # etiquetas -> [conteos por bucket (+Inf al final), suma, total]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[key] = entry
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Medir la duración del bloque"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(e[0]), e[1], e[2]) for key, e in self._values.items()]
+
+        lines = []
+        for key, counts, total_sum, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Registro de métricas del proceso"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Optional[Sequence[float]] = None
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets or DEFAULT_BUCKETS))
+
+    def render(self) -> str:
+        """Exportar todas las métricas en formato de texto de Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Registro global del proceso
+metrics = MetricsRegistry()
+
+# Métricas compartidas entre módulos
+SESSIONS_TOTAL = metrics.counter(
+    "chatbot_sessions_total", "Sesiones de conversación creadas"
+)
+ACTIVE_SESSIONS = metrics.gauge(
+    "chatbot_active_sessions", "Sesiones residentes en el registro"
+)
+MESSAGES_TOTAL = metrics.counter(
+    "chatbot_messages_total", "Mensajes registrados en el historial", ["role"]
+)
+ACTIVE_WEBSOCKETS = metrics.gauge(
+    "chatbot_active_websockets", "Conexiones WebSocket abiertas"
+)
+AGENT_RUNS_IN_FLIGHT = metrics.gauge(
+    "chatbot_agent_runs_in_flight", "Ejecuciones del agente en curso"
+)
+REQUEST_LATENCY = metrics.histogram(
+    "chatbot_request_duration_seconds", "Latencia de extremo a extremo por endpoint", ["endpoint"]
+)
+LLM_LATENCY = metrics.histogram(
+    "chatbot_llm_call_duration_seconds", "Latencia de cada llamada al LLM", ["model"]
+)
+LLM_TOKENS = metrics.counter(
+    "chatbot_llm_tokens_total", "Tokens consumidos en llamadas al LLM", ["type"]
+)
+TOOL_LATENCY = metrics.histogram(
+    "chatbot_tool_call_duration_seconds", "Latencia de cada llamada a herramienta", ["tool"]
+)
+TOOL_ERRORS = metrics.counter(
+    "chatbot_tool_errors_total", "Llamadas a herramientas que lanzaron excepción", ["tool"]
+)
+TOOL_TIMEOUTS = metrics.counter(
+    "chatbot_tool_timeouts_total", "Llamadas a herramientas que superaron su timeout", ["tool"]
+)
+TOOL_CALLS_ABANDONED = metrics.gauge(
+    "chatbot_tool_calls_abandoned",
+    "Llamadas con timeout agotado que aún ocupan un hilo del pool de herramientas",
+    ["tool"]
+)
+AGENT_DEADLINE_EXCEEDED = metrics.counter(
+    "chatbot_agent_deadline_exceeded_total", "Consultas cortadas por agotar su plazo", ["fallback"]
+)
+AGENT_STEP_LIMIT = metrics.counter(
+    "chatbot_agent_step_limit_total", "Consultas cortadas por agotar max_iterations"
+)
@@ -0,0 +1,105 @@
+"""
+Streaming SSE del servidor web (/chat/stream).
+
+Dos problemas que StreamingResponse no resuelve por sí sola:
+    - Un recurso tomado antes de responder (el turno de admisión) debe
+      liberarse aunque el generador nunca llegue a iterarse, p. ej. si el
+      cliente se desconecta antes del primer byte.
+    - La desconexión del cliente se detecta al enviar; mientras el agente
+      no emite eventos (una herramienta lenta) la ejecución seguiría
+      ocupando su turno.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+# Fin del stream de eventos
+_END = object()
+
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """StreamingResponse que cierra su generador y llama a `on_close` al terminar, pase lo que pase"""
+
+    def __init__(self, content: AsyncIterator[Any], on_close: Callable[[], None], **kwargs: Any):
+        """
+        Inicializar la respuesta.
+
+        Args:
+            content: Generador asíncrono del cuerpo
+            on_close: Se llama una vez, al terminar o abortarse la respuesta
+            **kwargs: Argumentos de StreamingResponse
+        """
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                # Cancelado en un `yield`, el generador no se cierra solo
+                await self.body_iterator.aclose()
+            finally:
+                self.on_close()
+
+
+async def until_disconnected(
+    events: AsyncIterator[Any],
+    is_disconnected: Callable[[], Awaitable[bool]],
+    poll_interval: float = 0.5
+) -> AsyncIterator[Any]:
+    """
+    Reenviar los eventos de `events` mientras el cliente siga conectado.
+
+    Los eventos se consumen en una tarea propia, así que la desconexión se
+    comprueba cada `poll_interval` segundos aunque no lleguen eventos. Al
+    detectarla (o al cerrar este generador) se cierra `events`, lo que
+    cancela la ejecución del agente.
+
+    Args:
+        events: Eventos del agente
+        is_disconnected: `Request.is_disconnected`
+        poll_interval: Segundos entre comprobaciones sin eventos
+
+    Yields:
+        Los eventos de `events`, hasta el último o hasta la desconexión
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+    async def pump() -> None:
+        try:
+            async for event in events:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(_END)
+        finally:
+            await events.aclose()
+
+    task = asyncio.ensure_future(pump())
+    getter: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=poll_interval)
+            if not done:
+                if await is_disconnected():
+                    return
+                continue
+            item, getter = getter.result(), None
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            if await is_disconnected():
+                return
+            yield item
+    finally:
+        for pending in (getter, task):
+            if pending is not None and not pending.done():
+                pending.cancel()
+        await asyncio.wait({task})
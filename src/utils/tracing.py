@@ -0,0 +1,308 @@
+"""
+Perfilado por pasos de cada consulta.
+
+Cada petición del servidor abre una traza con su `request_id`; dentro, cada
+paso del agente registra un span con su inicio, duración, span padre y
+atributos (tokens de una llamada al LLM, herramienta, URL...):
+
+    turn
+    ├── prepare_messages            (serialization)
+    ├── agent (paso 1)              (step)
+    │   └── llm gpt-4o-mini         (llm, tokens de entrada/salida)
+    ├── tools (paso 2)              (step)
+    │   ├── get_current_weather     (tool: espera en el pool incluida)
+    │   │   └── exec get_current_weather   (hilo del pool)
+    │   │       └── http GET api.openweathermap.org
+    │   └── ...
+    └── agent (paso 3)
+
+Los pasos del grafo y las llamadas al LLM se registran con callbacks de
+LangChain (`TracingCallbackHandler`); el resto con `span()`, que encuentra
+su padre por contextvars (también en los hilos del pool, que copian el
+contexto) o por la ejecución de LangChain en curso. Sin traza activa,
+`span()` no registra nada.
+
+Las trazas terminadas se guardan en memoria (las últimas `max_traces`) y se
+exportan en el formato JSON de Chrome trace, que abren chrome://tracing y
+https://ui.perfetto.dev: cada tarea asíncrona e hilo aparece en su propia
+pista, así que las herramientas en paralelo y el camino crítico se ven
+directamente.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from langchain_core.runnables.config import var_child_runnable_config
+
+
+@dataclass
+class Span:
+    """Tramo medido de una traza"""
+    id: int
+    name: str
+    category: str
+    start: float
+    parent_id: Optional[int]
+    track: Hashable
+    end: Optional[float] = None
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+def _track() -> Tuple[Hashable, str]:
+    """Pista del span: la tarea asíncrona actual o el hilo"""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return ("task", id(task)), f"async {task.get_name()}"
+    thread = threading.current_thread()
+    return ("thread", thread.ident), thread.name
+
+
+class Trace:
+    """Spans de una petición"""
+
+    def __init__(self, request_id: str, name: str = "turn"):
+        self.request_id = request_id
+        self.name = name
+        self.started_at = datetime.now().isoformat()
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.spans: List[Span] = []
+        # pista -> (tid, nombre) para la exportación
+        self.tracks: Dict[Hashable, Tuple[int, str]] = {}
+        # Ejecución de LangChain -> span más cercano que la contiene
+        self.run_spans: Dict[Any, Optional[int]] = {}
+        # Spans abiertos por callbacks, por ejecución de LangChain
+        self.open_runs: Dict[Any, Span] = {}
+        self._lock = threading.Lock()
+
+    def open(self, name: str, category: str, parent_id: Optional[int], **attrs: Any) -> Span:
+        """Abrir un span en la pista actual"""
+        key, label = _track()
+        with self._lock:
+            if key not in self.tracks:
+                self.tracks[key] = (len(self.tracks) + 1, label)
+            span = Span(len(self.spans) + 1, name, category, time.perf_counter(), parent_id, key, attrs=attrs)
+            self.spans.append(span)
+        return span
+
+    @staticmethod
+    def close(span: Span, **attrs: Any) -> None:
+        """Cerrar un span"""
+        span.attrs.update(attrs)
+        span.end = time.perf_counter()
+
+    def parent_id(self) -> Optional[int]:
+        """
+        Span padre para un span nuevo.
+
+        Candidatos: el span del contexto actual y el de la ejecución de
+        LangChain en curso (pasos del grafo, herramientas); ambos contienen
+        el punto actual, así que el que empezó más tarde es el más interno.
+        """
+        current = _current_span.get()
+        candidates = [current.id] if current is not None else []
+        config = var_child_runnable_config.get()
+        callbacks = config.get("callbacks") if config else None
+        run_id = getattr(callbacks, "parent_run_id", None)
+        if run_id is not None and self.run_spans.get(run_id) is not None:
+            candidates.append(self.run_spans[run_id])
+        if not candidates:
+            return None
+        return max(candidates, key=lambda span_id: self.spans[span_id - 1].start)
+
+    def finish(self) -> None:
+        """Cerrar la traza (los spans sin cerrar se marcan incompletos)"""
+        self.end = time.perf_counter()
+        for span in self.spans:
+            if span.end is None:
+                span.end = self.end
+                span.attrs["incomplete"] = True
+        self.open_runs.clear()
+        self.run_spans.clear()
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return round((end - self.start) * 1000, 1)
+
+    def summary(self) -> Dict[str, Any]:
+        """Resumen: duración, número de spans y tiempo por categoría"""
+        by_category: Dict[str, float] = {}
+        for span in self.spans:
+            if span.end is not None and span.parent_id is not None:
+                by_category[span.category] = by_category.get(span.category, 0.0) + (span.end - span.start) * 1000
+        return {
+            "request_id": self.request_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "spans": len(self.spans),
+            # Suma de spans: los que corren en paralelo se cuentan por separado
+            "time_by_category_ms": {k: round(v, 1) for k, v in sorted(by_category.items())}
+        }
+
+    def to_chrome(self) -> Dict[str, Any]:
+        """Exportar en formato Chrome trace (chrome://tracing, Perfetto)"""
+        end = self.end if self.end is not None else time.perf_counter()
+        events: List[Dict[str, Any]] = [
+            {"name": "process_name", "ph": "M", "pid": 1, "args": {"name": f"{self.name} {self.request_id}"}}
+        ]
+        for tid, label in self.tracks.values():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": label}})
+        for span in self.spans:
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "pid": 1,
+                "tid": self.tracks[span.track][0],
+                "ts": round((span.start - self.start) * 1e6, 1),
+                "dur": round(((span.end or end) - span.start) * 1e6, 1),
+                "args": {"span_id": span.id, "parent_id": span.parent_id, **span.attrs}
+            })
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"request_id": self.request_id, "started_at": self.started_at}
+        }
+
+
+class TraceStore:
+    """Últimas trazas terminadas, por request_id"""
+
+    def __init__(self, max_traces: int = 200):
+        self.max_traces = max_traces
+        self._traces: "OrderedDict[str, Trace]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace) -> None:
+        with self._lock:
+            self._traces[trace.request_id] = trace
+            self._traces.move_to_end(trace.request_id)
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+    def get(self, request_id: str) -> Optional[Trace]:
+        with self._lock:
+            return self._traces.get(request_id)
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Resúmenes de las trazas más recientes primero"""
+        with self._lock:
+            traces = list(self._traces.values())[-limit:]
+        return [trace.summary() for trace in reversed(traces)]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"enabled": _enabled, "stored": len(self._traces), "max_traces": self.max_traces}
+
+
+_enabled = True
+_store = TraceStore()
+
+
+def configure_tracing(enabled: bool = True, max_traces: int = 200) -> None:
+    """
+    Configurar el perfilado de consultas.
+
+    Args:
+        enabled: Registrar trazas por petición
+        max_traces: Trazas terminadas que se conservan en memoria
+    """
+    global _enabled, _store
+
+    _enabled = enabled
+    _store = TraceStore(max_traces)
+
+
+def get_trace_store() -> TraceStore:
+    """Almacén de trazas terminadas"""
+    return _store
+
+
+def current_trace() -> Optional[Trace]:
+    """Traza de la petición en curso"""
+    return _current_trace.get()
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def trace_request(request_id: str, name: str = "turn", **attrs: Any) -> Iterator[Optional[Trace]]:
+    """
+    Trazar una petición: todo lo que se ejecute dentro (y en las tareas e
+    hilos que copien su contexto) registra sus spans en esta traza.
+
+    Args:
+        request_id: Identificador para recuperar la traza
+        name: Nombre del span raíz
+        attrs: Atributos del span raíz (sesión, endpoint...)
+
+    Yields:
+        La traza, o None si el perfilado está desactivado
+    """
+    if not _enabled:
+        yield None
+        return
+
+    trace = Trace(request_id, name)
+    root = trace.open(name, "request", None, **attrs)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(root)
+    try:
+        yield trace
+    finally:
+        try:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+        except ValueError:
+            # Generador cerrado desde otro contexto: el contexto original ya no se usa
+            pass
+        Trace.close(root)
+        trace.finish()
+        _store.add(trace)
+
+
+@contextmanager
+def span(name: str, category: str = "step", **attrs: Any) -> Iterator[Optional[Span]]:
+    """
+    Medir un tramo dentro de la traza en curso (sin traza no hace nada).
+
+    Args:
+        name: Nombre del tramo
+        category: llm, tool, io, parse, search, serialization...
+        attrs: Atributos del tramo
+
+    Yields:
+        El span, para añadir atributos; None si no hay traza activa
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    current = trace.open(name, category, trace.parent_id(), **attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        Trace.close(current)
@@ -0,0 +1,85 @@
+"""
+Precarga de componentes al iniciar el servidor.
+
+Cada componente (agente, índice FAISS, caché de tours) se carga y valida
+en un hilo aparte, midiendo su tiempo. El servidor solo se reporta como
+listo cuando la precarga terminó y los componentes obligatorios están OK.
+"""
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from src.handlers.async_tools import run_in_tool_executor
+from src.utils.helpers import Logger
+from src.utils.metrics import metrics
+
+WARMUP_DURATION = metrics.gauge(
+    "chatbot_warmup_duration_seconds", "Tiempo de precarga por componente", ["component"]
+)
+
+
+class WarmupStage:
+    """Etapa de precarga con reporte por componente"""
+
+    def __init__(self):
+        # nombre -> (función de carga, obligatorio)
+        self._steps: Dict[str, tuple] = {}
+        self.report: Dict[str, Dict[str, Any]] = {}
+        self.started_at: Optional[float] = None
+        self.finished = False
+
+    def add(self, name: str, loader: Callable[[], Optional[str]], required: bool = True) -> None:
+        """
+        Registrar un componente.
+
+        Args:
+            name: Nombre del componente
+            loader: Función síncrona que carga y valida el componente.
+                    Devuelve un detalle opcional o lanza excepción si falla.
+            required: Si su fallo impide declarar el servidor como listo
+        """
+        self._steps[name] = (loader, required)
+        self.report[name] = {"status": "pending", "required": required}
+
+    async def run(self) -> Dict[str, Dict[str, Any]]:
+        """Ejecutar todas las cargas en paralelo"""
+        self.started_at = time.time()
+        Logger.info(f"🔥 Precargando componentes: {', '.join(self._steps)}")
+        await asyncio.gather(*[self._run_step(name) for name in self._steps])
+        self.finished = True
+
+        if self.ready:
+            Logger.info("✅ Precarga completada, servidor listo")
+        else:
+            Logger.error(f"❌ Precarga incompleta: {self.failed_components()}")
+        return self.report
+
+    async def _run_step(self, name: str) -> None:
+        loader, required = self._steps[name]
+        self.report[name]["status"] = "loading"
+        start = time.perf_counter()
+        try:
+            detail = await run_in_tool_executor(loader)
+            self.report[name].update({"status": "ok", "detail": detail})
+        except Exception as e:
+            self.report[name].update({"status": "error", "detail": str(e)})
+        finally:
+            elapsed = time.perf_counter() - start
+            self.report[name]["duration_ms"] = round(elapsed * 1000, 1)
+            WARMUP_DURATION.set(elapsed, component=name)
+            Logger.info(
+                f"   {name}: {self.report[name]['status']} "
+                f"({self.report[name]['duration_ms']} ms) {self.report[name].get('detail') or ''}"
+            )
+
+    def failed_components(self) -> List[str]:
+        """Componentes obligatorios que fallaron"""
+        return [
+            name for name, info in self.report.items()
+            if info["required"] and info["status"] != "ok"
+        ]
+
+    @property
+    def ready(self) -> bool:
+        """Precarga terminada y componentes obligatorios disponibles"""
+        return self.finished and not self.failed_components()
@@ -0,0 +1,178 @@
+"""
+Conexión WebSocket multiplexada.
+
+Cada mensaje del cliente lleva un `id` de petición; varias peticiones
+pueden estar en curso a la vez en la misma conexión y cada frame de
+respuesta incluye el `id` al que pertenece. El cliente puede cancelar una
+petición con un frame `cancel`, y al desconectarse se cancelan todas.
+
+Los frames salen por una cola acotada con un único escritor: si el
+navegador no lee a tiempo se descartan primero los frames de progreso
+(tokens y herramientas, que el frame final reemplaza) y, si tampoco hay
+espacio para un frame esencial, la conexión se cierra.
+"""
+import asyncio
+import itertools
+import json
+from typing import Any, Coroutine, Dict, Optional
+
+from fastapi import WebSocket
+
+from src.utils.helpers import Logger
+from src.utils.metrics import metrics
+
+WS_FRAMES_DROPPED = metrics.counter(
+    "chatbot_ws_frames_dropped_total", "Frames de progreso descartados por clientes lentos"
+)
+WS_REQUESTS_CANCELLED = metrics.counter(
+    "chatbot_ws_requests_cancelled_total", "Peticiones WebSocket canceladas", ["reason"]
+)
+
+# Close code 1013 (Try Again Later): cliente demasiado lento
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class SlowConsumer(Exception):
+    """El cliente no consume los frames a tiempo"""
+
+
+class MultiplexedConnection:
+    """Peticiones concurrentes y cola de envío acotada sobre un WebSocket"""
+
+    # Frames que pueden descartarse: el frame final trae la respuesta completa
+    DROPPABLE = frozenset({"token", "tool_start", "tool_end"})
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_inflight: int = 4,
+        send_queue_size: int = 256,
+        send_timeout: float = 5.0
+    ):
+        """
+        Inicializar la conexión.
+
+        Args:
+            websocket: WebSocket ya aceptado
+            max_inflight: Peticiones simultáneas permitidas por conexión
+            send_queue_size: Frames pendientes de envío como máximo
+            send_timeout: Segundos de espera por espacio para un frame esencial
+        """
+        self.websocket = websocket
+        self.max_inflight = max_inflight
+        self.send_timeout = send_timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=send_queue_size)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._writer: Optional[asyncio.Task] = None
+        self._ids = itertools.count(1)
+        self.closed = False
+        self.dropped = 0
+
+    def start(self) -> None:
+        """Iniciar el escritor de la conexión"""
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def _write_loop(self) -> None:
+        try:
+            while True:
+                frame = await self._queue.get()
+                await self.websocket.send_text(json.dumps(frame, ensure_ascii=False))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # El socket ya no acepta envíos: no tiene sentido seguir trabajando
+            Logger.info(f"Escritor WebSocket detenido: {e}")
+            self.closed = True
+            self.cancel_all("disconnect")
+
+    def next_id(self) -> str:
+        """Id para mensajes de clientes que no envían uno"""
+        return f"r{next(self._ids)}"
+
+    async def send(self, frame: Dict[str, Any]) -> None:
+        """
+        Encolar un frame para el cliente.
+
+        Raises:
+            SlowConsumer: si un frame esencial no cabe en la cola a tiempo
+        """
+        if self.closed:
+            return
+
+        if frame.get("type") in self.DROPPABLE:
+            try:
+                self._queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                WS_FRAMES_DROPPED.inc()
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.put(frame), timeout=self.send_timeout)
+        except asyncio.TimeoutError:
+            raise SlowConsumer(f"{self._queue.qsize()} frames pendientes")
+
+    def submit(self, request_id: str, work: Coroutine[Any, Any, Any]) -> bool:
+        """
+        Iniciar una petición en segundo plano.
+
+        Returns:
+            False si el id ya está en curso o se alcanzó el máximo por conexión
+        """
+        if request_id in self._tasks or len(self._tasks) >= self.max_inflight:
+            # La corrutina no llegará a ejecutarse: cerrarla evita el aviso de "never awaited"
+            work.close()
+            return False
+
+        task = asyncio.create_task(work)
+        self._tasks[request_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(request_id, None))
+        return True
+
+    def cancel(self, request_id: str, reason: str = "client") -> bool:
+        """Cancelar una petición en curso"""
+        task = self._tasks.get(request_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        WS_REQUESTS_CANCELLED.inc(reason=reason)
+        return True
+
+    def cancel_all(self, reason: str) -> int:
+        """Cancelar todas las peticiones en curso (salvo la que llama)"""
+        current = asyncio.current_task()
+        return sum(
+            self.cancel(request_id, reason)
+            for request_id, task in list(self._tasks.items())
+            if task is not current
+        )
+
+    @property
+    def inflight(self) -> int:
+        return len(self._tasks)
+
+    async def abort(self, code: int = SLOW_CONSUMER_CLOSE_CODE) -> None:
+        """Cerrar la conexión descartando lo pendiente"""
+        if self.closed:
+            return
+        self.closed = True
+        self.cancel_all("slow_consumer")
+        if self._writer is not None:
+            self._writer.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    def close(self) -> int:
+        """
+        Liberar la conexión tras la desconexión del cliente.
+
+        Returns:
+            Número de peticiones canceladas
+        """
+        self.closed = True
+        cancelled = self.cancel_all("disconnect")
+        if self._writer is not None:
+            self._writer.cancel()
+        return cancelled
@@ -18,7 +18,10 @@ const state = {
     isConnected: false,
     currentSession: 'default',
     attractions: [],
-    stats: {}
+    stats: {},
+    streams: {},  // id de petición -> { bubble, text, status } del mensaje en curso
+    pendingRequests: new Set(),  // ids de peticiones WebSocket sin respuesta final
+    requestCounter: 0
 };
 
 // ============================================
@@ -174,6 +177,13 @@ function initializeChat() {
         }
     });
     
+    // Escape cancela las consultas en curso
+    messageInput.addEventListener('keydown', (e) => {
+        if (e.key === 'Escape') {
+            cancelPendingRequests();
+        }
+    });
+    
     // Clear chat
     clearBtn.addEventListener('click', clearChat);
     
@@ -278,7 +288,9 @@ function sendMessage() {
     
     // Send via WebSocket or HTTP
     if (state.isConnected && state.ws.readyState === WebSocket.OPEN) {
-        state.ws.send(JSON.stringify({ message }));
+        const id = `req-${Date.now()}-${++state.requestCounter}`;
+        state.pendingRequests.add(id);
+        state.ws.send(JSON.stringify({ type: 'chat', id, message }));
     } else {
         // Fallback to HTTP
         sendMessageHTTP(message);
@@ -298,6 +310,12 @@ async function sendMessageHTTP(message) {
         
         const data = await response.json();
         hideTypingIndicator();
+        
+        if (response.status === 429) {
+            addMessageToChat('bot', `⏳ ${data.detail}`);
+            return;
+        }
+        
         addMessageToChat('bot', data.response);
     } catch (error) {
         console.error('Error al enviar mensaje:', error);
@@ -309,10 +327,79 @@ async function sendMessageHTTP(message) {
 function handleIncomingMessage(data) {
     hideTypingIndicator();
     
-    if (data.type === 'bot' || data.type === 'system') {
+    const id = data.id;
+    if (['bot', 'error', 'busy', 'cancelled'].includes(data.type)) {
+        state.pendingRequests.delete(id);
+    }
+    
+    if (data.type === 'token') {
+        appendStreamChunk(id, data.content);
+    } else if (data.type === 'tool_start') {
+        setStreamStatus(id, data.content);
+    } else if (data.type === 'tool_end') {
+        setStreamStatus(id, '');
+    } else if (data.type === 'bot' && state.streams[id]) {
+        finishStream(id, data.content);
+    } else if (data.type === 'bot' || data.type === 'system') {
         addMessageToChat('bot', data.content);
     } else if (data.type === 'error') {
+        finishStream(id, null);
         addMessageToChat('bot', `❌ ${data.content}`);
+    } else if (data.type === 'busy') {
+        addMessageToChat('bot', `⏳ ${data.content}`);
+    } else if (data.type === 'cancelled') {
+        finishStream(id, null);
+    }
+}
+
+// Cancelar las consultas en curso (tecla Escape)
+function cancelPendingRequests() {
+    if (!state.isConnected || state.ws.readyState !== WebSocket.OPEN) return;
+    
+    state.pendingRequests.forEach(id => {
+        state.ws.send(JSON.stringify({ type: 'cancel', id }));
+    });
+}
+
+// Mensaje del bot que se construye a medida que llegan los tokens
+function getStreamingMessage(id) {
+    if (!state.streams[id]) {
+        const messageDiv = addMessageToChat('bot', '');
+        const bubble = messageDiv.querySelector('.message-bubble');
+        const status = document.createElement('div');
+        status.className = 'tool-status';
+        bubble.after(status);
+        state.streams[id] = { bubble, status, text: '' };
+    }
+    return state.streams[id];
+}
+
+function appendStreamChunk(id, chunk) {
+    const stream = getStreamingMessage(id);
+    stream.text += chunk;
+    stream.bubble.innerHTML = formatMessageContent(stream.text);
+    
+    const messagesContainer = document.getElementById('chatMessages');
+    messagesContainer.scrollTop = messagesContainer.scrollHeight;
+}
+
+function setStreamStatus(id, text) {
+    const stream = getStreamingMessage(id);
+    stream.status.textContent = text ? `🔧 ${text}` : '';
+}
+
+function finishStream(id, finalContent) {
+    const stream = state.streams[id];
+    if (!stream) return;
+    
+    delete state.streams[id];
+    stream.status.remove();
+    
+    if (finalContent !== null) {
+        // La respuesta final reemplaza el texto parcial
+        stream.bubble.innerHTML = formatMessageContent(finalContent);
+    } else if (!stream.text) {
+        stream.bubble.closest('.message').remove();
     }
 }
 
@@ -347,6 +434,8 @@ function addMessageToChat(role, content) {
     requestAnimationFrame(() => {
         messagesContainer.scrollTop = messagesContainer.scrollHeight;
     });
+    
+    return messageDiv;
 }
 
 function formatMessageContent(content) {
@@ -0,0 +1,49 @@
+"""
+Fixtures compartidas de las pruebas.
+
+Todo corre sin red: el modelo es el `ScriptedChatModel` determinista, el
+clima usa la información estática (sin OPENWEATHER_API_KEY) y los precios
+de los tours salen del snapshot versionado en scripts/data/rag_cache.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+os.environ["OPENWEATHER_API_KEY"] = ""
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("USER_AGENT", "chatbot-turismo-huaraz-tests")
+
+TOURS_SNAPSHOT = PROJECT_ROOT / "scripts" / "data" / "rag_cache" / "tours_data.json"
+
+
+@pytest.fixture(scope="session")
+def tours(tmp_path_factory):
+    """Scraper de precios con los tours del snapshot (nunca escribe en data/)"""
+    from src.rag.price_scraper import get_scraper
+
+    scraper = get_scraper()
+    scraper.cache_file = TOURS_SNAPSHOT
+    assert scraper.load_from_cache()
+    scraper.cache_file = tmp_path_factory.mktemp("rag_cache") / "tours_data.json"
+    return scraper
+
+
+@pytest.fixture
+def fake_llm():
+    """Modelo guionizado con latencia mínima"""
+    from src.llm.fake import ScriptedChatModel
+
+    return ScriptedChatModel(think_time=0.01)
+
+
+@pytest.fixture
+def agent(fake_llm, tours):
+    """Agente sobre el modelo guionizado, sin cachés ni enrutador"""
+    from src.agents.touristic_agent import AgentBuilder
+
+    return AgentBuilder.create_agent(fake_llm, max_execution_time=10)
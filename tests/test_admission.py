@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+import pytest
+from starlette.requests import ClientDisconnect
+
+from src.utils.admission import AdmissionController, AdmissionPolicy, AdmissionRejected
+from src.utils.sse import ReleasingStreamingResponse, until_disconnected
+
+
+def test_controller_rejects_when_queue_is_full():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.05)
+        await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as full:
+            await controller.acquire()
+        with pytest.raises(AdmissionRejected) as timeout:
+            await waiter
+        controller.release()
+        return full.value.reason, timeout.value.reason, controller._semaphore.locked()
+
+    assert asyncio.run(scenario()) == ("queue_full", "queue_timeout", False)
+
+
+def test_policy_rate_limits_per_session():
+    policy = AdmissionPolicy({"per_session": {"capacity": 2, "refill_per_second": 0.01}})
+
+    async def scenario():
+        for _ in range(2):
+            async with policy.admit("s1", "1.2.3.4"):
+                pass
+        with pytest.raises(AdmissionRejected) as rejected:
+            await policy.acquire("s1", "1.2.3.4")
+        await policy.acquire("s2", "1.2.3.4")
+        policy.controller.release()
+        return rejected.value.reason
+
+    assert asyncio.run(scenario()) == "session_rate"
+
+
+def _response_scope(spec_version):
+    return {"type": "http", "asgi": {"spec_version": spec_version}}
+
+
+@pytest.mark.parametrize("spec_version", ["2.3", "2.4"])
+def test_admission_released_when_client_leaves_before_the_stream(spec_version):
+    started = []
+    released = []
+
+    async def body():
+        started.append(True)
+        yield "data: x\n\n"
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if spec_version == "2.4":
+            raise OSError("cliente desconectado")
+        await asyncio.sleep(10)
+
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1)
+        await controller.acquire()
+        response = ReleasingStreamingResponse(body(), on_close=controller.release)
+        try:
+            await response(_response_scope(spec_version), receive, send)
+        except ClientDisconnect:
+            pass
+        released.append(not controller._semaphore.locked())
+
+    asyncio.run(asyncio.wait_for(scenario(), timeout=2))
+    assert released == [True]
+    assert not started
+
+
+def test_disconnect_detected_while_agent_is_silent():
+    state = {"closed": False, "disconnected_at": None}
+
+    async def slow_agent():
+        try:
+            yield {"type": "tool_start"}
+            # Herramienta lenta: ningún evento durante 10 s
+            await asyncio.sleep(10)
+            yield {"type": "final"}
+        finally:
+            state["closed"] = True
+
+    async def is_disconnected():
+        return state["disconnected_at"] is not None and time.perf_counter() >= state["disconnected_at"]
+
+    async def scenario():
+        events = []
+        state["disconnected_at"] = time.perf_counter() + 0.1
+        started = time.perf_counter()
+        async for event in until_disconnected(slow_agent(), is_disconnected, poll_interval=0.02):
+            events.append(event["type"])
+        return events, time.perf_counter() - started
+
+    events, elapsed = asyncio.run(scenario())
+
+    assert events == ["tool_start"]
+    assert elapsed < 1
+    assert state["closed"]
+
+
+def test_until_disconnected_forwards_all_events_and_errors():
+    async def agent():
+        yield {"type": "token"}
+        raise RuntimeError("falla")
+
+    async def connected():
+        return False
+
+    async def scenario():
+        seen = []
+        with pytest.raises(RuntimeError):
+            async for event in until_disconnected(agent(), connected, poll_interval=0.01):
+                seen.append(event["type"])
+        return seen
+
+    assert asyncio.run(scenario()) == ["token"]
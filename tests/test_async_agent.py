@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+from src.agents.memory import SessionMemory
+from src.agents.touristic_agent import AgentBuilder
+from src.llm.fake import ScriptedChatModel
+
+QUERY = "¿Cuánto cuesta el tour a Pastoruri?"
+
+
+def test_concurrent_sessions_take_as_long_as_the_slowest(tours):
+    # Dos llamadas al modelo por consulta: ~0.4 s cada sesión
+    agent = AgentBuilder.create_agent(ScriptedChatModel(think_time=0.2), max_execution_time=10)
+    # Consultas distintas: ninguna se comparte por single-flight
+    queries = [f"¿Cuánto cuesta el tour a {tour}?" for tour in ("Pastoruri", "Laguna 69", "Chavín", "Parón", "Llanganuco")]
+
+    async def scenario():
+        gaps = []
+        done = asyncio.Event()
+
+        async def heartbeat():
+            last = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        beat = asyncio.ensure_future(heartbeat())
+        start = time.perf_counter()
+        results = await asyncio.gather(*(agent.aprocess_query(query, SessionMemory(10)) for query in queries))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await beat
+        return results, elapsed, max(gaps)
+
+    results, elapsed, max_gap = asyncio.run(scenario())
+
+    assert all(result["success"] for result in results)
+    assert all(result["tool_calls"] == ["get_tour_price"] for result in results)
+    assert agent.single_flight.get_stats()["shared"] == 0
+    assert elapsed < 1.0
+    assert max_gap < 0.15
+
+
+def test_sync_and_async_paths_give_the_same_answer(agent):
+    sync_result = agent.process_query(QUERY, SessionMemory(10))
+    async_result = asyncio.run(agent.aprocess_query(QUERY, SessionMemory(10)))
+
+    assert sync_result["success"] and async_result["success"]
+    assert sync_result["response"] == async_result["response"]
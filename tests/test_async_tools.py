@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.tools import tool
+
+from src.handlers.async_tools import as_async_tool, configure_tool_timeouts, get_tool_pool_stats
+
+
+@pytest.fixture(autouse=True)
+def no_timeouts():
+    configure_tool_timeouts(None)
+    yield
+    configure_tool_timeouts(None)
+
+
+def _sleepy(name, seconds, release=None):
+    @tool(name)
+    def sleepy() -> str:
+        """Herramienta lenta de prueba"""
+        if release is not None:
+            release.wait(5)
+        else:
+            time.sleep(seconds)
+        return name
+
+    return as_async_tool(sleepy)
+
+
+def test_tools_of_one_step_run_concurrently():
+    tools = [_sleepy(f"tool_{i}", 0.2) for i in range(3)]
+
+    async def scenario():
+        start = time.perf_counter()
+        results = await asyncio.gather(*(t.ainvoke({}) for t in tools))
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(scenario())
+
+    assert results == ["tool_0", "tool_1", "tool_2"]
+    assert elapsed < 0.4
+
+
+def test_timed_out_call_is_counted_until_its_thread_finishes():
+    release = threading.Event()
+    slow = _sleepy("stuck_tool", 0, release)
+    configure_tool_timeouts(None, {"stuck_tool": 0.05})
+
+    result = asyncio.run(slow.ainvoke({}))
+
+    assert "stuck_tool no respondió" in result
+    assert get_tool_pool_stats()["abandoned"] == 1
+    release.set()
+    deadline = time.monotonic() + 2
+    while get_tool_pool_stats()["abandoned"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert get_tool_pool_stats()["abandoned"] == 0
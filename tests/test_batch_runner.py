@@ -0,0 +1,135 @@
+import asyncio
+import json
+
+import httpx
+
+from src.utils.batch_runner import BatchRunner, ServerClient, read_batch
+
+
+def _write_lines(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_read_batch_keeps_invalid_lines(tmp_path):
+    path = _write_lines(tmp_path / "in.jsonl", [
+        json.dumps({"id": "q1", "query": "hola"}),
+        "",
+        "{no es json",
+        json.dumps({"id": "q3"}),
+        json.dumps({"query": "¿y el clima?", "session_id": 7}),
+    ])
+
+    queries = read_batch(path)
+
+    assert [q.index for q in queries] == [1, 3, 4, 5]
+    assert queries[1].error and queries[2].error
+    assert queries[3].session_id == "7"
+
+
+def test_sessions_run_in_order_and_concurrency_is_bounded(tmp_path):
+    path = _write_lines(tmp_path / "in.jsonl", [
+        json.dumps({"query": f"s{s} t{t}", "session_id": f"s{s}"})
+        for t in range(3) for s in range(4)
+    ])
+    seen = {}
+    active = {"now": 0, "max": 0}
+    ended = []
+
+    async def run_query(query, session_id):
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        seen.setdefault(session_id, []).append(query)
+        return {"success": True, "response": query.upper(), "usage": {"llm_calls": 1, "total_tokens": 10}}
+
+    runner = BatchRunner(run_query, concurrency=2, end_session=ended.append)
+    summary = asyncio.run(runner.run(read_batch(path), str(tmp_path / "out.jsonl")))
+
+    assert active["max"] == 2
+    assert seen["s1"] == ["s1 t0", "s1 t1", "s1 t2"]
+    assert sorted(ended) == ["s0", "s1", "s2", "s3"]
+    assert summary["queries"] == 12 and summary["succeeded"] == 12
+    assert summary["llm_calls"] == 12 and summary["total_tokens"] == 120
+    records = [json.loads(line) for line in (tmp_path / "out.jsonl").read_text().splitlines()]
+    assert len(records) == 12
+    assert all(r["response"] == r["query"].upper() for r in records)
+
+
+def test_errors_are_recorded_not_raised(tmp_path):
+    path = _write_lines(tmp_path / "in.jsonl", [json.dumps({"query": "falla"}), "{roto"])
+
+    async def run_query(query, session_id):
+        raise RuntimeError("proveedor caído")
+
+    summary = asyncio.run(BatchRunner(run_query).run(read_batch(path), str(tmp_path / "out.jsonl")))
+
+    records = [json.loads(line) for line in (tmp_path / "out.jsonl").read_text().splitlines()]
+    assert summary["failed"] == 2
+    assert {r["error"] for r in records} >= {"proveedor caído"}
+
+
+def test_rate_limit_spaces_queries(tmp_path):
+    path = _write_lines(tmp_path / "in.jsonl", [json.dumps({"query": f"q{i}"}) for i in range(4)])
+
+    async def run_query(query, session_id):
+        return {"success": True, "response": "ok"}
+
+    runner = BatchRunner(run_query, concurrency=4, rate_limit=20)
+    summary = asyncio.run(runner.run(read_batch(path), str(tmp_path / "out.jsonl")))
+
+    # Sin ráfaga: una consulta inmediata y tres espaciadas 50 ms
+    assert summary["duration_s"] >= 0.14
+
+
+def test_server_client_posts_to_chat_and_retries_when_busy(tmp_path):
+    path = _write_lines(tmp_path / "in.jsonl", [
+        json.dumps({"query": "hola", "session_id": "s1"}),
+        json.dumps({"query": "falla"}),
+    ])
+    received = []
+    deleted = []
+
+    def handler(request):
+        if request.method == "DELETE":
+            deleted.append(request.url.path.rsplit("/", 1)[-1])
+            return httpx.Response(200, json={})
+        body = json.loads(request.content)
+        received.append(body)
+        if len(received) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0"}, json={"detail": "ocupado"})
+        failed = body["message"] == "falla"
+        return httpx.Response(200, json={
+            # /chat responde 200 con la disculpa cuando el agente falla
+            "response": "Lo siento" if failed else body["message"].upper(),
+            "session_id": body["session_id"],
+            "success": not failed,
+            "usage": {"llm_calls": 2, "total_tokens": 50},
+            "tool_calls": ["get_current_weather"],
+            "flags": {"cached": True}
+        })
+
+    async def scenario():
+        client = ServerClient("http://servidor")
+        client.client = httpx.AsyncClient(base_url="http://servidor", transport=httpx.MockTransport(handler))
+        try:
+            return await BatchRunner(client, concurrency=1, end_session=client.end_session).run(
+                read_batch(path), str(tmp_path / "out.jsonl")
+            )
+        finally:
+            await client.aclose()
+
+    summary = asyncio.run(scenario())
+
+    assert summary["succeeded"] == 1 and summary["failed"] == 1
+    assert summary["llm_calls"] == 4
+    assert [r["message"] for r in received] == ["hola", "hola", "falla"]
+    assert received[0]["session_id"] == "s1"
+    # Sin sesión en el archivo: una propia, que se cierra al responder
+    assert received[2]["session_id"].startswith("batch-")
+    assert deleted == ["s1", received[2]["session_id"]]
+    records = {r["query"]: r for r in map(json.loads, (tmp_path / "out.jsonl").read_text().splitlines())}
+    assert records["hola"]["response"] == "HOLA" and records["hola"]["cached"]
+    assert records["hola"]["tool_calls"] == ["get_current_weather"]
+    assert not records["falla"]["success"]
@@ -0,0 +1,212 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from src.agents import checkpointing
+from src.agents.checkpointing import SQLiteCheckpointer
+from src.agents.memory import SessionMemory
+from src.agents.session_registry import SessionRegistry
+from src.agents.summary_memory import SUMMARY_MESSAGE_ID, ConversationSummarizer, fold_point, summary_text
+from src.agents.touristic_agent import AgentBuilder
+from src.llm.fake import ScriptedChatModel
+
+
+def _thread(agent, memory):
+    config = {"configurable": {"thread_id": memory.thread_id}}
+    return agent.agent_executor.get_state(config).values.get("messages", [])
+
+
+def _checkpoints(agent, memory):
+    return list(agent.checkpointer.list({"configurable": {"thread_id": memory.thread_id}}))
+
+
+def _capture_prompts(agent):
+    prompts = []
+    layout = agent._layout
+
+    def spy(turn, messages):
+        prompt = layout(turn, messages)
+        prompts.append(prompt)
+        return prompt
+
+    agent._layout = spy
+    return prompts
+
+
+def test_thread_is_the_conversation(agent):
+    memory = SessionMemory()
+    prompts = _capture_prompts(agent)
+
+    async def scenario():
+        await agent.aprocess_query("¿Cuánto cuesta el tour a Pastoruri?", memory)
+        prompts.clear()
+        return await agent.aprocess_query("¿Y el clima?", memory)
+
+    result = asyncio.run(scenario())
+
+    assert result["success"]
+    humans = [m.content for m in _thread(agent, memory) if isinstance(m, HumanMessage)]
+    assert humans == ["¿Cuánto cuesta el tour a Pastoruri?", "¿Y el clima?"]
+    # El historial del prompt sale del hilo, no de una copia en la sesión
+    assert any(m.content == "¿Cuánto cuesta el tour a Pastoruri?" for m in prompts[0])
+    assert len(_checkpoints(agent, memory)) == 1
+
+
+def test_sqlite_thread_survives_restart(tmp_path, fake_llm, tours, monkeypatch):
+    path = str(tmp_path / "checkpoints.sqlite")
+    monkeypatch.setattr(checkpointing, "_checkpointer", SQLiteCheckpointer(path))
+    first = AgentBuilder.create_agent(fake_llm, max_execution_time=10)
+    asyncio.run(first.aprocess_query("¿Cuánto cuesta el tour a Pastoruri?", SessionMemory(thread_id="s1")))
+
+    # "Reinicio": checkpointer y agente nuevos sobre el mismo archivo
+    monkeypatch.setattr(checkpointing, "_checkpointer", SQLiteCheckpointer(path))
+    second = AgentBuilder.create_agent(fake_llm, max_execution_time=10)
+    memory = SessionMemory(thread_id="s1")
+
+    async def scenario():
+        key = await second._flight_key("gracias", memory)
+        return key, await second.aprocess_query("gracias", memory)
+
+    key, result = asyncio.run(scenario())
+
+    assert key is None
+    assert result["success"]
+    humans = [m.content for m in _thread(second, memory) if isinstance(m, HumanMessage)]
+    assert humans == ["¿Cuánto cuesta el tour a Pastoruri?", "gracias"]
+    assert len(_checkpoints(second, memory)) == 1
+
+
+def test_abandoned_stream_leaves_no_partial_turn(agent):
+    memory = SessionMemory()
+
+    async def scenario():
+        await agent.aprocess_query("gracias", memory)
+        stream = agent.astream_query("¿Cuánto cuesta el tour a Pastoruri?", memory)
+        async for event in stream:
+            if event["type"] == "tool_start":
+                break
+        await stream.aclose()
+        return await agent.aprocess_query("¿Y el clima?", memory)
+
+    result = asyncio.run(scenario())
+
+    assert result["success"]
+    humans = [m.content for m in _thread(agent, memory) if isinstance(m, HumanMessage)]
+    assert humans == ["gracias", "¿Y el clima?"]
+
+
+def test_abandoned_first_turn_deletes_the_thread(agent):
+    memory = SessionMemory()
+
+    async def scenario():
+        stream = agent.astream_query("¿Cuánto cuesta el tour a Pastoruri?", memory)
+        async for event in stream:
+            if event["type"] == "tool_start":
+                break
+        await stream.aclose()
+
+    asyncio.run(scenario())
+
+    assert _thread(agent, memory) == []
+    assert agent.checkpointer.get_tuple({"configurable": {"thread_id": memory.thread_id}}) is None
+
+
+def test_timeout_rewrites_turn_without_dangling_tool_calls(tours):
+    agent = AgentBuilder.create_agent(ScriptedChatModel(think_time=0.3), max_execution_time=0.45)
+    memory = SessionMemory()
+
+    result = asyncio.run(agent.aprocess_query("¿Cuánto cuesta el tour a Pastoruri?", memory))
+
+    assert result["timed_out"]
+    thread = _thread(agent, memory)
+    assert [type(m) for m in thread] == [HumanMessage, AIMessage]
+    assert not thread[-1].tool_calls and thread[-1].content == result["response"]
+    assert not any(isinstance(m, ToolMessage) for m in thread)
+
+
+def test_buffer_mode_bounds_the_thread(agent):
+    agent.max_history = 4
+    memory = SessionMemory()
+
+    async def scenario():
+        for i in range(6):
+            await agent.aprocess_query(f"gracias {i}", memory)
+
+    asyncio.run(scenario())
+
+    thread = _thread(agent, memory)
+    assert isinstance(thread[0], HumanMessage)
+    assert len(thread) <= agent.max_history + 2
+    assert thread[-2].content == "gracias 5"
+
+
+def test_summary_is_folded_into_the_thread(agent, fake_llm):
+    agent.summarizer = ConversationSummarizer(fake_llm, threshold=4, keep_recent_turns=1)
+    memory = SessionMemory()
+    prompts = _capture_prompts(agent)
+
+    async def scenario():
+        for i in range(3):
+            await agent.aprocess_query(f"gracias {i}", memory)
+        # El resumen se redacta en segundo plano y se aplica en el turno siguiente
+        await memory.compaction
+        prompts.clear()
+        await agent.aprocess_query("¿Y el clima?", memory)
+
+    asyncio.run(scenario())
+
+    thread = _thread(agent, memory)
+    assert thread[0].id == SUMMARY_MESSAGE_ID
+    assert "gracias 0" in summary_text(thread)
+    assert [m.content for m in thread[1:] if isinstance(m, HumanMessage)] == ["gracias 2", "¿Y el clima?"]
+    assert any(m.id == SUMMARY_MESSAGE_ID for m in prompts[0])
+    assert agent.summarizer.folds == 1
+
+
+def test_console_turns_use_the_thread(agent):
+    agent.process_query("gracias")
+    result = agent.process_query("¿Cuánto cuesta el tour a Pastoruri?")
+
+    assert result["success"]
+    assert agent.get_memory_summary()["total_messages"] == 6
+    agent.clear_memory()
+    assert agent.get_memory_summary()["total_messages"] == 0
+
+
+def test_fold_point_counts_only_dialogue():
+    call = {"name": "get_tour_price", "args": {}, "id": "c1"}
+    messages = [
+        HumanMessage(content="a", id="h1"),
+        AIMessage(content="", tool_calls=[call], id="a1"),
+        ToolMessage(content="x", tool_call_id="c1", id="t1"),
+        AIMessage(content="b", id="a2"),
+        HumanMessage(content="c", id="h2"),
+        AIMessage(content="d", id="a3"),
+    ]
+
+    assert fold_point(messages, threshold=4, keep=2) == 0
+    assert fold_point(messages, threshold=3, keep=2) == 4
+
+
+def test_session_released_mid_turn_keeps_turns_serialized(tours):
+    agent = AgentBuilder.create_agent(ScriptedChatModel(think_time=0.1), max_execution_time=10)
+    registry = SessionRegistry(on_release=agent.release_thread)
+
+    async def scenario():
+        memory = registry.get("s1")
+        first = asyncio.ensure_future(agent.aprocess_query("¿Cuánto cuesta el tour a Pastoruri?", memory))
+        await asyncio.sleep(0.05)
+        # DELETE /history con el turno en curso y un mensaje nuevo de la misma sesión
+        registry.remove("s1")
+        fresh = registry.get("s1")
+        second = await agent.aprocess_query("¿Qué tal el clima?", fresh)
+        await agent.wait_released()
+        return memory, fresh, await first, second
+
+    memory, fresh, first, second = asyncio.run(scenario())
+
+    assert fresh is not memory and fresh.lock is memory.lock
+    assert first["success"] and second["success"]
+    # El borrado esperó al primer turno y el segundo esperó al borrado
+    humans = [m.content for m in _thread(agent, fresh) if isinstance(m, HumanMessage)]
+    assert humans == ["¿Qué tal el clima?"]
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+from src.utils.history_store import TieredHistoryStore
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    stores = []
+
+    def make(**kwargs):
+        store = TieredHistoryStore(sqlite_path=str(tmp_path / "history.db"), **kwargs)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        store.close()
+
+
+def _contents(store, session_id):
+    return [m["content"] for m in store.get(session_id)]
+
+
+def test_read_does_not_wait_for_the_writer(make_store):
+    store = make_store(ring_size=2, flush_interval=1.0)
+    for i in range(5):
+        store.add("s1", "user", f"m{i}")
+
+    started = time.perf_counter()
+    contents = _contents(store, "s1")
+
+    assert time.perf_counter() - started < 0.2
+    assert contents == [f"m{i}" for i in range(5)]
+    assert store.get_stats()["pending_writes"] > 0
+
+
+def test_no_duplicates_once_written(make_store):
+    store = make_store(ring_size=2, flush_interval=0.01)
+    for i in range(5):
+        store.add("s1", "user", f"m{i}")
+    store.writer.flush()
+
+    assert _contents(store, "s1") == [f"m{i}" for i in range(5)]
+    assert store.get_stats()["disk_messages"] == 3
+    assert not store._pending
+
+
+def test_history_read_under_write_load(make_store):
+    store = make_store(ring_size=2, flush_interval=0.05, batch_size=20)
+    for i in range(6):
+        store.add("reader", "user", f"m{i}")
+    stop = threading.Event()
+
+    def write_load():
+        i = 0
+        while not stop.is_set():
+            store.add(f"w{i % 10}", "user", "x" * 100)
+            i += 1
+
+    writer = threading.Thread(target=write_load)
+    writer.start()
+    try:
+        slowest = 0.0
+        for _ in range(20):
+            started = time.perf_counter()
+            contents = _contents(store, "reader")
+            slowest = max(slowest, time.perf_counter() - started)
+            assert contents == [f"m{i}" for i in range(6)]
+            time.sleep(0.01)
+    finally:
+        stop.set()
+        writer.join()
+
+    # Sin esperar a la cola: nada cerca del intervalo de escritura
+    assert slowest < 0.05
+
+
+def test_clear_hides_rows_before_the_delete_is_written(make_store):
+    store = make_store(ring_size=2, flush_interval=0.01)
+    for i in range(5):
+        store.add("s1", "user", f"m{i}")
+    store.writer.flush()
+    store.writer.flush_interval = 1.0
+
+    store.clear("s1")
+    assert _contents(store, "s1") == []
+
+    store.add("s1", "user", "nuevo")
+    assert _contents(store, "s1") == ["nuevo"]
+    store.writer.flush()
+    assert _contents(store, "s1") == ["nuevo"]
+    assert not store._deleting
@@ -0,0 +1,52 @@
+import asyncio
+
+from src.agents.intent_router import IntentRouter
+from src.agents.memory import SessionMemory
+
+
+def test_simple_queries_route_and_ambiguous_ones_go_to_the_agent(agent):
+    router = IntentRouter(agent.tools)
+
+    route = router.route("precio de pastoruri")
+
+    assert route.tool == "get_tour_price" and route.args == {"tour_name": "pastoruri"}
+    assert router.route("¿Qué clima hace hoy?").tool == "get_current_weather"
+    assert router.route("¿Me recomiendas un itinerario de 3 días?") is None
+
+
+def test_routed_tool_start_is_streamed_before_the_tool_runs(agent):
+    agent.router = IntentRouter(agent.tools)
+    log = []
+    answer = agent.router.answer
+
+    async def spy_answer(query, route):
+        log.append("answer")
+        return await answer(query, route)
+
+    agent.router.answer = spy_answer
+
+    async def scenario():
+        async for event in agent.astream_query("precio de pastoruri", SessionMemory(10)):
+            log.append(event["type"])
+            if event["type"] == "final":
+                return event
+
+    final = asyncio.run(scenario())
+
+    assert log == ["tool_start", "answer", "tool_end", "final"]
+    assert final["routed"] == "get_tour_price" and final["usage"]["llm_calls"] == 0
+
+
+def test_unhelpful_route_falls_back_to_the_agent(agent):
+    agent.router = IntentRouter(agent.tools)
+
+    async def no_answer(query, route):
+        return None
+
+    agent.router.answer = no_answer
+
+    result = asyncio.run(agent.aprocess_query("precio de pastoruri", SessionMemory(10)))
+
+    assert result["success"] and "routed" not in result
+    assert result["usage"]["llm_calls"] > 0
+    assert agent.router.get_stats()["to_agent"] == 1
@@ -0,0 +1,57 @@
+import asyncio
+
+from src.agents.memory import SessionMemory
+from src.utils.metrics import LLM_LATENCY, TOOL_LATENCY, MetricsRegistry, metrics
+
+
+def _sample(text, prefix):
+    """Suma de las muestras cuyo nombre y etiquetas empiezan por `prefix`"""
+    return sum(float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith(prefix))
+
+
+def test_counters_and_gauges_render_in_prometheus_format():
+    registry = MetricsRegistry()
+    messages = registry.counter("test_messages_total", "Mensajes", ["role"])
+    in_flight = registry.gauge("test_in_flight", "En curso")
+
+    messages.inc(role="user")
+    messages.inc(2, role='bot "x"')
+    with in_flight.track_inprogress():
+        assert in_flight.total() == 1
+    text = registry.render()
+
+    assert "# TYPE test_messages_total counter" in text
+    assert 'test_messages_total{role="user"} 1' in text
+    assert 'test_messages_total{role="bot \\"x\\""} 2' in text
+    assert "test_in_flight 0" in text
+    assert messages.total() == 3
+    # Registrar otra vez el mismo nombre devuelve la métrica existente
+    assert registry.counter("test_messages_total", "Mensajes", ["role"]) is messages
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("test_latency_seconds", "Latencia", buckets=(0.1, 1))
+
+    for value in (0.05, 0.5, 0.7, 3):
+        latency.observe(value)
+    text = registry.render()
+
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1"} 3' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 4' in text
+    assert "test_latency_seconds_count 4" in text
+    assert "test_latency_seconds_sum 4.25" in text
+
+
+def test_agent_turn_records_llm_and_tool_latency(agent):
+    llm_prefix = f"{LLM_LATENCY.name}_count"
+    tool_prefix = f'{TOOL_LATENCY.name}_count{{tool="get_tour_price"}}'
+    before = metrics.render()
+
+    result = asyncio.run(agent.aprocess_query("¿Cuánto cuesta el tour a Pastoruri?", SessionMemory(10)))
+    after = metrics.render()
+
+    assert result["success"]
+    assert _sample(after, llm_prefix) - _sample(before, llm_prefix) == result["usage"]["llm_calls"]
+    assert _sample(after, tool_prefix) == _sample(before, tool_prefix) + 1
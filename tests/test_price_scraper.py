@@ -0,0 +1,70 @@
+import threading
+import time
+
+from src.rag.price_scraper import HuarazPriceScraper, TourInfo
+from src.utils.deadline import deadline_scope
+
+
+def _scraper(tmp_path, delay=0.0):
+    scraper = HuarazPriceScraper()
+    scraper.cache_file = tmp_path / "tours_data.json"
+    calls = []
+
+    def scrape_tour_page(url_path):
+        calls.append(url_path)
+        time.sleep(delay)
+        return TourInfo(name=url_path, url=url_path, price=f"S/ {len(calls)}")
+
+    scraper.scrape_tour_page = scrape_tour_page
+    return scraper, calls
+
+
+def test_readers_never_see_a_half_built_list(tmp_path):
+    scraper, _ = _scraper(tmp_path, delay=0.005)
+    scraper.scrape_all_tours()
+    complete = len(scraper.TOUR_PAGES)
+    seen = []
+
+    rescrape = threading.Thread(target=scraper.scrape_all_tours)
+    rescrape.start()
+    while rescrape.is_alive():
+        seen.append(len(scraper.tours))
+    rescrape.join()
+
+    assert set(seen) == {complete}
+
+
+def test_partial_scrape_keeps_previous_tours_and_backs_off(tmp_path):
+    scraper, calls = _scraper(tmp_path, delay=0.01)
+    scraper.tours = [TourInfo(name=url, url=url, price="viejo") for url in scraper.TOUR_PAGES]
+
+    with deadline_scope(0.035):
+        scraper.scrape_all_tours()
+
+    assert scraper.partial
+    assert 0 < len(calls) < len(scraper.TOUR_PAGES)
+    assert len(scraper.tours) == len(scraper.TOUR_PAGES)
+    assert scraper.get_tour_by_name(calls[0]).price != "viejo"
+    # Dentro de la espera no se reintenta en cada consulta
+    assert not scraper.needs_refresh()
+    scraper._retry_at = 0.0
+    assert scraper.needs_refresh()
+
+
+def test_refresh_scrapes_once_and_saves_only_complete_results(tmp_path):
+    scraper, calls = _scraper(tmp_path, delay=0.002)
+
+    with deadline_scope(0.01):
+        scraper.refresh()
+    assert scraper.partial and not scraper.cache_file.exists()
+
+    scraper._retry_at = 0.0
+    threads = [threading.Thread(target=scraper.refresh) for _ in range(4)]
+    calls.clear()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == len(scraper.TOUR_PAGES)
+    assert not scraper.partial and scraper.cache_file.exists()
@@ -0,0 +1,67 @@
+import asyncio
+from datetime import datetime
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from src.agents.memory import SessionMemory
+from src.agents.touristic_agent import AgentBuilder, TouristicAgent
+from src.llm.fake import ScriptedChatModel
+from src.prompt_engineering.prompt_layout import PromptLayout
+from src.prompt_engineering.prompts import PromptManager
+
+PROMPTS = []
+
+
+class RecordingChatModel(ScriptedChatModel):
+    """Guarda los mensajes de cada llamada al modelo"""
+
+    def _reply(self, messages, tools=None):
+        PROMPTS.append(list(messages))
+        return super()._reply(messages, tools)
+
+
+def test_system_prompt_is_a_stable_prefix_and_context_follows_history(tours):
+    PROMPTS.clear()
+    agent = AgentBuilder.create_agent(RecordingChatModel(think_time=0.0), max_execution_time=10)
+    memory = SessionMemory(10)
+
+    async def scenario():
+        await agent.aprocess_query("gracias", memory)
+        await agent.aprocess_query("¿Cuánto cuesta el tour a Pastoruri?", memory)
+
+    asyncio.run(scenario())
+
+    first, second = PROMPTS[0], PROMPTS[1]
+    assert isinstance(first[0], SystemMessage)
+    assert first[0].content == PromptManager.get_system_prompt()
+    assert all(prompt[0].content == first[0].content for prompt in PROMPTS)
+    # prompt del sistema, historial, contexto volátil y la pregunta actual
+    assert [type(m) for m in second] == [SystemMessage, HumanMessage, AIMessage, SystemMessage, HumanMessage]
+    assert second[1].content == "gracias"
+    assert second[3].content.startswith("Contexto de esta consulta")
+    assert "Pastoruri" in second[4].content
+
+
+def test_context_message_holds_only_volatile_data():
+    message = PromptLayout.context_message({"idioma": "es"}, now=datetime(2026, 7, 1, 9, 30, 59))
+
+    assert message.content == (
+        "Contexto de esta consulta:\n"
+        "- Fecha y hora actual en Huaraz: 2026-07-01 09:30\n"
+        "- idioma: es"
+    )
+
+
+def test_cached_prompt_tokens_are_counted_per_turn():
+    usage = TouristicAgent._empty_usage()
+    message = AIMessage(content="", usage_metadata={
+        "input_tokens": 1500,
+        "output_tokens": 20,
+        "total_tokens": 1520,
+        "input_token_details": {"cache_read": 1024}
+    })
+
+    TouristicAgent._add_usage(usage, message)
+
+    assert usage["llm_calls"] == 1 and usage["input_tokens"] == 1500
+    assert usage["cached_tokens"] == 1024
@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+from langchain_core.embeddings import Embeddings
+
+from src.agents.intent_router import query_entities
+from src.rag.semantic_cache import SemanticCache
+
+
+class TopicEmbeddings(Embeddings):
+    """Embeddings que solo distinguen el tema: todas las preguntas de precio son casi iguales"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def _vector(self, text):
+        text = text.lower()
+        return [1.0 if ("cuesta" in text or "precio" in text) else 0.0, 1.0 if "clima" in text else 0.0, 0.1]
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+    async def aembed_query(self, text):
+        self.calls += 1
+        return self._vector(text)
+
+
+def _cache(**kwargs):
+    embeddings = TopicEmbeddings()
+    return SemanticCache(lambda: embeddings, similarity_threshold=0.9, **kwargs), embeddings
+
+
+def _ask(cache, query, answer=None):
+    async def scenario():
+        cached, vector = await cache.alookup(query)
+        if cached is None and answer is not None:
+            cache.store(query, answer, vector)
+        return cached
+
+    return asyncio.run(scenario())
+
+
+def test_price_questions_about_different_tours_do_not_collide():
+    cache, _ = _cache(entity_extractor=query_entities)
+    _ask(cache, "¿Cuánto cuesta el tour a Pastoruri?", "Pastoruri: S/ 50")
+
+    assert _ask(cache, "¿Cuánto cuesta el tour a Laguna 69?") is None
+    assert _ask(cache, "¿Qué precio tiene el tour a Pastoruri?") == "Pastoruri: S/ 50"
+    assert cache.get_stats()["entity_mismatches"] == 1
+
+
+def test_numbers_must_match():
+    cache, _ = _cache(entity_extractor=query_entities)
+    _ask(cache, "¿Cuánto cuesta el paquete de 3 días?", "3 días: S/ 295")
+
+    assert _ask(cache, "¿Cuánto cuesta el paquete de 4 días?") is None
+    assert _ask(cache, "precio del paquete de 3 días") == "3 días: S/ 295"
+
+
+def test_without_entities_similar_queries_collide():
+    # Comportamiento base que motiva el chequeo de entidades
+    cache, _ = _cache()
+    _ask(cache, "¿Cuánto cuesta el tour a Pastoruri?", "Pastoruri: S/ 50")
+
+    assert _ask(cache, "¿Cuánto cuesta el tour a Laguna 69?") == "Pastoruri: S/ 50"
+
+
+def test_exact_match_skips_embeddings_and_ttl_expires():
+    cache, embeddings = _cache(entity_extractor=query_entities)
+    _ask(cache, "¿Qué tal el clima?", "Soleado")
+    calls = embeddings.calls
+
+    assert _ask(cache, "  ¿qué tal el   clima? ") == "Soleado"
+    assert embeddings.calls == calls
+
+    cache.ttl = -1
+    assert _ask(cache, "¿Qué tal el clima?") is None
+
+
+def test_query_entities():
+    assert query_entities("¿Cuánto cuesta la Laguna 69?") >= {"tour:laguna 69", "numero:69"}
+    assert "tour:santa cruz" in query_entities("trek Santa Cruz para 2 personas")
+    assert "numero:2" in query_entities("trek Santa Cruz para 2 personas")
+    assert query_entities("¿Qué tal el clima?") == frozenset()
+
+
+def test_first_lookup_resolves_embeddings_off_the_event_loop():
+    embeddings = TopicEmbeddings()
+
+    def slow_provider():
+        # Simula la carga del índice FAISS en la primera consulta
+        time.sleep(0.3)
+        return embeddings
+
+    cache = SemanticCache(slow_provider, similarity_threshold=0.9)
+
+    async def scenario():
+        gaps = []
+        done = asyncio.Event()
+
+        async def heartbeat():
+            last = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        beat = asyncio.ensure_future(heartbeat())
+        await asyncio.sleep(0)
+        await asyncio.gather(cache.alookup("¿Cuánto cuesta?"), cache.alookup("¿Cuál es el precio?"))
+        done.set()
+        await beat
+        return max(gaps)
+
+    assert asyncio.run(scenario()) < 0.1
+    assert embeddings.calls == 2
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from src.agents.memory import SessionMemory
+from src.agents.single_flight import SingleFlight
+from src.agents.touristic_agent import AgentBuilder
+from src.llm.fake import ScriptedChatModel
+from src.rag.semantic_cache import SemanticCache
+
+
+class ConstantEmbeddings(Embeddings):
+    """Todas las consultas son idénticas para la caché"""
+
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+def _flight(results, calls, delay=0.05):
+    async def func():
+        calls.append(True)
+        await asyncio.sleep(delay)
+        return results.pop(0)
+
+    return func
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    async def scenario():
+        func = _flight(["respuesta"], calls)
+        return await asyncio.gather(flight.do("k", func), flight.do("k", func))
+
+    assert asyncio.run(scenario()) == [("respuesta", False), ("respuesta", True)]
+    assert len(calls) == 1
+    assert flight.get_stats()["in_flight"] == 0
+
+
+def test_unshareable_result_makes_followers_run_their_own():
+    flight = SingleFlight()
+    calls = []
+
+    async def scenario():
+        func = _flight([{"ok": False}, {"ok": True}], calls)
+        shareable = lambda result: result["ok"]
+        return await asyncio.gather(flight.do("k", func, shareable), flight.do("k", func, shareable))
+
+    assert asyncio.run(scenario()) == [({"ok": False}, False), ({"ok": True}, False)]
+    assert len(calls) == 2
+
+
+def test_leader_failure_hands_over_to_a_follower():
+    flight = SingleFlight()
+    calls = []
+
+    async def failing():
+        calls.append(True)
+        await asyncio.sleep(0.05)
+        raise RuntimeError("falla")
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.do("k", failing))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("k", _flight(["respuesta"], calls)))
+        with pytest.raises(RuntimeError):
+            await leader
+        return await follower
+
+    assert asyncio.run(scenario()) == ("respuesta", False)
+    assert len(calls) == 2
+
+
+def test_cancelled_follower_does_not_cancel_the_leader():
+    flight = SingleFlight()
+    calls = []
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.do("k", _flight(["respuesta"], calls)))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("k", _flight(["otra"], calls)))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        return await leader
+
+    assert asyncio.run(scenario()) == ("respuesta", False)
+    assert len(calls) == 1
+
+
+def test_timed_out_answer_is_neither_shared_nor_cached(tours):
+    # Cada llamada al modelo tarda más que el plazo de la consulta
+    agent = AgentBuilder.create_agent(ScriptedChatModel(think_time=0.3), max_execution_time=0.45)
+    embeddings = ConstantEmbeddings()
+    agent.answer_cache = SemanticCache(lambda: embeddings, similarity_threshold=0.9)
+    sessions = [SessionMemory(10) for _ in range(2)]
+
+    async def scenario():
+        return await asyncio.gather(*(
+            agent.aprocess_query("¿Cuánto cuesta el tour a Pastoruri?", memory) for memory in sessions
+        ))
+
+    results = asyncio.run(scenario())
+
+    assert all(result.get("timed_out") for result in results)
+    assert agent.single_flight.get_stats()["shared"] == 0
+    assert agent.answer_cache.get_stats()["entries"] == 0
+
+
+def test_chat_follower_shares_a_stream_leader_answer(tours):
+    agent = AgentBuilder.create_agent(ScriptedChatModel(think_time=0.2), max_execution_time=10)
+    query = "¿Cuánto cuesta el tour a Pastoruri?"
+
+    async def stream():
+        events = [event async for event in agent.astream_query(query, SessionMemory(10))]
+        return events[-1]
+
+    async def scenario():
+        leader = asyncio.ensure_future(stream())
+        await asyncio.sleep(0.05)
+        follower = await agent.aprocess_query(query, SessionMemory(10))
+        return await leader, follower
+
+    final, follower = asyncio.run(scenario())
+
+    assert final["success"] and follower["success"]
+    assert follower["response"] == final["response"]
+    assert follower["tool_calls"] == final["tool_calls"] == ["get_tour_price"]
+    assert agent.single_flight.get_stats()["shared"] == 1
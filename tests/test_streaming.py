@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+from src.agents.memory import SessionMemory
+from src.agents.touristic_agent import AgentBuilder
+from src.llm.fake import ScriptedChatModel
+
+QUERY = "¿Cuánto cuesta el tour a Pastoruri?"
+
+
+def _stream(agent, query, memory):
+    async def scenario():
+        start = time.perf_counter()
+        events = []
+        async for event in agent.astream_query(query, memory):
+            events.append((time.perf_counter() - start, event))
+        return events
+
+    return asyncio.run(scenario())
+
+
+def test_tool_progress_and_tokens_arrive_before_the_final_event(agent):
+    events = [event for _, event in _stream(agent, QUERY, SessionMemory(10))]
+    types = [event["type"] for event in events]
+
+    assert types.index("tool_start") < types.index("tool_end") < types.index("token")
+    assert types[-1] == "final" and types.count("final") == 1
+    tool_end = events[types.index("tool_end")]
+    assert tool_end["tool"] == "get_tour_price" and "display" in tool_end
+    final = events[-1]
+    streamed = "".join(event["content"] for event in events if event["type"] == "token")
+    assert final["success"] and streamed.strip() == final["response"].strip()
+
+
+def test_progress_is_sent_while_the_turn_is_still_running(tours):
+    # Dos llamadas al modelo de 0.2 s: la herramienta se anuncia tras la primera
+    agent = AgentBuilder.create_agent(ScriptedChatModel(think_time=0.2), max_execution_time=10)
+
+    timed = _stream(agent, QUERY, SessionMemory(10))
+
+    tool_start = next(at for at, event in timed if event["type"] == "tool_start")
+    finished, final = timed[-1]
+    assert final["type"] == "final"
+    assert tool_start < 0.3 <= finished
+    assert sum(event["type"] == "token" for _, event in timed) > 1
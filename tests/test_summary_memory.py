@@ -0,0 +1,45 @@
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.agents.summary_memory import (
+    SUMMARY_MESSAGE_ID,
+    Compaction,
+    ConversationSummarizer,
+    compaction_update,
+    summary_text
+)
+from src.llm.fake import ScriptedChatModel
+
+
+def test_console_summary_runs_in_background(agent):
+    agent.summarizer = ConversationSummarizer(ScriptedChatModel(think_time=0.5), threshold=2, keep_recent_turns=1)
+    memory = agent.memory
+
+    for i in range(2):
+        agent.process_query(f"gracias {i}")
+    started = time.perf_counter()
+    agent.process_query("gracias 2")
+    elapsed = time.perf_counter() - started
+
+    # El resumen (0.5 s) no demora el turno que lo dispara
+    assert elapsed < 0.4
+    assert memory.compaction is not None and not memory.compaction.done()
+    memory.compaction.result(timeout=5)
+
+    agent.process_query("¿Y el clima?")
+    summary = agent.get_memory_summary()
+    assert "gracias 0" in summary["summary"]
+    # Sin resumir serían 3 turnos simples y uno con herramienta: 10 mensajes
+    assert summary["total_messages"] < 10
+
+
+def test_stale_compaction_is_discarded():
+    messages = [HumanMessage(content="a", id="h1"), AIMessage(content="b", id="a1")]
+
+    # El hilo cambió mientras se redactaba el resumen (p. ej. sesión vaciada)
+    assert compaction_update(messages, Compaction(["h0", "a0"], "resumen")) is None
+
+    update = compaction_update(messages, Compaction(["h1", "a1"], "resumen"))
+    assert update[1].id == SUMMARY_MESSAGE_ID
+    assert summary_text(update[1:]) == "resumen"
@@ -0,0 +1,52 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.agents.token_budget import TokenCounter, trim_history
+
+
+def _turns(count, words=40):
+    messages = []
+    for i in range(count):
+        messages.append(HumanMessage(content=f"pregunta {i} " + "palabra " * words))
+        messages.append(AIMessage(content=f"respuesta {i} " + "palabra " * words))
+    return messages
+
+
+def test_counter_caches_repeated_messages():
+    counter = TokenCounter()
+    message = HumanMessage(content="¿Cuánto cuesta el tour a Pastoruri?")
+
+    first = counter([message])
+    assert counter([message]) == first
+    assert counter.get_stats()["hits"] >= 1
+
+
+def test_counter_includes_tool_calls():
+    counter = TokenCounter()
+    plain = AIMessage(content="")
+    with_call = AIMessage(
+        content="",
+        tool_calls=[{"name": "get_tour_price", "args": {"tour_name": "laguna 69"}, "id": "c1"}]
+    )
+
+    assert counter([with_call]) > counter([plain])
+
+
+def test_trim_keeps_recent_turns_within_budget():
+    counter = TokenCounter()
+    history = _turns(10)
+    current = HumanMessage(content="¿y el clima?")
+
+    trimmed = trim_history(history, current, counter, max_tokens=300)
+
+    assert trimmed[-1] is current
+    assert counter(trimmed) <= 300
+    assert isinstance(trimmed[0], HumanMessage)
+    # Los más recientes sobreviven
+    assert trimmed[-2] is history[-1]
+
+
+def test_trim_sends_current_message_even_over_budget():
+    counter = TokenCounter()
+    current = HumanMessage(content="palabra " * 500)
+
+    assert trim_history(_turns(3), current, counter, max_tokens=50) == [current]
@@ -0,0 +1,52 @@
+import pytest
+
+from src.handlers.tool_cache import cached_tool, get_tool_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    get_tool_cache().clear()
+    yield
+    get_tool_cache().clear()
+
+
+def test_results_are_cached_by_normalized_arguments():
+    calls = []
+
+    @cached_tool()
+    def lookup(name: str) -> str:
+        calls.append(name)
+        return name.upper()
+
+    assert lookup("Laguna 69") == "LAGUNA 69"
+    assert lookup("  laguna   69 ") == "LAGUNA 69"
+    assert len(calls) == 1
+
+
+def test_callers_cannot_mutate_the_cached_result():
+    @cached_tool()
+    def advice() -> dict:
+        return {"tips": ["hidratarse"], "altura": 3052}
+
+    first = advice()
+    first["tips"].append("modificado por la sesión 1")
+    second = advice()
+    second["altura"] = 0
+    second["tips"].clear()
+
+    assert advice() == {"tips": ["hidratarse"], "altura": 3052}
+
+
+def test_version_change_and_cache_if():
+    state = {"version": "v1", "calls": 0}
+
+    @cached_tool(version=lambda: state["version"], cache_if=lambda result: not result.startswith("Error"))
+    def price() -> str:
+        state["calls"] += 1
+        return "Error temporal" if state["calls"] == 1 else f"S/ {state['calls']}"
+
+    assert price() == "Error temporal"
+    assert price() == "S/ 2"
+    assert price() == "S/ 2"
+    state["version"] = "v2"
+    assert price() == "S/ 3"
@@ -0,0 +1,54 @@
+import pytest
+
+from src.handlers.rag_tools import get_tour_price
+from src.handlers.tool_output import TRUNCATION_NOTE, budgeted, configure_tool_output, fit_budget, key_values
+
+
+@pytest.fixture(autouse=True)
+def default_budgets():
+    configure_tool_output()
+    yield
+    configure_tool_output()
+
+
+def test_key_values_skips_empty_fields_and_joins_lists():
+    text = key_values([
+        ("tour", "Laguna 69"),
+        ("precio", "S/ 60"),
+        ("incluye", ["transporte", "", "guía"]),
+        ("nota", None),
+        ("horario", "salida\n  5:00 am"),
+    ])
+
+    assert text == "tour: Laguna 69\nprecio: S/ 60\nincluye: transporte; guía\nhorario: salida 5:00 am"
+
+
+def test_output_over_budget_keeps_whole_lines_and_notes_the_cut():
+    configure_tool_output(default_tokens=600, overrides={"long_tool": 40})
+    content = "\n".join(f"linea {i}: " + "dato " * 5 for i in range(30))
+
+    trimmed = fit_budget("long_tool", content)
+
+    assert trimmed.endswith(TRUNCATION_NOTE)
+    kept = trimmed.splitlines()[:-1]
+    assert 0 < len(kept) < 30 and all(line in content.splitlines() for line in kept)
+    # Otras herramientas usan el presupuesto por defecto
+    assert fit_budget("other_tool", content) == content
+
+
+def test_budget_applies_to_the_model_content_not_the_display_artifact():
+    configure_tool_output(default_tokens=10)
+    compact, display = budgeted("tool", ("a: 1\n" * 50, "ficha completa"))
+
+    assert compact.endswith(TRUNCATION_NOTE)
+    assert display == "ficha completa"
+
+
+def test_tour_price_sends_compact_fields_and_keeps_markdown_for_display(tours):
+    message = get_tour_price.invoke(
+        {"type": "tool_call", "id": "1", "name": "get_tour_price", "args": {"tour_name": "laguna 69"}}
+    )
+
+    assert "precio: S/" in message.content and "url: https://" in message.content
+    assert "<a href" not in message.content and "**" not in message.content
+    assert "<a href" in message.artifact and "**Precio**" in message.artifact
@@ -0,0 +1,60 @@
+import asyncio
+
+from src.agents.memory import SessionMemory
+from src.agents.tool_prefetch import PrefetchBatch, ToolPrefetcher
+from src.handlers.async_tools import as_async_tools
+from src.handlers.rag_tools import get_tour_price
+
+QUERY = "¿Cuánto cuesta el tour a Pastoruri y qué clima hace?"
+
+
+def _tools():
+    return as_async_tools([get_tour_price])
+
+
+def test_turn_selects_tools_once_and_prefetches_within_them(agent, monkeypatch):
+    agent.prefetcher = ToolPrefetcher(agent.tools)
+    selector = agent.tool_selector
+    log = []
+    select, start = selector.select, agent.prefetcher.start
+
+    def spy_select(query, record=False):
+        names = select(query, record)
+        log.append(("select", names))
+        return names
+
+    def spy_start(query, allowed=None):
+        log.append(("start", allowed))
+        return start(query, allowed)
+
+    monkeypatch.setattr(selector, "select", spy_select)
+    monkeypatch.setattr(agent.prefetcher, "start", spy_start)
+
+    result = asyncio.run(agent.aprocess_query(QUERY, SessionMemory(10)))
+
+    assert result["success"]
+    first_start = next(i for i, (kind, _) in enumerate(log) if kind == "start")
+    # La selección del turno se calcula una vez y el prefetch la reutiliza
+    assert [kind for kind, _ in log[:first_start]] == ["select"]
+    assert log[first_start][1] == log[0][1]
+    assert agent.prefetcher.get_stats()["hits"] == 2
+
+
+def test_claim_requires_the_whole_argument_to_match(tours):
+    async def scenario():
+        tool = _tools()[0]
+        batch = PrefetchBatch()
+        batch.add(tool, {"tour_name": "paron"})
+        claims = [
+            batch.claim("get_tour_price", {"tour_name": "laguna 69 y paron"}),
+            batch.claim("get_tour_price", {"tour_name": "tour a paron"}),
+            batch.claim("get_tour_price", {"tour_name": "Laguna Parón"}),
+        ]
+        await asyncio.gather(*batch.tasks.values())
+        batch.finish()
+        return claims
+
+    contained, prefixed, alias = asyncio.run(scenario())
+
+    assert contained is None and prefixed is None
+    assert alias is not None
@@ -0,0 +1,72 @@
+import asyncio
+
+from src.agents.memory import SessionMemory
+from src.utils.tracing import configure_tracing, get_trace_store, span, trace_request
+
+
+def setup_function():
+    configure_tracing(enabled=True, max_traces=10)
+
+
+def test_spans_nest_by_context():
+    with trace_request("req-1", endpoint="/chat") as trace:
+        with span("prepare_messages", "serialization"):
+            with span("inner", "io"):
+                pass
+        with span("router", "router"):
+            pass
+
+    by_name = {s.name: s for s in trace.spans}
+    root = by_name["turn"]
+    assert by_name["prepare_messages"].parent_id == root.id
+    assert by_name["inner"].parent_id == by_name["prepare_messages"].id
+    assert by_name["router"].parent_id == root.id
+    assert all(s.end is not None for s in trace.spans)
+    assert get_trace_store().get("req-1") is trace
+
+
+def test_span_without_trace_is_noop():
+    with span("suelto") as current:
+        assert current is None
+
+
+def test_chrome_export_has_one_track_per_task():
+    async def scenario():
+        with trace_request("req-2") as trace:
+            async def tool(name):
+                with span(name, "tool"):
+                    await asyncio.sleep(0.01)
+            await asyncio.gather(tool("a"), tool("b"))
+        return trace
+
+    trace = asyncio.run(scenario())
+    exported = trace.to_chrome()
+    spans = [e for e in exported["traceEvents"] if e["ph"] == "X"]
+    tracks = {e["tid"] for e in spans if e["name"] in ("a", "b")}
+    assert len(tracks) == 2
+    assert trace.summary()["time_by_category_ms"]["tool"] > 0
+
+
+def test_agent_steps_and_llm_calls_are_traced(agent):
+    async def scenario():
+        with trace_request("req-3") as trace:
+            result = await agent.aprocess_query("¿Cuánto cuesta el tour a Pastoruri?", SessionMemory())
+        return trace, result
+
+    trace, result = asyncio.run(scenario())
+    assert result["success"]
+    categories = {s.category for s in trace.spans}
+    assert {"llm", "tool", "step"} <= categories
+    llm_spans = [s for s in trace.spans if s.category == "llm"]
+    assert len(llm_spans) == result["usage"]["llm_calls"]
+    assert all(s.attrs.get("input_tokens") for s in llm_spans)
+
+
+def test_store_keeps_latest_traces():
+    configure_tracing(enabled=True, max_traces=2)
+    for i in range(3):
+        with trace_request(f"r{i}"):
+            pass
+
+    assert get_trace_store().get("r0") is None
+    assert [t["request_id"] for t in get_trace_store().recent()] == ["r2", "r1"]
@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import pytest
+
+from src.utils.ws_multiplexer import MultiplexedConnection, SlowConsumer
+
+
+class FakeWebSocket:
+    """WebSocket que registra los frames enviados (o no lee nunca)"""
+
+    def __init__(self, blocked: bool = False):
+        self.sent = []
+        self.blocked = blocked
+        self.closed_with = None
+
+    async def send_text(self, text):
+        if self.blocked:
+            await asyncio.Event().wait()
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+def test_frames_are_sent_in_order():
+    async def scenario():
+        ws = FakeWebSocket()
+        conn = MultiplexedConnection(ws)
+        conn.start()
+        await conn.send({"id": "a", "type": "token", "content": "ho"})
+        await conn.send({"id": "a", "type": "bot", "content": "hola"})
+        await asyncio.sleep(0.01)
+        conn.close()
+        return ws.sent
+
+    sent = asyncio.run(scenario())
+    assert [frame["type"] for frame in sent] == ["token", "bot"]
+
+
+def test_progress_frames_dropped_for_slow_consumer():
+    async def scenario():
+        conn = MultiplexedConnection(FakeWebSocket(blocked=True), send_queue_size=2, send_timeout=0.05)
+        conn.start()
+        await conn.send({"id": "a", "type": "tool_start", "tool": "get_tour_price"})
+        # El escritor toma el primer frame y queda bloqueado en el socket
+        await asyncio.sleep(0.01)
+        for i in range(5):
+            await conn.send({"id": "a", "type": "token", "content": str(i)})
+        with pytest.raises(SlowConsumer):
+            await conn.send({"id": "a", "type": "bot", "content": "final"})
+        dropped = conn.dropped
+        conn.close()
+        return dropped
+
+    # Dos frames caben en la cola; el resto se descarta
+    assert asyncio.run(scenario()) == 3
+
+
+def test_inflight_limit_and_cancel():
+    async def scenario():
+        conn = MultiplexedConnection(FakeWebSocket(), max_inflight=1)
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(10)
+
+        assert conn.submit("a", work())
+        assert not conn.submit("b", work())
+        await started.wait()
+        assert conn.cancel("a")
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return conn.inflight
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_close_cancels_all_requests():
+    async def scenario():
+        conn = MultiplexedConnection(FakeWebSocket(), max_inflight=4)
+        conn.start()
+        for request_id in ("a", "b", "c"):
+            conn.submit(request_id, asyncio.sleep(10))
+        await asyncio.sleep(0)
+        return conn.close()
+
+    assert asyncio.run(scenario()) == 3